@@ -1,34 +1,31 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func, extract, desc
-from models import Transaction
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import UserSpendingStats
 from schemas import CategorySpending, MonthlySpending, SpendingAnalytics
-from typing import List
+from spending_stats import get_user_stats, get_category_rollup, get_monthly_rollup, mean_amount
+from typing import Any, List, Optional, Tuple
+from collections import OrderedDict
 from datetime import datetime
+import os
+import threading
+import time
+
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "10000"))
+# How long a worker trusts its in-memory view of a user's transaction version;
+# bounds staleness for transactions created through other workers
+ANALYTICS_VERSION_TTL_SECONDS = int(os.getenv("ANALYTICS_VERSION_TTL_SECONDS", "30"))
 
 class AnalyticsService:
-    
+
     @staticmethod
-    def get_spending_analytics(db: Session, user_id: int) -> SpendingAnalytics:
+    async def get_spending_analytics(db: AsyncSession, user_id: int) -> SpendingAnalytics:
         """Get comprehensive spending analytics for a user"""
         
-        # Total spent and transaction count
-        total_result = db.query(
-            func.sum(Transaction.amount).label('total'),
-            func.count(Transaction.id).label('count')
-        ).filter(Transaction.user_id == user_id).first()
-        
-        total_spent = float(total_result.total) if total_result.total else 0.0
-        total_transactions = total_result.count or 0
-        
-        # Category breakdown
-        category_data = db.query(
-            Transaction.category,
-            func.sum(Transaction.amount).label('total'),
-            func.count(Transaction.id).label('count')
-        ).filter(
-            Transaction.user_id == user_id,
-            Transaction.category.isnot(None)
-        ).group_by(Transaction.category).all()
+        # Total spent and transaction count (running aggregates, O(1))
+        total_transactions, total_spent, _ = await get_user_stats(db, user_id)
+        
+        # Category breakdown (rollup table)
+        category_data = await get_category_rollup(db, user_id)
         
         category_breakdown = [
             CategorySpending(
@@ -45,15 +42,8 @@ class AnalyticsService:
                 CategorySpending(category="Others", total=0.0, count=0)
             ]
         
-        # Monthly breakdown (last 12 months)
-        monthly_data = db.query(
-            extract('year', Transaction.timestamp).label('year'),
-            extract('month', Transaction.timestamp).label('month'),
-            func.sum(Transaction.amount).label('total'),
-            func.count(Transaction.id).label('count')
-        ).filter(
-            Transaction.user_id == user_id
-        ).group_by('year', 'month').order_by(desc('year'), desc('month')).limit(12).all()
+        # Monthly breakdown (last 12 months, rollup table)
+        monthly_data = await get_monthly_rollup(db, user_id, 12)
         
         monthly_breakdown = []
         for year, month, total, count in monthly_data:
@@ -70,7 +60,7 @@ class AnalyticsService:
         monthly_breakdown.reverse()
         
         # Calculate average transaction amount
-        avg_amount = total_spent / total_transactions if total_transactions > 0 else 0.0
+        avg_amount = mean_amount(total_transactions, total_spent)
         
         return SpendingAnalytics(
             total_spent=total_spent,
@@ -81,18 +71,12 @@ class AnalyticsService:
         )
     
     @staticmethod
-    def get_category_chart_data(db: Session, user_id: int) -> dict:
+    async def get_category_chart_data(db: AsyncSession, user_id: int) -> dict:
         """Get data formatted for pie chart visualization"""
-        category_data = db.query(
-            Transaction.category,
-            func.sum(Transaction.amount).label('total')
-        ).filter(
-            Transaction.user_id == user_id,
-            Transaction.category.isnot(None)
-        ).group_by(Transaction.category).all()
+        category_data = await get_category_rollup(db, user_id)
         
-        labels = [cat or "Others" for cat, _ in category_data]
-        values = [float(total) for _, total in category_data]
+        labels = [cat or "Others" for cat, _, _ in category_data]
+        values = [float(total) for _, total, _ in category_data]
         
         return {
             "labels": labels,
@@ -100,21 +84,15 @@ class AnalyticsService:
         }
     
     @staticmethod
-    def get_monthly_chart_data(db: Session, user_id: int, months: int = 6) -> dict:
+    async def get_monthly_chart_data(db: AsyncSession, user_id: int, months: int = 6) -> dict:
         """Get data formatted for bar chart visualization"""
-        monthly_data = db.query(
-            extract('year', Transaction.timestamp).label('year'),
-            extract('month', Transaction.timestamp).label('month'),
-            func.sum(Transaction.amount).label('total')
-        ).filter(
-            Transaction.user_id == user_id
-        ).group_by('year', 'month').order_by(desc('year'), desc('month')).limit(months).all()
+        monthly_data = await get_monthly_rollup(db, user_id, months)
         
         labels = []
         values = []
         
         # Iterate in reverse to populate chart from left (older) to right (newer)
-        for year, month, total in reversed(monthly_data):
+        for year, month, total, _ in reversed(monthly_data):
             month_name = datetime(int(year), int(month), 1).strftime('%b %Y')
             labels.append(month_name)
             values.append(float(total))
@@ -125,4 +103,90 @@ class AnalyticsService:
         }
 
 
+class AnalyticsCache:
+    """
+    Per-user analytics results keyed by the user's transaction version
+    (transaction count, last update of the user's spending aggregates), read
+    from user_spending_stats with a primary-key lookup. create_transaction
+    drops the worker's copy of the version, so the next request sees the new
+    one and every cached result and ETag for that user is invalidated.
+    """
+    
+    def __init__(self, maxsize: int = ANALYTICS_CACHE_SIZE, version_ttl: int = ANALYTICS_VERSION_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.version_ttl = version_ttl
+        self.hits = 0
+        self.misses = 0
+        # user_id -> (version, expires_at), LRU-bounded like the results
+        self._versions: "OrderedDict[int, Tuple[Tuple[int, int], float]]" = OrderedDict()
+        self._results: "OrderedDict[Tuple[int, str], Tuple[Tuple[int, int], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    async def get_version(self, db: AsyncSession, user_id: int) -> Tuple[int, int]:
+        """(transaction count, last update in microseconds) for the user; in memory unless expired"""
+        with self._lock:
+            entry = self._versions.get(user_id)
+            if entry is not None and time.monotonic() < entry[1]:
+                self._versions.move_to_end(user_id)
+                return entry[0]
+        
+        result = await db.execute(
+            select(UserSpendingStats.transaction_count, UserSpendingStats.updated_at).where(
+                UserSpendingStats.user_id == user_id
+            )
+        )
+        row = result.first()
+        if row is None:
+            version = (0, 0)
+        else:
+            count, updated_at = row
+            version = (count, int(updated_at.timestamp() * 1_000_000) if updated_at else 0)
+        
+        with self._lock:
+            self._versions[user_id] = (version, time.monotonic() + self.version_ttl)
+            self._versions.move_to_end(user_id)
+            while len(self._versions) > self.maxsize:
+                self._versions.popitem(last=False)
+        return version
+    
+    def etag(self, user_id: int, key: str, version: Tuple[int, int]) -> str:
+        return f'W/"{user_id}-{version[0]}-{version[1]}-{key}"'
+    
+    def get(self, user_id: int, key: str, version: Tuple[int, int]) -> Optional[Any]:
+        with self._lock:
+            entry = self._results.get((user_id, key))
+            if entry is not None and entry[0] == version:
+                self._results.move_to_end((user_id, key))
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+    
+    def put(self, user_id: int, key: str, version: Tuple[int, int], value: Any) -> None:
+        with self._lock:
+            self._results[(user_id, key)] = (version, value)
+            self._results.move_to_end((user_id, key))
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+    
+    def record_transaction(self, user_id: int) -> None:
+        """Forget the user's version after a committed insert; the next request reloads it"""
+        self.invalidate_user(user_id)
+    
+    def invalidate_user(self, user_id: int) -> None:
+        """Forget the user's version so the next request reloads it"""
+        with self._lock:
+            self._versions.pop(user_id, None)
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._results),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
 analytics_service = AnalyticsService()
+analytics_cache = AnalyticsCache()
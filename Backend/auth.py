@@ -1,14 +1,26 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+import asyncio
+import threading
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
 from dotenv import load_dotenv
 
-from database import get_db
+from database import get_db, write_lock
+from metrics import (
+    password_hash_duration,
+    password_hash_in_progress,
+    password_hash_queue_depth,
+    password_hash_rejected
+)
 from models import User
 from schemas import TokenData
 
@@ -18,7 +30,23 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production"
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Resolved-user cache for get_current_user
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+# When enabled, login signs the user id and UPI ID into the token so the
+# transaction hot path (get_current_principal) needs no user lookup at all
+TOKEN_EMBED_PRINCIPAL = os.getenv("TOKEN_EMBED_PRINCIPAL", "False").lower() == "true"
+# Shared secret for operational endpoints; they are disabled when unset
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+
+# bcrypt cost factor; hashes with a different cost are upgraded on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Password hashing gets its own bounded pool instead of Starlette's shared threadpool;
+# calls beyond workers + queue limit are rejected with 503 right away
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 
@@ -45,21 +73,144 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
-    """Authenticate a user by username and password"""
-    user = db.query(User).filter(User.username == username).first()
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated bounded thread pool with admission control.
+    At most `workers` calls run and `queue_limit` wait; further calls fail
+    fast with 503 so a login storm cannot tie up the rest of the server.
+    """
+    
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_limit: int = PASSWORD_HASH_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        # Only touched on the event loop thread
+        self._pending = 0
+    
+    def _update_gauges(self) -> None:
+        password_hash_in_progress.set(min(self._pending, self.workers))
+        password_hash_queue_depth.set(max(self._pending - self.workers, 0))
+    
+    @staticmethod
+    def _timed(operation: str, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            password_hash_duration.observe(time.perf_counter() - started, operation)
+    
+    async def _run(self, operation: str, fn, *args):
+        if self._pending >= self.workers + self.queue_limit:
+            password_hash_rejected.inc(operation)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        
+        self._pending += 1
+        self._update_gauges()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._timed, operation, fn, *args
+            )
+        finally:
+            self._pending -= 1
+            self._update_gauges()
+    
+    async def hash(self, password: str) -> str:
+        """Hash a password with the configured bcrypt cost"""
+        return await self._run("hash", pwd_context.hash, password)
+    
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Verify a password; also return a new hash if the stored one uses an outdated cost"""
+        return await self._run("verify", pwd_context.verify_and_update, password, hashed_password)
+
+
+password_hasher = PasswordHasher()
+
+
+async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
+    """Authenticate a user by username and password, upgrading an outdated hash"""
+    result = await db.execute(select(User).where(User.username == username))
+    user = result.scalars().first()
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    
+    valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not valid:
         return None
+    if new_hash is not None:
+        # Transparent rehash after a BCRYPT_ROUNDS change
+        user.hashed_password = new_hash
+        async with write_lock:
+            await db.commit()
     return user
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get the current authenticated user from JWT token"""
+class UserCache:
+    """Bounded LRU cache of resolved users with a per-entry TTL"""
+    
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: int = USER_CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, username: str) -> Optional[User]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and time.monotonic() < entry[1]:
+                self._entries.move_to_end(username)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[username]
+            self.misses += 1
+            return None
+    
+    def put(self, username: str, user: User) -> None:
+        with self._lock:
+            self._entries[username] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def invalidate_user_id(self, user_id: int) -> None:
+        """Drop every entry for a user id (covers username changes)"""
+        with self._lock:
+            for username in [name for name, (user, _) in self._entries.items() if user.id == user_id]:
+                del self._entries[username]
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    """Evict a user from the cache whenever their record changes through the ORM"""
+    user_cache.invalidate_user_id(target.id)
+
+
+def _decode_token(token: str) -> dict:
+    """Decode a JWT and return its payload, or raise 401"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -71,12 +222,61 @@ async def get_current_user(
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-        token_data = TokenData(username=username)
+        TokenData(username=username)
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == token_data.username).first()
+    return payload
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """Get the current authenticated user from JWT token"""
+    username = _decode_token(token)["sub"]
+    
+    user = user_cache.get(username)
+    if user is not None:
+        return user
+    
+    result = await db.execute(select(User).where(User.username == username))
+    user = result.scalars().first()
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    # Detach so the cached instance is not tied to this request's session
+    db.expunge(user)
+    user_cache.put(username, user)
     
     return user
+
+
+async def get_current_principal(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """
+    Get the id, username and UPI ID of the caller. With TOKEN_EMBED_PRINCIPAL
+    these come straight from the signed token claims (no lookup); otherwise
+    this is get_current_user. Only id, username and upi_id are guaranteed.
+    """
+    if TOKEN_EMBED_PRINCIPAL:
+        payload = _decode_token(token)
+        if "uid" in payload and "upi" in payload:
+            return User(id=payload["uid"], username=payload["sub"], upi_id=payload["upi"])
+    
+    return await get_current_user(token, db)
+
+
+def require_admin(x_admin_key: Optional[str] = Header(None)) -> None:
+    """Guard operational endpoints with the ADMIN_API_KEY shared secret"""
+    if not ADMIN_API_KEY or x_admin_key != ADMIN_API_KEY:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
@@ -0,0 +1,245 @@
+"""
+Throughput and tail-latency benchmark for the API, run in-process.
+
+The FastAPI app is driven through httpx's ASGI transport, so there is no
+server or network in the way. A fresh database is seeded with users, fraud
+reports and transaction history, then each scenario runs with N concurrent
+clients for a fixed number of requests:
+
+- predict:      POST /api/predict
+- create:       POST /api/create
+- analytics:    GET /api/analytics/spending, /charts/category, /charts/monthly
+- top-reported: GET /api/fraud-reports/fraud-reports/top-reported/
+
+Usage:
+    python benchmark_api.py [--concurrency 16] [--requests 2000] [--scenarios predict,create]
+                            [--output results.json] [--baseline old.json] [--threshold 0.15]
+
+Requests per second and p50/p95/p99 latency are printed and saved as JSON with
+the git commit. With --baseline, a scenario whose RPS drops or whose p95/p99
+grows by more than --threshold is reported as a regression (exit code 1).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+CATEGORIES = ["Food", "Education", "Shopping", "Others"]
+REPORTED_UPIS = [f"reported{i}@paytm" for i in range(10)]
+
+
+def _payee(rng: random.Random) -> str:
+    # Mostly a small set of regular payees, sometimes a reported one
+    if rng.random() < 0.1:
+        return rng.choice(REPORTED_UPIS)
+    return f"payee{min(int(rng.expovariate(0.2)), 99)}@paytm"
+
+
+def _transaction(rng: random.Random) -> dict:
+    return {
+        "receiver_upi": _payee(rng),
+        "receiver_name": "Payee",
+        "amount": round(rng.choice([rng.uniform(50, 1500), rng.uniform(1500, 20000)]), 2),
+        "category": rng.choice(CATEGORIES)
+    }
+
+
+async def predict(client, headers, rng):
+    body = _transaction(rng)
+    body["is_night"] = rng.random() < 0.2
+    return await client.post("/api/predict", headers=headers, json=body)
+
+
+async def create(client, headers, rng):
+    return await client.post("/api/create", headers=headers, json=_transaction(rng))
+
+
+async def analytics(client, headers, rng):
+    path = rng.choice(["/api/analytics/spending", "/api/analytics/charts/category", "/api/analytics/charts/monthly"])
+    return await client.get(path, headers=headers)
+
+
+async def top_reported(client, headers, rng):
+    return await client.get("/api/fraud-reports/fraud-reports/top-reported/", headers=headers)
+
+
+SCENARIOS = {
+    "predict": predict,
+    "create": create,
+    "analytics": analytics,
+    "top-reported": top_reported,
+}
+
+
+async def seed(client, users: int, history: int, rng: random.Random) -> list:
+    """Register users, file reports and create some history. Returns auth headers per user."""
+    all_headers = []
+    for i in range(users):
+        username = f"bench{i}"
+        response = await client.post("/api/auth/register", json={
+            "username": username, "email": f"{username}@example.com", "password": "benchpass123",
+            "upi_id": f"{username}@paytm", "phone": "+919876543210"
+        })
+        if response.status_code != 201:
+            raise RuntimeError(f"Seeding failed: {response.text}")
+        response = await client.post("/api/auth/login", json={"username": username, "password": "benchpass123"})
+        all_headers.append({"Authorization": f"Bearer {response.json()['access_token']}"})
+    
+    for headers in all_headers:
+        for upi in rng.sample(REPORTED_UPIS, 3):
+            await client.post("/api/fraud-reports/fraud-reports/", headers=headers, json={
+                "reported_upi": upi, "reason": "Benchmark fraud report"
+            })
+        for _ in range(history):
+            await client.post("/api/create", headers=headers, json=_transaction(rng))
+    
+    return all_headers
+
+
+async def run_scenario(client, scenario, all_headers, concurrency: int, requests: int, seed_value: int) -> dict:
+    """Run `requests` calls with `concurrency` clients and summarize latency"""
+    latencies = []
+    errors = 0
+    remaining = requests
+    
+    async def worker(worker_id: int):
+        nonlocal remaining, errors
+        rng = random.Random(seed_value * 1000 + worker_id)
+        while remaining > 0:
+            remaining -= 1
+            headers = rng.choice(all_headers)
+            started = time.perf_counter()
+            response = await scenario(client, headers, rng)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+    }
+
+
+async def run_benchmark(args) -> dict:
+    # Imported here so DATABASE_URL is set before the engines are created
+    import httpx
+    from main import app
+    
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            rng = random.Random(args.seed)
+            print(f"Seeding {args.users} users with {args.history} transactions each...")
+            all_headers = await seed(client, args.users, args.history, rng)
+            
+            results = {}
+            for name in args.scenarios:
+                # Warm-up pass so caches and connection pools are populated
+                await run_scenario(client, SCENARIOS[name], all_headers, args.concurrency, args.concurrency * 2, args.seed)
+                results[name] = await run_scenario(
+                    client, SCENARIOS[name], all_headers, args.concurrency, args.requests, args.seed
+                )
+                r = results[name]
+                print(
+                    f"✓ {name:<13} {r['rps']:>9,.1f} req/s   p50 {r['p50_ms']:>8.2f} ms   "
+                    f"p95 {r['p95_ms']:>8.2f} ms   p99 {r['p99_ms']:>8.2f} ms   errors {r['errors']}"
+                )
+            return results
+    finally:
+        await app.router.shutdown()
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def find_regressions(results: dict, baseline: dict, threshold: float) -> list:
+    """Scenarios whose RPS fell or whose p95/p99 rose by more than threshold"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        if current["rps"] < previous["rps"] * (1 - threshold):
+            regressions.append(f"{name}: rps {previous['rps']} -> {current['rps']}")
+        for metric in ("p95_ms", "p99_ms"):
+            if current[metric] > previous[metric] * (1 + threshold):
+                regressions.append(f"{name}: {metric} {previous[metric]} -> {current[metric]}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-process API throughput and latency benchmark")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients per scenario")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated: " + ", ".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=10, help="Users to seed")
+    parser.add_argument("--history", type=int, default=50, help="Transactions to seed per user")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for request payloads")
+    parser.add_argument("--database-url", help="Database to benchmark against (default: a temporary SQLite file)")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to save the results")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Relative change counted as a regression")
+    args = parser.parse_args()
+    
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        print(f"✗ Unknown scenario(s): {', '.join(unknown)}")
+        sys.exit(1)
+    
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        temp_dir = tempfile.mkdtemp(prefix="benchmark_api_")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(temp_dir, 'benchmark.db')}"
+    
+    results = asyncio.run(run_benchmark(args))
+    
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "settings": {
+            "concurrency": args.concurrency, "requests": args.requests, "users": args.users,
+            "history": args.history, "seed": args.seed,
+            "database_profile": os.getenv("DATABASE_PROFILE", "default")
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Results saved to {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            for regression in regressions:
+                print(f"✗ Regression vs {baseline.get('commit', args.baseline)}: {regression}")
+            sys.exit(1)
+        print(f"✓ No regressions beyond {args.threshold:.0%} vs {baseline.get('commit', args.baseline)}")
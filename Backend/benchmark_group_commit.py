@@ -0,0 +1,110 @@
+"""
+Sustained /api/create throughput with and without group commit.
+
+Seeds a fresh database like benchmark_api.py, then runs the create scenario
+twice against the same app: first with one commit per request (the default
+path), then with GroupCommitWriter batching concurrent commits. Inserts per
+second, p50/p95/p99 latency and the mean number of requests per commit are
+printed for both runs, followed by the speedup.
+
+Usage:
+    python benchmark_group_commit.py [--concurrency 64] [--requests 3000]
+                                     [--interval-ms 5] [--output group_commit_results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime
+
+from benchmark_api import create, git_commit, run_scenario, seed
+
+
+async def run_benchmark(args) -> dict:
+    # Imported here so DATABASE_URL is set before the engines are created
+    import httpx
+    from main import app
+    from group_commit import group_commit_writer
+    from metrics import group_commit_batch_size
+    
+    group_commit_writer.enabled = False
+    group_commit_writer.interval = args.interval_ms / 1000
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            rng = random.Random(args.seed)
+            print(f"Seeding {args.users} users with {args.history} transactions each...")
+            all_headers = await seed(client, args.users, args.history, rng)
+            
+            results = {}
+            for name, enabled in (("per-request", False), ("group-commit", True)):
+                group_commit_writer.enabled = enabled
+                group_commit_writer.start()
+                try:
+                    # Warm-up pass so caches and connection pools are populated
+                    await run_scenario(client, create, all_headers, args.concurrency, args.concurrency * 2, args.seed)
+                    # One observation per commit, valued at its batch size
+                    commits_before, requests_before = group_commit_batch_size.totals()
+                    results[name] = await run_scenario(
+                        client, create, all_headers, args.concurrency, args.requests, args.seed
+                    )
+                    commits_after, requests_after = group_commit_batch_size.totals()
+                finally:
+                    await group_commit_writer.stop()
+                
+                r = results[name]
+                commits = commits_after - commits_before
+                r["mean_batch_size"] = round((requests_after - requests_before) / commits, 1) if commits else 1.0
+                print(
+                    f"✓ {name:<13} {r['rps']:>9,.1f} inserts/s   p50 {r['p50_ms']:>8.2f} ms   "
+                    f"p95 {r['p95_ms']:>8.2f} ms   p99 {r['p99_ms']:>8.2f} ms   "
+                    f"batch {r['mean_batch_size']:>5.1f}   errors {r['errors']}"
+                )
+            return results
+    finally:
+        await app.router.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare /api/create throughput with and without group commit")
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=3000, help="Requests per run")
+    parser.add_argument("--interval-ms", type=float, default=5, help="Group commit window")
+    parser.add_argument("--users", type=int, default=10, help="Users to seed")
+    parser.add_argument("--history", type=int, default=50, help="Transactions to seed per user")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for request payloads")
+    parser.add_argument("--database-url", help="Database to benchmark against (default: a temporary SQLite file)")
+    parser.add_argument("--output", default="group_commit_results.json", help="Where to save the results")
+    args = parser.parse_args()
+    
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        temp_dir = tempfile.mkdtemp(prefix="benchmark_group_commit_")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(temp_dir, 'benchmark.db')}"
+    
+    results = asyncio.run(run_benchmark(args))
+    speedup = results["group-commit"]["rps"] / results["per-request"]["rps"]
+    print(f"✓ Group commit: {speedup:.2f}x inserts/s")
+    
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "settings": {
+            "concurrency": args.concurrency, "requests": args.requests, "interval_ms": args.interval_ms,
+            "users": args.users, "history": args.history, "seed": args.seed,
+            "database_profile": os.getenv("DATABASE_PROFILE", "default")
+        },
+        "results": results,
+        "speedup": round(speedup, 2),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Results saved to {args.output}")
+    if results["group-commit"]["errors"]:
+        print(f"✗ {results['group-commit']['errors']} group-commit requests failed")
+        sys.exit(1)
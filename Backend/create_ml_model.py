@@ -8,6 +8,8 @@ from sklearn.linear_model import LogisticRegression
 from sklearn.model_selection import train_test_split
 import joblib
 
+from model_compiler import compile_model_file
+
 def create_sample_fraud_model():
     """
     Create a sample fraud detection model using Logistic Regression
@@ -70,6 +72,10 @@ def create_sample_fraud_model():
     print(f"\nTest prediction for [amount=6000, is_night=1]:")
     print(f"Fraud probability: {prob:.2%}")
     print(f"Risk score: {int(prob * 100)}/100")
+    
+    # Export the sklearn-free scorer used by FraudDetectionService
+    print()
+    compile_model_file('fraud_model.pkl')
 
 if __name__ == "__main__":
     create_sample_fraud_model()
@@ -1,5 +1,10 @@
-from sqlalchemy import create_engine
+import asyncio
+import weakref
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from models import Base
 import os
 from dotenv import load_dotenv
@@ -8,19 +13,160 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./upi_fraud.db")
 
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+# Async drivers used by the request handlers, keyed by the sync URL scheme
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def to_async_url(url: str) -> str:
+    """Map a sync database URL to the same database through its async driver"""
+    scheme, sep, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    if dialect not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for database URL scheme '{scheme}'")
+    return f"{ASYNC_DRIVERS[dialect]}{sep}{rest}"
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+
+# --- Engine profiles ---
+# default: driver defaults; SQLite gets WAL and a busy timeout (SQLITE_BASE_PRAGMAS)
+# sqlite:  tuned pragmas and pooled connections, for single-host SQLite deployments
+# server:  explicit connection pool for PostgreSQL / MySQL
+DATABASE_PROFILE = os.getenv("DATABASE_PROFILE", "default")
+
+# Applied to every SQLite connection, whatever the profile: readers don't block
+# the writer, and a writer waits for the lock instead of failing immediately
+SQLITE_BASE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+}
+
+SQLITE_PRAGMAS = {
+    **SQLITE_BASE_PRAGMAS,
+    "synchronous": "NORMAL",  # WAL stays consistent on power loss; only the last commits may roll back
+    "cache_size": os.getenv("SQLITE_CACHE_KB", "-65536"),  # negative = KiB (64 MiB)
+    "mmap_size": os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)),
+    "temp_store": "MEMORY",
+}
+
+SERVER_POOL_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": True,
+}
+
+
+def engine_options(url: str, profile: str = DATABASE_PROFILE) -> dict:
+    """create_engine / create_async_engine keyword arguments for a profile"""
+    if profile not in ("default", "sqlite", "server"):
+        raise ValueError(f"Unknown DATABASE_PROFILE '{profile}'")
+    is_sqlite = url.startswith("sqlite")
+    if profile == "sqlite" and not is_sqlite:
+        raise ValueError("DATABASE_PROFILE=sqlite requires a sqlite:// DATABASE_URL")
+    
+    options = {}
+    if is_sqlite and "aiosqlite" not in url:
+        options["connect_args"] = {"check_same_thread": False}
+    if profile == "sqlite" and "aiosqlite" in url:
+        # aiosqlite defaults to a new connection per session; reuse them instead
+        options["poolclass"] = AsyncAdaptedQueuePool
+    if profile == "server":
+        options.update(SERVER_POOL_OPTIONS)
+    return options
+
+
+def apply_profile(engine, profile: str = DATABASE_PROFILE) -> None:
+    """Set the SQLite pragmas for a profile on every new connection of a (sync) engine"""
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = SQLITE_PRAGMAS if profile == "sqlite" else SQLITE_BASE_PRAGMAS
+    
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+class WriteLock:
+    """
+    Serializes write transactions within this process on SQLite. SQLite allows
+    one writer at a time, and overlapping multi-statement write transactions
+    can fail with "database is locked" even with a busy timeout. On other
+    databases it is a no-op.
+    """
+    
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        # One asyncio.Lock per event loop (tests may run several loops)
+        self._locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+    
+    def _lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        lock = self._locks.get(loop)
+        if lock is None:
+            lock = self._locks[loop] = asyncio.Lock()
+        return lock
+    
+    async def __aenter__(self) -> None:
+        if self.enabled:
+            await self._lock().acquire()
+    
+    async def __aexit__(self, *exc_info) -> None:
+        if self.enabled:
+            self._lock().release()
+
+
+def pool_stats(engine) -> dict:
+    """Connection pool usage of an engine (sync or async)"""
+    pool = getattr(engine, "sync_engine", engine).pool
+    stats = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    return stats
+
+
+# Sync engine: table creation, startup backfills and command-line scripts
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+apply_profile(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine: request handlers, so queries never block the event loop
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL))
+apply_profile(async_engine.sync_engine)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+# Hold around every async write transaction (add/update ... commit)
+write_lock = WriteLock(enabled=async_engine.dialect.name == "sqlite")
+
 def init_db():
     """Initialize database tables"""
     Base.metadata.create_all(bind=engine)
+    # create_all skips indexes on tables that already exist; add any new ones
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+async def get_db():
+    """Dependency for getting an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
 
-def get_db():
-    """Dependency for getting database session"""
+def get_sync_db():
+    """Dependency for getting a sync database session (sync handlers and scripts)"""
     db = SessionLocal()
     try:
         yield db
@@ -1,60 +1,193 @@
+import asyncio
 import joblib
 import os
-from typing import List, Tuple
+import time
+from typing import Dict, List, Optional, Sequence, Set, Tuple
 from datetime import datetime
-from sqlalchemy.orm import Session
-from models import Transaction, FraudReport
+from sqlalchemy.ext.asyncio import AsyncSession
+from known_receivers import known_receiver_index
+from metrics import model_inference_duration, rule_evaluation_duration
+from model_compiler import compile_model, compiled_model_path, file_sha256, from_artifact, load_compiled_model
+from receiver_stats import ReceiverSnapshot, receiver_stats_store
+from report_index import report_index
+from spending_stats import get_user_stats, get_users_stats, mean_amount
+from velocity import VelocitySnapshot, velocity_store
+import model_registry
 import numpy as np
 
+
+class LoadedModel:
+    """One ready-to-score model version. Never mutated after loading, so it can be swapped atomically."""
+    
+    def __init__(self, version: str, model=None, compiled=None):
+        self.version = version
+        self.model = model
+        self.compiled = compiled
+    
+    @property
+    def has_model(self) -> bool:
+        return self.compiled is not None or self.model is not None
+    
+    def predict_one(self, amount: float, is_night: int) -> int:
+        """ML score (0-100) for a single transaction"""
+        if self.compiled is not None:
+            return int(self.compiled.predict_proba_one(float(amount), float(is_night)) * 100)
+        return int(self.predict_many([amount], [is_night])[0])
+    
+    def predict_many(self, amounts: Sequence[float], is_nights: Sequence[int]) -> np.ndarray:
+        """
+        Run the ML model once over a feature matrix of [amount, is_night] rows
+        
+        Returns:
+            Array of ML scores (0-100), one per row. Zeros if no model is loaded.
+        """
+        n = len(amounts)
+        if not self.has_model:
+            return np.zeros(n, dtype=int)
+        
+        try:
+            # Input features: [amount, is_night]
+            features = np.column_stack([
+                np.asarray(amounts, dtype=float),
+                np.asarray(is_nights, dtype=float)
+            ])
+            if self.compiled is not None:
+                probs = self.compiled.predict_proba(features)
+            else:
+                probs = self.model.predict_proba(features)[:, 1]
+            return (probs * 100).astype(int)
+        except Exception as e:
+            print(f"⚠ ML prediction error: {e}")
+            return np.zeros(n, dtype=int)
+    
+    def warm_up(self) -> None:
+        """Run test predictions so a broken model fails before it is swapped in"""
+        single = [self.predict_one(amount, is_night) for amount in (100.0, 5000.0) for is_night in (0, 1)]
+        batch = self.predict_many([100.0, 100.0, 5000.0, 5000.0], [0, 1, 0, 1])
+        if any(not 0 <= score <= 100 for score in single) or list(batch) != single:
+            raise ValueError(f"Model {self.version} failed warm-up predictions")
+
+
+def load_model_file(model_path: str, version: Optional[str] = None) -> LoadedModel:
+    """Load a model file, preferring its compiled scorer"""
+    if version is None:
+        # Named after the model file, or the compiled artifact when it is all there is
+        for path in (model_path, compiled_model_path(model_path)):
+            if os.path.exists(path):
+                version = f"{os.path.basename(path)}@{file_sha256(path)[:12]}"
+                break
+    
+    # A compiled artifact built from this exact model file needs no sklearn
+    compiled = load_compiled_model(model_path)
+    if compiled is not None:
+        print(f"✓ Compiled ML model loaded for {model_path}")
+        return LoadedModel(version, compiled=compiled)
+    
+    if not os.path.exists(model_path):
+        print(f"⚠ Warning: ML model not found at {model_path}")
+        return LoadedModel(version or "none")
+    
+    try:
+        model = joblib.load(model_path)
+        print(f"✓ ML model loaded from {model_path}")
+    except Exception as e:
+        print(f"⚠ Warning: Could not load ML model: {e}")
+        return LoadedModel("none")
+    
+    # Compile in memory when possible; otherwise keep using predict_proba
+    artifact = compile_model(model)
+    return LoadedModel(version, model=model, compiled=from_artifact(artifact) if artifact else None)
+
+
 class FraudDetectionService:
     def __init__(self, model_path: str = "fraud_model.pkl"):
         self.model_path = model_path
-        self.model = None
-        self._load_model()
+        self.active_model = self._load_model()
+        self._reload_lock = asyncio.Lock()
     
-    def _load_model(self):
-        """Load the ML model if it exists"""
-        if os.path.exists(self.model_path):
+    def _load_model(self) -> LoadedModel:
+        """Load the registry's active version, or model_path if there is no registry"""
+        version = model_registry.get_active_version()
+        if version is not None:
             try:
-                self.model = joblib.load(self.model_path)
-                print(f"✓ ML model loaded from {self.model_path}")
+                return self.load_version(version)
             except Exception as e:
-                print(f"⚠ Warning: Could not load ML model: {e}")
-                self.model = None
-        else:
-            print(f"⚠ Warning: ML model not found at {self.model_path}")
-            self.model = None
+                print(f"⚠ Warning: Could not load registry model {version}: {e}")
+        return load_model_file(self.model_path)
     
-    def calculate_risk_score(
+    @property
+    def model_version(self) -> str:
+        return self.active_model.version
+    
+    def load_version(self, version: str) -> LoadedModel:
+        """Load and warm up a registered model version without activating it"""
+        model_path = model_registry.model_file(version)
+        if not os.path.exists(model_path):
+            raise ValueError(f"Model version '{version}' is not registered")
+        loaded = load_model_file(model_path, version)
+        if not loaded.has_model:
+            raise ValueError(f"Model version '{version}' could not be loaded")
+        loaded.warm_up()
+        return loaded
+    
+    async def reload(self, version: Optional[str] = None) -> LoadedModel:
+        """
+        Load a registered version (default: the registry's ACTIVE one) in a worker
+        thread, warm it up, then swap it in. Scoring calls already holding the
+        previous LoadedModel finish with it; new calls see the new one.
+        """
+        async with self._reload_lock:
+            version = version or model_registry.get_active_version()
+            if version is None:
+                raise ValueError("No model version given and the registry has no ACTIVE version")
+            if version == self.model_version:
+                return self.active_model
+            
+            loaded = await asyncio.to_thread(self.load_version, version)
+            self.active_model = loaded
+            print(f"✓ Model version {version} activated")
+            return loaded
+    
+    async def watch_registry(self, interval: int):
+        """Background task: reload whenever the registry's ACTIVE version changes"""
+        while True:
+            await asyncio.sleep(interval)
+            version = model_registry.get_active_version()
+            if version is not None and version != self.model_version:
+                try:
+                    await self.reload(version)
+                except Exception as e:
+                    print(f"⚠ Model reload to {version} failed: {e}")
+    
+    def predict_ml_score(self, amount: float, is_night: int) -> int:
+        """ML score (0-100) for a single transaction with the active model"""
+        return self.active_model.predict_one(amount, is_night)
+    
+    def predict_ml_scores(self, amounts: Sequence[float], is_nights: Sequence[int]) -> np.ndarray:
+        """ML scores (0-100) for a feature matrix with the active model"""
+        return self.active_model.predict_many(amounts, is_nights)
+    
+    def score_features(
         self,
         amount: float,
         is_night: int,
-        receiver_upi: str,
+        report_count: int,
         is_new_receiver: int,
         user_avg_amount: float,
-        db: Session
+        ml_score: int,
+        velocity: Optional[VelocitySnapshot] = None,
+        receiver_stats: Optional[ReceiverSnapshot] = None
     ) -> Tuple[int, List[str]]:
         """
-        Calculate fraud risk score and return reasons
+        Apply the rule set to precomputed features and combine with the ML score.
+        `velocity` is the user's activity and `receiver_stats` the receiver's
+        inflow before this transaction (the matching rules are skipped when None).
         
         Returns:
             Tuple of (risk_score: int, reasons: List[str])
         """
         reasons = []
         
-        # Get ML probability if model is available
-        if self.model is not None:
-            try:
-                # Input features: [amount, is_night]
-                features = np.array([[amount, is_night]])
-                prob = self.model.predict_proba(features)[0][1]
-                ml_score = int(prob * 100)
-            except Exception as e:
-                print(f"⚠ ML prediction error: {e}")
-                ml_score = 0
-        else:
-            ml_score = 0
-        
         # Rule-based scoring (to complement ML or work standalone)
         rule_score = 0
         
@@ -72,10 +205,6 @@ class FraudDetectionService:
             reasons.append("Late-night transaction")
         
         # Rule 3: Check if receiver is reported
-        report_count = db.query(FraudReport).filter(
-            FraudReport.reported_upi == receiver_upi
-        ).count()
-        
         if report_count >= 5:
             rule_score += 35
             reasons.append("Reported UPI ID")
@@ -95,36 +224,191 @@ class FraudDetectionService:
                 rule_score += 20
                 reasons.append("Unusual amount compared to your average spending")
         
+        # Rule 6: Velocity (counts include this transaction)
+        if velocity is not None:
+            if velocity.count_1m + 1 >= 5:
+                rule_score += 30
+                reasons.append(f"{velocity.count_1m + 1} payments within a minute")
+            elif velocity.count_1h + 1 >= 20:
+                rule_score += 20
+                reasons.append("High payment frequency in the last hour")
+            
+            if velocity.receivers_1h + 1 >= 8:
+                rule_score += 20
+                reasons.append("Payments to many different receivers in the last hour")
+            
+            if user_avg_amount > 0 and velocity.amount_1h + amount > 10 * user_avg_amount:
+                rule_score += 15
+                reasons.append("Unusually high spending in the last hour")
+        
+        # Rule 7: Receiver fan-in (money-mule pattern) for recently seen receivers
+        if receiver_stats is not None and receiver_stats.recently_seen:
+            if receiver_stats.senders_1h >= 5:
+                rule_score += 25
+                reasons.append(f"Receiver was paid by {receiver_stats.senders_1h} different people in the last hour")
+            elif receiver_stats.senders_24h >= 15:
+                rule_score += 20
+                reasons.append(f"Receiver was paid by {receiver_stats.senders_24h} different people in the last 24 hours")
+            
+            if receiver_stats.inflow_24h + amount >= 100000:
+                rule_score += 15
+                reasons.append("High inflow to a new receiver account")
+        
         # Combine ML and rule-based scores
         # Use max to ensure rules are respected and not diluted by low ML scores
-        if self.model is not None:
-            final_score = max(ml_score, rule_score)
-        else:
-            final_score = rule_score
+        # (ml_score is 0 when no model is loaded)
+        final_score = max(int(ml_score), rule_score)
         
         # Cap at 100
         final_score = min(final_score, 100)
         
         return final_score, reasons
     
-    def check_is_new_receiver(self, db: Session, user_id: int, receiver_upi: str) -> int:
-        """Check if this is a new receiver for the user"""
-        existing = db.query(Transaction).filter(
-            Transaction.user_id == user_id,
-            Transaction.receiver_upi == receiver_upi
-        ).first()
+    def calculate_risk_score(
+        self,
+        amount: float,
+        is_night: int,
+        receiver_upi: str,
+        is_new_receiver: int,
+        user_avg_amount: float,
+        model: Optional[LoadedModel] = None,
+        velocity: Optional[VelocitySnapshot] = None,
+        receiver_stats: Optional[ReceiverSnapshot] = None,
+        ml_score: Optional[int] = None
+    ) -> Tuple[int, List[str]]:
+        """
+        Calculate fraud risk score and return reasons. Pass `model` (e.g.
+        fraud_detector.active_model captured by the caller) to pin the version,
+        `velocity` (from get_velocity) to apply the velocity rules and
+        `receiver_stats` (from get_receiver_stats) to apply the fan-in rules.
+        Pass `ml_score` when the model was already run (e.g. by model_batcher).
+        
+        Returns:
+            Tuple of (risk_score: int, reasons: List[str])
+        """
+        if ml_score is None:
+            model = model or self.active_model
+            started = time.perf_counter()
+            ml_score = model.predict_one(amount, is_night)
+            model_inference_duration.observe(time.perf_counter() - started, "single")
+        inferred = time.perf_counter()
+        report_count = self.get_report_count(receiver_upi)
         
-        return 0 if existing else 1
+        result = self.score_features(
+            amount=amount,
+            is_night=is_night,
+            report_count=report_count,
+            is_new_receiver=is_new_receiver,
+            user_avg_amount=user_avg_amount,
+            ml_score=ml_score,
+            velocity=velocity,
+            receiver_stats=receiver_stats
+        )
+        rule_evaluation_duration.observe(time.perf_counter() - inferred, "single")
+        return result
     
-    def get_user_avg_amount(self, db: Session, user_id: int) -> float:
-        """Get user's average transaction amount"""
-        from sqlalchemy import func
+    async def calculate_risk_scores_batch(
+        self,
+        db: AsyncSession,
+        user_ids: Sequence[int],
+        receiver_upis: Sequence[str],
+        amounts: Sequence[float],
+        is_nights: Sequence[int],
+        model: Optional[LoadedModel] = None,
+        at: Optional[datetime] = None
+    ) -> List[Tuple[int, List[str]]]:
+        """
+        Score N transactions with one model call and set-based feature queries.
+        Each row is scored against the current database state, exactly as
+        calculate_risk_score would score it on its own.
+        
+        Returns:
+            List of (risk_score: int, reasons: List[str]) in input order
+        """
+        if not amounts:
+            return []
+        
+        model = model or self.active_model
+        report_counts = self.get_report_counts(receiver_upis)
+        known_receivers = await self.get_known_receivers(db, user_ids, receiver_upis)
+        user_avgs = await self.get_user_avg_amounts(db, user_ids)
+        velocities = await self.get_velocities(db, user_ids, at)
+        receivers_stats = await self.get_receivers_stats(db, receiver_upis, at)
+        started = time.perf_counter()
+        ml_scores = model.predict_many(amounts, is_nights)
+        inferred = time.perf_counter()
+        model_inference_duration.observe(inferred - started, "batch")
         
-        avg = db.query(func.avg(Transaction.amount)).filter(
-            Transaction.user_id == user_id
-        ).scalar()
+        results = []
+        for i, (user_id, receiver_upi) in enumerate(zip(user_ids, receiver_upis)):
+            results.append(self.score_features(
+                amount=amounts[i],
+                is_night=is_nights[i],
+                report_count=report_counts.get(receiver_upi, 0),
+                is_new_receiver=0 if (user_id, receiver_upi) in known_receivers else 1,
+                user_avg_amount=user_avgs.get(user_id, 0.0),
+                ml_score=ml_scores[i],
+                velocity=velocities[user_id],
+                receiver_stats=receivers_stats[receiver_upi]
+            ))
+        rule_evaluation_duration.observe(time.perf_counter() - inferred, "batch")
         
-        return float(avg) if avg else 0.0
+        return results
+    
+    def get_report_count(self, receiver_upi: str) -> int:
+        """Get the number of fraud reports filed against a UPI ID (in-memory index)"""
+        return report_index.get(receiver_upi)
+    
+    def get_report_counts(self, receiver_upis: Sequence[str]) -> Dict[str, int]:
+        """Get report counts for many UPI IDs from the in-memory index"""
+        return {upi: report_index.get(upi) for upi in set(receiver_upis)}
+    
+    async def check_is_new_receiver(self, db: AsyncSession, user_id: int, receiver_upi: str) -> int:
+        """Check if this is a new receiver for the user (known-receiver index)"""
+        return 0 if await known_receiver_index.is_known(db, user_id, receiver_upi) else 1
+    
+    async def get_known_receivers(
+        self, db: AsyncSession, user_ids: Sequence[int], receiver_upis: Sequence[str]
+    ) -> Set[Tuple[int, str]]:
+        """Get the (user_id, receiver_upi) pairs the users have already paid"""
+        return await known_receiver_index.known_pairs(db, user_ids, receiver_upis)
+    
+    async def get_user_avg_amount(self, db: AsyncSession, user_id: int) -> float:
+        """Get user's average transaction amount from the running aggregates"""
+        count, total, _ = await get_user_stats(db, user_id)
+        return mean_amount(count, total)
+    
+    async def get_user_avg_amounts(self, db: AsyncSession, user_ids: Sequence[int]) -> Dict[int, float]:
+        """Get average transaction amounts for many users in one query"""
+        stats = await get_users_stats(db, user_ids)
+        return {
+            user_id: mean_amount(count, total)
+            for user_id, (count, total, _) in stats.items()
+        }
+    
+    async def get_velocity(
+        self, db: AsyncSession, user_id: int, at: Optional[datetime] = None
+    ) -> VelocitySnapshot:
+        """Get the user's 1m/1h/24h activity from the in-memory velocity store"""
+        return await velocity_store.get_snapshot(db, user_id, at)
+    
+    async def get_velocities(
+        self, db: AsyncSession, user_ids: Sequence[int], at: Optional[datetime] = None
+    ) -> Dict[int, VelocitySnapshot]:
+        """Get velocity snapshots for many users at the same instant"""
+        return await velocity_store.get_snapshots(db, user_ids, at)
+    
+    async def get_receiver_stats(
+        self, db: AsyncSession, receiver_upi: str, at: Optional[datetime] = None
+    ) -> ReceiverSnapshot:
+        """Get the receiver's fan-in and inflow from the in-memory receiver stats"""
+        return await receiver_stats_store.get_snapshot(db, receiver_upi, at)
+    
+    async def get_receivers_stats(
+        self, db: AsyncSession, receiver_upis: Sequence[str], at: Optional[datetime] = None
+    ) -> Dict[str, ReceiverSnapshot]:
+        """Get fan-in snapshots for many receivers at the same instant"""
+        return await receiver_stats_store.get_snapshots(db, receiver_upis, at)
     
     def determine_is_night(self, hour: int) -> int:
         """Determine if transaction is at night (22:00 - 06:00)"""
@@ -0,0 +1,144 @@
+"""
+Group commit for /api/create writes.
+
+Each payment's writes (the Transaction row, spending aggregates, known
+receivers, idempotency key) normally get their own commit, and on SQLite every
+commit waits for a disk flush. With GROUP_COMMIT=true, /api/create hands its
+writes to GroupCommitWriter instead: a background task collects the writes
+of concurrent requests for up to GROUP_COMMIT_INTERVAL_MS (or until
+GROUP_COMMIT_MAX_BATCH are waiting), applies them in one session and commits
+once. Each request continues only after the commit that contains its writes
+has returned, so a 201 still means the payment is stored.
+
+If the batch commit fails, its writes are retried with one commit each, so
+only the request that caused the failure gets the error.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal, write_lock
+from metrics import group_commit_batch_size, group_commit_duration, group_commit_wait
+
+GROUP_COMMIT = os.getenv("GROUP_COMMIT", "False").lower() == "true"
+GROUP_COMMIT_INTERVAL_MS = float(os.getenv("GROUP_COMMIT_INTERVAL_MS", "5"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "256"))
+
+# A write job adds one request's changes to the given session without committing
+WriteJob = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class GroupCommitWriter:
+    def __init__(
+        self,
+        enabled: bool = GROUP_COMMIT,
+        interval_ms: float = GROUP_COMMIT_INTERVAL_MS,
+        max_batch: int = GROUP_COMMIT_MAX_BATCH,
+        session_factory=AsyncSessionLocal
+    ):
+        self.enabled = enabled
+        self.interval = interval_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.session_factory = session_factory
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+    
+    def start(self) -> None:
+        """Start the writer task on the running event loop"""
+        if self.enabled and not self.running:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Commit whatever is queued, then stop the writer task"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+    
+    async def submit(self, job: WriteJob) -> Any:
+        """Queue a write job and return its result once its batch is committed"""
+        if not self.running:
+            raise RuntimeError("GroupCommitWriter is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((job, future, time.perf_counter()))
+        return await future
+    
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            # 1. Wait for the first write, then gather more until the deadline
+            first = await self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = loop.time() + self.interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:  # stop() was called: commit this batch, then exit
+                    stopping = True
+                    break
+                batch.append(item)
+            # 2. One commit for the whole batch
+            async with write_lock:
+                await self._commit(batch)
+    
+    async def _commit(self, batch: List[tuple]) -> None:
+        started = time.perf_counter()
+        results = None
+        async with self.session_factory() as db:
+            try:
+                results = []
+                for job, _, _ in batch:
+                    results.append(await job(db))
+                    # Later jobs in the batch must see this one's rows
+                    await db.flush()
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                results = None
+        
+        if results is None:
+            # Retry one commit per job so only the failing request sees the error
+            for job, future, enqueued_at in batch:
+                async with self.session_factory() as db:
+                    try:
+                        result = await job(db)
+                        await db.commit()
+                    except Exception as e:
+                        await db.rollback()
+                        if not future.done():
+                            future.set_exception(e)
+                        continue
+                self._resolve(future, result, enqueued_at)
+        else:
+            for (_, future, enqueued_at), result in zip(batch, results):
+                self._resolve(future, result, enqueued_at)
+        
+        group_commit_batch_size.observe(len(batch))
+        group_commit_duration.observe(time.perf_counter() - started)
+    
+    @staticmethod
+    def _resolve(future: asyncio.Future, result: Any, enqueued_at: float) -> None:
+        group_commit_wait.observe(time.perf_counter() - enqueued_at)
+        if not future.done():  # the caller may have gone away
+            future.set_result(result)
+
+
+# Global instance
+group_commit_writer = GroupCommitWriter()
@@ -0,0 +1,208 @@
+"""
+Idempotency keys for POST /api/create.
+
+Clients send an Idempotency-Key header and may retry the same request after
+a timeout. The first request with a key creates the transaction and stores
+its TransactionResponse; every retry within IDEMPOTENCY_TTL_SECONDS gets the
+stored response back (with an Idempotent-Replayed: true header) without
+rescoring or inserting anything. Keys are scoped per user, and reusing a key
+with a different request body is rejected with 422.
+
+- In-process: an LRU of recent keys answers retries without a query, and
+  concurrent requests with the same key wait for the first one instead of
+  running in parallel. If the first one is cancelled (client disconnect),
+  the waiters look for its stored result again and otherwise run it
+  themselves.
+- Across workers: the idempotency_keys row is inserted in the same commit as
+  the Transaction. A worker that loses the race fails that commit on the
+  primary key, rolls back, and replays the winner's stored response.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import IdempotencyKey
+from schemas import TransactionResponse
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+
+class IdempotencyConflict(Exception):
+    """Another worker committed the same key first"""
+
+
+def is_key_conflict(error: Exception) -> bool:
+    """True when an IntegrityError was raised by the idempotency_keys primary key"""
+    return IdempotencyKey.__tablename__ in str(getattr(error, "orig", error))
+
+
+def request_fingerprint(body: dict) -> str:
+    """Stable hash of a request body, to detect keys reused for a different request"""
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, ttl: int = IDEMPOTENCY_TTL_SECONDS, max_entries: int = IDEMPOTENCY_CACHE_SIZE):
+        self.ttl = timedelta(seconds=ttl)
+        self.max_entries = max_entries
+        # (user_id, key) -> (expires_at, request_hash, response)
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[datetime, str, TransactionResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # (user_id, key) -> future of (request_hash, response) for requests still running,
+        # resolved to None if the running request is cancelled
+        self._inflight: Dict[Tuple[int, str], asyncio.Future] = {}
+    
+    def _remember(self, cache_key: Tuple[int, str], expires_at: datetime, request_hash: str, response: TransactionResponse) -> None:
+        with self._lock:
+            self._entries[cache_key] = (expires_at, request_hash, response)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def _cached(self, cache_key: Tuple[int, str]) -> Optional[Tuple[str, TransactionResponse]]:
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            if entry[0] <= datetime.utcnow():
+                del self._entries[cache_key]
+                return None
+            self._entries.move_to_end(cache_key)
+            return entry[1], entry[2]
+    
+    async def _stored(self, db: AsyncSession, cache_key: Tuple[int, str]) -> Optional[Tuple[str, TransactionResponse]]:
+        """The unexpired stored response for a key, from the LRU or the table"""
+        cached = self._cached(cache_key)
+        if cached is not None:
+            return cached
+        row = await db.get(IdempotencyKey, cache_key)
+        if row is None or row.expires_at <= datetime.utcnow():
+            return None
+        response = TransactionResponse.model_validate_json(row.response)
+        self._remember(cache_key, row.expires_at, row.request_hash, response)
+        return row.request_hash, response
+    
+    @staticmethod
+    def _check(request_hash: str, stored: Tuple[str, TransactionResponse]) -> TransactionResponse:
+        if stored[0] != request_hash:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used with a different request"
+            )
+        return stored[1]
+    
+    @staticmethod
+    def _fail(future: asyncio.Future, error: BaseException) -> None:
+        if not future.done():
+            future.set_exception(error)
+            future.exception()  # waiters re-raise it; don't warn when there are none
+    
+    async def execute(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        key: str,
+        request_hash: str,
+        create: Callable[[], Awaitable[TransactionResponse]]
+    ) -> Tuple[TransactionResponse, bool]:
+        """
+        Run `create` once per (user, key). `create` must call stage() before
+        its commit and raise IdempotencyConflict if that commit hits the key.
+        
+        Returns:
+            Tuple of (response, replayed: bool)
+        """
+        cache_key = (user_id, key)
+        
+        while True:
+            # 1. Same key already running in this worker: wait for its result
+            running = self._inflight.get(cache_key)
+            if running is not None:
+                outcome = await asyncio.shield(running)
+                if outcome is None:
+                    continue  # it was cancelled: look for its stored result or run it here
+                return self._check(request_hash, outcome), True
+            
+            # 2. Finished earlier (this worker's LRU or any worker's row)
+            stored = await self._stored(db, cache_key)
+            if stored is not None:
+                return self._check(request_hash, stored), True
+            
+            if cache_key not in self._inflight:
+                break
+        
+        # 3. First request with this key: run it while later ones wait
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = future
+        try:
+            response = await create()
+            self._remember(cache_key, datetime.utcnow() + self.ttl, request_hash, response)
+            future.set_result((request_hash, response))
+            return response, False
+        except IdempotencyConflict:
+            # Lost the race to another worker: replay what it stored
+            stored = await self._stored(db, cache_key)
+            if stored is None:
+                error = HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="A request with this Idempotency-Key is still being processed"
+                )
+                self._fail(future, error)
+                raise error
+            future.set_result(stored)
+            return self._check(request_hash, stored), True
+        except asyncio.CancelledError:
+            # The client went away: waiters retry instead of being cancelled too
+            if not future.done():
+                future.set_result(None)
+            raise
+        except BaseException as e:
+            self._fail(future, e)
+            raise
+        finally:
+            del self._inflight[cache_key]
+    
+    async def stage(
+        self, db: AsyncSession, user_id: int, key: str, request_hash: str, response: TransactionResponse
+    ) -> None:
+        """Add the key row to the caller's transaction. Does not commit."""
+        now = datetime.utcnow()
+        # An expired row for the same key would block the insert
+        await db.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.key == key,
+                IdempotencyKey.expires_at <= now
+            )
+        )
+        db.add(IdempotencyKey(
+            user_id=user_id,
+            key=key,
+            request_hash=request_hash,
+            transaction_id=response.id,
+            response=response.model_dump_json(),
+            created_at=now,
+            expires_at=now + self.ttl
+        ))
+
+
+def purge_expired(db: Session) -> int:
+    """Delete expired keys from the table. Returns the number of rows removed."""
+    result = db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow()))
+    db.commit()
+    return result.rowcount
+
+
+# Global instance
+idempotency_store = IdempotencyStore()
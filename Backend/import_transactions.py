@@ -0,0 +1,252 @@
+"""
+Bulk import of historical transactions from CSV, with risk scores filled in.
+
+The file is streamed in chunks. For each chunk:
+1. hour and is_night come from the timestamp column
+2. is_new_receiver, the user's running average, velocity windows and the
+   receiver's fan-in come from known_receivers, user_spending_stats and the
+   transactions table, plus the rows earlier in the file
+3. the model is called once for the whole chunk, then the usual rules apply
+4. rows are inserted with executemany, together with the aggregates, rollups,
+   payee list and the import checkpoint, in a single commit
+
+Rows are scored as if they had been created one by one in file order, so each
+user's rows should appear in time order (as they do in a bank statement), and
+the receiver fan-in features assume the file as a whole is roughly in time
+order. The database must not already hold transactions of an imported user
+that are newer than that user's rows in the file: their aggregates would leak
+later activity into the scores, so the import stops at such a chunk.
+
+Required columns: user_id, receiver_upi, receiver_name, amount, timestamp
+Optional columns: category, description, status
+
+Usage:
+    python import_transactions.py statements.csv [--chunk-size 10000] [--restart]
+
+An interrupted import resumes after the last committed chunk when run again.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, insert, select
+
+from database import SessionLocal, init_db
+from fraud_detection import fraud_detector
+from known_receivers import load_known_pairs, record_pairs_bulk
+from models import ImportCheckpoint, Transaction
+from receiver_stats import HISTORY as RECEIVER_HISTORY, load_receiver_history
+from report_index import report_index
+from spending_stats import in_batches, load_users_totals, record_transactions_bulk
+from velocity import HISTORY, load_history
+
+REQUIRED_COLUMNS = ["user_id", "receiver_upi", "receiver_name", "amount", "timestamp"]
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def _optional(chunk: pd.DataFrame, column: str, default=None) -> list:
+    """Column values with blanks as `default`, or all `default` if the column is absent"""
+    if column not in chunk:
+        return [default] * len(chunk)
+    return [default if pd.isna(value) else value for value in chunk[column]]
+
+
+def check_no_newer_history(db, user_ids: np.ndarray, timestamps: list) -> None:
+    """Raise if a user already has stored transactions after their first row in the chunk"""
+    first_in_chunk = {}
+    for user_id, timestamp in zip(user_ids.tolist(), timestamps):
+        if user_id not in first_in_chunk or timestamp < first_in_chunk[user_id]:
+            first_in_chunk[user_id] = timestamp
+    
+    for batch in in_batches(first_in_chunk):
+        rows = db.execute(
+            select(Transaction.user_id, func.max(Transaction.timestamp))
+            .where(Transaction.user_id.in_(batch))
+            .group_by(Transaction.user_id)
+        ).all()
+        for user_id, latest in rows:
+            if latest > first_in_chunk[user_id]:
+                raise ValueError(
+                    f"User {user_id} already has transactions up to {latest}, after their imported row "
+                    f"at {first_in_chunk[user_id]}; scores would use later activity. Import older "
+                    f"history before newer transactions are stored."
+                )
+
+
+def score_chunk(db, chunk: pd.DataFrame, model) -> list:
+    """Build Transaction rows for one chunk, scored with one model call"""
+    user_ids = chunk["user_id"].astype(int).to_numpy()
+    receiver_upis = chunk["receiver_upi"].astype(str).to_numpy()
+    amounts = chunk["amount"].astype(float).to_numpy()
+    timestamps = pd.to_datetime(chunk["timestamp"])
+    
+    # 1. Time features
+    hours = timestamps.dt.hour.to_numpy()
+    is_nights = ((hours >= 22) | (hours <= 6)).astype(int)
+    
+    # Aggregates below cover everything stored, so nothing stored may be newer
+    timestamps = [timestamp.to_pydatetime() for timestamp in timestamps]
+    check_no_newer_history(db, user_ids, timestamps)
+    
+    # 2. New receiver: not known before this chunk and first occurrence within it
+    pairs = list(zip(user_ids.tolist(), receiver_upis.tolist()))
+    known = load_known_pairs(db, pairs)
+    first_in_chunk = ~pd.Series(pairs).duplicated().to_numpy()
+    is_new_receivers = np.array(
+        [first and pair not in known for pair, first in zip(pairs, first_in_chunk)], dtype=int
+    )
+    
+    # 2b. Running average of the user's earlier transactions
+    totals = load_users_totals(db, user_ids.tolist())
+    by_user = pd.Series(amounts).groupby(user_ids)
+    prior_counts = np.array([totals.get(uid, (0, 0.0))[0] for uid in user_ids]) + by_user.cumcount().to_numpy()
+    prior_sums = np.array([totals.get(uid, (0, 0.0))[1] for uid in user_ids]) + by_user.cumsum().to_numpy() - amounts
+    user_avgs = np.divide(prior_sums, prior_counts, out=np.zeros(len(amounts)), where=prior_counts > 0)
+    
+    # 2c. Velocity windows, replayed through the chunk below; nothing after the chunk
+    latest = max(timestamps)
+    velocities = load_history(db, user_ids.tolist(), min(timestamps) - HISTORY, until=latest)
+    receivers = load_receiver_history(
+        db, receiver_upis.tolist(), min(timestamps) - RECEIVER_HISTORY, until=latest
+    )
+    
+    # 3. One model call for the chunk, then the rules row by row
+    ml_scores = model.predict_many(amounts, is_nights)
+    
+    categories = _optional(chunk, "category", "Others")
+    descriptions = _optional(chunk, "description")
+    statuses = _optional(chunk, "status", "completed")
+    receiver_names = chunk["receiver_name"].astype(str).tolist()
+    
+    rows = []
+    for i in range(len(chunk)):
+        velocity = velocities[int(user_ids[i])]
+        receiver = receivers[receiver_upis[i]]
+        risk_score, reasons = fraud_detector.score_features(
+            amount=float(amounts[i]),
+            is_night=int(is_nights[i]),
+            report_count=report_index.get(receiver_upis[i]),
+            is_new_receiver=int(is_new_receivers[i]),
+            user_avg_amount=float(user_avgs[i]),
+            ml_score=int(ml_scores[i]),
+            velocity=velocity.snapshot(timestamps[i]),
+            receiver_stats=receiver.snapshot(timestamps[i])
+        )
+        velocity.record(receiver_upis[i], float(amounts[i]), timestamps[i])
+        receiver.record(int(user_ids[i]), float(amounts[i]), timestamps[i])
+        rows.append({
+            "user_id": int(user_ids[i]),
+            "receiver_upi": receiver_upis[i],
+            "receiver_name": receiver_names[i],
+            "amount": float(amounts[i]),
+            "category": categories[i],
+            "description": descriptions[i],
+            "timestamp": timestamps[i],
+            "hour": int(hours[i]),
+            "is_night": int(is_nights[i]),
+            "is_new_receiver": int(is_new_receivers[i]),
+            "risk_score": risk_score,
+            "is_flagged": risk_score >= 70,
+            "fraud_reasons": json.dumps(reasons) if reasons else None,
+            "status": statuses[i]
+        })
+    
+    return rows
+
+
+def import_file(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, restart: bool = False) -> int:
+    """Import a CSV file, resuming from its checkpoint. Returns the number of rows imported."""
+    source = os.path.abspath(path)
+    db = SessionLocal()
+    try:
+        report_index.rebuild(db)
+        model = fraud_detector.active_model
+        print(f"✓ Scoring with model version {model.version}")
+        
+        checkpoint = db.get(ImportCheckpoint, source)
+        if checkpoint is None:
+            checkpoint = ImportCheckpoint(source=source, rows_done=0)
+            db.add(checkpoint)
+        elif restart:
+            checkpoint.rows_done = 0
+        db.commit()
+        
+        skip = checkpoint.rows_done
+        if skip:
+            print(f"✓ Resuming {path} after row {skip}")
+        
+        imported = 0
+        started = time.perf_counter()
+        for chunk in pd.read_csv(path, chunksize=chunk_size, dtype={"receiver_upi": str, "receiver_name": str}):
+            missing = [column for column in REQUIRED_COLUMNS if column not in chunk]
+            if missing:
+                raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+            
+            # Skip rows committed by an earlier run
+            if skip >= len(chunk):
+                skip -= len(chunk)
+                continue
+            chunk = chunk.iloc[skip:]
+            skip = 0
+            
+            chunk_started = time.perf_counter()
+            rows = score_chunk(db, chunk, model)
+            
+            # Rows, rollups, payees and checkpoint land in one commit
+            db.execute(insert(Transaction), rows)
+            record_transactions_bulk(
+                db,
+                [row["user_id"] for row in rows],
+                [row["amount"] for row in rows],
+                [row["category"] for row in rows],
+                [row["timestamp"] for row in rows]
+            )
+            record_pairs_bulk(
+                db,
+                [row["user_id"] for row in rows],
+                [row["receiver_upi"] for row in rows],
+                [row["timestamp"] for row in rows]
+            )
+            checkpoint.rows_done += len(rows)
+            db.commit()
+            
+            imported += len(rows)
+            chunk_seconds = time.perf_counter() - chunk_started
+            total_seconds = time.perf_counter() - started
+            print(
+                f"✓ {checkpoint.rows_done} rows committed "
+                f"(chunk {len(rows) / chunk_seconds:,.0f} rows/s, overall {imported / total_seconds:,.0f} rows/s)"
+            )
+        
+        return imported
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import historical transactions from CSV with risk scores")
+    parser.add_argument("path", help="CSV file to import")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows scored and committed together")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and import from the first row")
+    args = parser.parse_args()
+    
+    if not os.path.exists(args.path):
+        print(f"✗ File not found: {args.path}")
+        sys.exit(1)
+    
+    init_db()
+    started = time.perf_counter()
+    try:
+        count = import_file(args.path, args.chunk_size, args.restart)
+    except ValueError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+    seconds = time.perf_counter() - started
+    print(f"✓ Imported {count} transactions in {seconds:.1f}s ({count / max(seconds, 1e-9):,.0f} rows/s)")
@@ -0,0 +1,327 @@
+"""
+Known-receiver index for the "New receiver" rule.
+
+The known_receivers table holds one row per (user_id, receiver_upi) pair with
+first/last seen timestamps, and is updated in the same commit that inserts a
+Transaction. On top of it sits a per-user in-process cache: an exact set of
+payees, or a Bloom filter for users with more than KNOWN_RECEIVER_BLOOM_THRESHOLD
+payees. Only exact-set hits are answered from the cache: Bloom "maybe" answers
+and misses are confirmed with a primary-key lookup, so a payee is never
+reported as known when it is not, and a payee another worker recorded a
+moment ago is not reported as new. Confirmed payees are added to the cache.
+Cached users are evicted LRU and reloaded after KNOWN_RECEIVER_CACHE_TTL
+seconds.
+
+Rebuild from the transactions table:
+    python known_receivers.py rebuild
+"""
+import hashlib
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import bindparam, case, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import KnownReceiver, Transaction
+from spending_stats import in_batches, upsert_insert
+
+KNOWN_RECEIVER_CACHE_USERS = int(os.getenv("KNOWN_RECEIVER_CACHE_USERS", "10000"))
+KNOWN_RECEIVER_BLOOM_THRESHOLD = int(os.getenv("KNOWN_RECEIVER_BLOOM_THRESHOLD", "1000"))
+KNOWN_RECEIVER_CACHE_TTL = int(os.getenv("KNOWN_RECEIVER_CACHE_TTL", "300"))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter using double hashing over one blake2b digest"""
+    
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+    
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+    
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+    
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class _PayeeCache:
+    """One user's cached payees: an exact set, or a Bloom filter for large payee lists"""
+    
+    def __init__(self, payees: Sequence[str], bloom_threshold: int):
+        self.loaded_at = time.monotonic()
+        if len(payees) > bloom_threshold:
+            self.exact = False
+            self.payees = BloomFilter(capacity=len(payees) * 2)
+            for upi in payees:
+                self.payees.add(upi)
+        else:
+            self.exact = True
+            self.payees = set(payees)
+    
+    def add(self, receiver_upi: str) -> None:
+        self.payees.add(receiver_upi)
+
+
+class KnownReceiverIndex:
+    def __init__(
+        self,
+        max_users: int = KNOWN_RECEIVER_CACHE_USERS,
+        bloom_threshold: int = KNOWN_RECEIVER_BLOOM_THRESHOLD,
+        ttl: int = KNOWN_RECEIVER_CACHE_TTL
+    ):
+        self.max_users = max_users
+        self.bloom_threshold = bloom_threshold
+        self.ttl = ttl
+        self._users: "OrderedDict[int, _PayeeCache]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    async def _get_cache(self, db: AsyncSession, user_id: int) -> _PayeeCache:
+        """Get the user's payee cache, loading it from known_receivers if missing or expired"""
+        with self._lock:
+            cache = self._users.get(user_id)
+            if cache is not None and time.monotonic() - cache.loaded_at < self.ttl:
+                self._users.move_to_end(user_id)
+                return cache
+        
+        result = await db.execute(
+            select(KnownReceiver.receiver_upi).where(KnownReceiver.user_id == user_id)
+        )
+        payees = result.scalars().all()
+        cache = _PayeeCache(payees, self.bloom_threshold)
+        
+        with self._lock:
+            self._users[user_id] = cache
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        
+        return cache
+    
+    async def is_known(self, db: AsyncSession, user_id: int, receiver_upi: str) -> bool:
+        """Has the user paid this receiver before?"""
+        cache = await self._get_cache(db, user_id)
+        if cache.exact and receiver_upi in cache.payees:
+            return True
+        # Bloom filter hit, or a miss that another worker may have recorded
+        # since the cache was loaded: confirm with a primary-key lookup
+        if await db.get(KnownReceiver, (user_id, receiver_upi)) is None:
+            return False
+        self._add_cached(cache, receiver_upi)
+        return True
+    
+    async def known_pairs(
+        self, db: AsyncSession, user_ids: Sequence[int], receiver_upis: Sequence[str]
+    ) -> Set[Tuple[int, str]]:
+        """Get the (user_id, receiver_upi) pairs among the inputs that are already known"""
+        known = set()
+        to_confirm = set()
+        caches = {}
+        
+        for pair in set(zip(user_ids, receiver_upis)):
+            cache = caches[pair[0]] = await self._get_cache(db, pair[0])
+            if cache.exact and pair[1] in cache.payees:
+                known.add(pair)
+            else:
+                # Bloom hits and misses alike, as in is_known
+                to_confirm.add(pair)
+        
+        for batch in in_batches(to_confirm):
+            result = await db.execute(
+                select(KnownReceiver.user_id, KnownReceiver.receiver_upi).where(
+                    KnownReceiver.user_id.in_({user_id for user_id, _ in batch}),
+                    KnownReceiver.receiver_upi.in_({upi for _, upi in batch})
+                )
+            )
+            for pair in result.all():
+                pair = tuple(pair)
+                if pair in to_confirm:
+                    known.add(pair)
+                    self._add_cached(caches[pair[0]], pair[1])
+        
+        return known
+    
+    async def record(self, db: AsyncSession, user_id: int, receiver_upi: str, seen_at: Optional[datetime] = None) -> None:
+        """
+        Record a payment to receiver_upi. Does not commit: call it before the
+        commit that inserts the Transaction, then call remember() after it.
+        """
+        seen_at = seen_at or datetime.utcnow()
+        statement = upsert_insert(db, KnownReceiver.__table__)
+        if statement is not None:
+            # One atomic statement: concurrent first payments to a payee can't both insert
+            statement = statement.values(
+                user_id=user_id,
+                receiver_upi=receiver_upi,
+                first_seen_at=seen_at,
+                last_seen_at=seen_at,
+                transaction_count=1
+            )
+            await db.execute(statement.on_conflict_do_update(
+                index_elements=["user_id", "receiver_upi"],
+                set_={
+                    "last_seen_at": statement.excluded.last_seen_at,
+                    "transaction_count": KnownReceiver.__table__.c.transaction_count + 1
+                }
+            ))
+            return
+        
+        result = await db.execute(
+            update(KnownReceiver)
+            .where(
+                KnownReceiver.user_id == user_id,
+                KnownReceiver.receiver_upi == receiver_upi
+            )
+            .values(
+                last_seen_at=seen_at,
+                transaction_count=KnownReceiver.transaction_count + 1
+            )
+        )
+        
+        if result.rowcount == 0:
+            db.add(KnownReceiver(
+                user_id=user_id,
+                receiver_upi=receiver_upi,
+                first_seen_at=seen_at,
+                last_seen_at=seen_at,
+                transaction_count=1
+            ))
+    
+    def _add_cached(self, cache: _PayeeCache, receiver_upi: str) -> None:
+        with self._lock:
+            cache.add(receiver_upi)
+    
+    def remember(self, user_id: int, receiver_upi: str) -> None:
+        """Add a committed payee to the user's cache, if the user is cached"""
+        with self._lock:
+            cache = self._users.get(user_id)
+            if cache is not None:
+                cache.add(receiver_upi)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
+
+
+def load_known_pairs(db: Session, pairs: Iterable[Tuple[int, str]]) -> Set[Tuple[int, str]]:
+    """Sync lookup of which (user_id, receiver_upi) pairs are already known, for bulk jobs"""
+    pairs = set(pairs)
+    known = set()
+    for batch in in_batches(pairs):
+        rows = db.execute(
+            select(KnownReceiver.user_id, KnownReceiver.receiver_upi).where(
+                KnownReceiver.user_id.in_({user_id for user_id, _ in batch}),
+                KnownReceiver.receiver_upi.in_({upi for _, upi in batch})
+            )
+        ).all()
+        known.update(tuple(pair) for pair in rows if tuple(pair) in pairs)
+    return known
+
+
+def record_pairs_bulk(
+    db: Session,
+    user_ids: Sequence[int],
+    receiver_upis: Sequence[str],
+    timestamps: Sequence[datetime]
+) -> None:
+    """
+    Sync counterpart of KnownReceiverIndex.record for many rows at once (bulk
+    import). Rows need not be in time order. Does not commit.
+    """
+    seen: Dict[Tuple[int, str], list] = {}
+    for pair, timestamp in zip(zip(user_ids, receiver_upis), timestamps):
+        entry = seen.get(pair)
+        if entry is None:
+            seen[pair] = [timestamp, timestamp, 1]
+        else:
+            entry[0] = min(entry[0], timestamp)
+            entry[1] = max(entry[1], timestamp)
+            entry[2] += 1
+    
+    known = load_known_pairs(db, seen)
+    table = KnownReceiver.__table__
+    first_seen, last_seen = bindparam("b_first_seen"), bindparam("b_last_seen")
+    updates = [
+        {"b_user_id": user_id, "b_receiver_upi": upi, "b_first_seen": first, "b_last_seen": last, "b_count": count}
+        for (user_id, upi), (first, last, count) in seen.items() if (user_id, upi) in known
+    ]
+    inserts = [
+        {"user_id": user_id, "receiver_upi": upi, "first_seen_at": first, "last_seen_at": last, "transaction_count": count}
+        for (user_id, upi), (first, last, count) in seen.items() if (user_id, upi) not in known
+    ]
+    
+    if updates:
+        db.execute(
+            update(table)
+            .where(table.c.user_id == bindparam("b_user_id"), table.c.receiver_upi == bindparam("b_receiver_upi"))
+            .values(
+                first_seen_at=case((table.c.first_seen_at > first_seen, first_seen), else_=table.c.first_seen_at),
+                last_seen_at=case((table.c.last_seen_at < last_seen, last_seen), else_=table.c.last_seen_at),
+                transaction_count=table.c.transaction_count + bindparam("b_count")
+            ),
+            updates
+        )
+    if inserts:
+        db.execute(insert(table), inserts)
+
+
+def rebuild_known_receivers(db: Session) -> int:
+    """Recompute the known_receivers table from transactions"""
+    db.query(KnownReceiver).delete()
+    db.execute(
+        insert(KnownReceiver).from_select(
+            ["user_id", "receiver_upi", "first_seen_at", "last_seen_at", "transaction_count"],
+            select(
+                Transaction.user_id,
+                Transaction.receiver_upi,
+                func.min(Transaction.timestamp),
+                func.max(Transaction.timestamp),
+                func.count(Transaction.id)
+            ).group_by(Transaction.user_id, Transaction.receiver_upi)
+        )
+    )
+    db.commit()
+    known_receiver_index.clear()
+    
+    return db.query(KnownReceiver).count()
+
+
+def needs_backfill(db: Session) -> bool:
+    """True when transactions exist but the known_receivers table is empty"""
+    has_known = db.query(KnownReceiver.user_id).first() is not None
+    has_transactions = db.query(Transaction.id).first() is not None
+    return has_transactions and not has_known
+
+
+# Global instance
+known_receiver_index = KnownReceiverIndex()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] != "rebuild":
+        print("Usage: python known_receivers.py rebuild")
+        sys.exit(1)
+    
+    from database import SessionLocal, init_db
+    
+    init_db()
+    db = SessionLocal()
+    try:
+        pairs = rebuild_known_receivers(db)
+        print(f"✓ Rebuilt known receivers ({pairs} user/payee pairs)")
+    finally:
+        db.close()
@@ -1,12 +1,31 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+import os
 import uvicorn
 
-from database import init_db
+from database import init_db, SessionLocal, engine, async_engine, pool_stats, DATABASE_PROFILE
+from report_index import report_index
+from fraud_detection import fraud_detector
+from metrics import registry, PrometheusMiddleware
+from query_profiler import QUERY_PROFILING, QueryProfilerMiddleware, instrument
+from auth import user_cache
+from analytics import analytics_cache
+from velocity import velocity_store
+from receiver_stats import receiver_stats_store
+from idempotency import purge_expired as purge_expired_idempotency_keys
+from group_commit import group_commit_writer
+import known_receivers
+import spending_stats
 from routes_auth import router as auth_router
 from routes_transactions import router as transactions_router
 from routes_fraud_reports import router as fraud_reports_router
 from routes_analytics import router as analytics_router
+from routes_models import router as models_router
+
+# Seconds between checks of the model registry's ACTIVE version (0 disables)
+MODEL_REGISTRY_WATCH_SECONDS = int(os.getenv("MODEL_REGISTRY_WATCH_SECONDS", "30"))
 
 app = FastAPI(
     title="UPI Fraud Detection API",
@@ -21,12 +40,94 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Query-Count", "X-Query-Time-ms"],
 )
 
+# Request latency and in-flight metrics for /api/metrics
+app.add_middleware(PrometheusMiddleware)
+
+# Optional per-request SQL statement counts and timings
+if QUERY_PROFILING:
+    instrument(engine, async_engine)
+    app.add_middleware(QueryProfilerMiddleware)
+
+
+def collect_runtime_metrics():
+    """Pool usage and cache statistics, read at scrape time"""
+    pool_samples = []
+    for name, db_engine in (("async", async_engine), ("sync", engine)):
+        stats = pool_stats(db_engine)
+        for state in ("size", "checkedin", "checkedout", "overflow"):
+            if state in stats:
+                pool_samples.append(({"engine": name, "state": state}, stats[state]))
+    yield "upi_db_pool_connections", "gauge", "Connection pool usage by engine and state", pool_samples
+    
+    caches = {"user": user_cache.stats(), "analytics": analytics_cache.stats()}
+    yield "upi_cache_hits_total", "counter", "Cache hits", [({"cache": name}, stats["hits"]) for name, stats in caches.items()]
+    yield "upi_cache_misses_total", "counter", "Cache misses", [({"cache": name}, stats["misses"]) for name, stats in caches.items()]
+    yield "upi_cache_hit_ratio", "gauge", "Cache hit ratio since start", [({"cache": name}, stats["hit_rate"]) for name, stats in caches.items()]
+    yield "upi_cache_entries", "gauge", "Entries currently cached", [({"cache": name}, stats["size"]) for name, stats in caches.items()]
+    yield "upi_velocity_users", "gauge", "Users with in-memory velocity windows", [({}, len(velocity_store))]
+    yield "upi_receiver_stats_receivers", "gauge", "Receivers with in-memory fan-in windows", [({}, len(receiver_stats_store))]
+
+
+registry.add_collector(collect_runtime_metrics)
+
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
     init_db()
     print("✓ Database initialized")
+    
+    db = SessionLocal()
+    try:
+        # Backfill derived tables on databases created before they existed
+        if spending_stats.needs_backfill(db):
+            users = spending_stats.rebuild_user_stats(db)
+            print(f"✓ Spending aggregates and rollups backfilled ({users} users)")
+        if known_receivers.needs_backfill(db):
+            pairs = known_receivers.rebuild_known_receivers(db)
+            print(f"✓ Known receivers backfilled ({pairs} pairs)")
+        
+        # Build the reported-UPI count index and keep it reconciled with the table
+        indexed = report_index.rebuild(db)
+        
+        # Per-user velocity windows from the last 24 hours of transactions
+        active_users = velocity_store.rebuild(db)
+        # Per-receiver fan-in windows and first-seen times
+        receivers = receiver_stats_store.rebuild(db)
+        
+        # Drop Idempotency-Key rows past their TTL
+        expired_keys = purge_expired_idempotency_keys(db)
+    finally:
+        db.close()
+    print(f"✓ Fraud report index built ({indexed} UPI IDs)")
+    print(f"✓ Velocity windows rebuilt ({active_users} active users)")
+    print(f"✓ Receiver fan-in stats rebuilt ({receivers} receivers, {len(receiver_stats_store)} tracked)")
+    print(f"✓ Expired idempotency keys purged ({expired_keys})")
+    app.state.report_reconciler = asyncio.create_task(
+        report_index.reconcile_forever(SessionLocal)
+    )
+    
+    # Hot-swap the model when the registry's ACTIVE version changes
+    print(f"✓ Serving model version {fraud_detector.model_version}")
+    app.state.model_watcher = None
+    if MODEL_REGISTRY_WATCH_SECONDS > 0:
+        app.state.model_watcher = asyncio.create_task(
+            fraud_detector.watch_registry(MODEL_REGISTRY_WATCH_SECONDS)
+        )
+    
+    # Batch concurrent /api/create commits (GROUP_COMMIT=true)
+    group_commit_writer.start()
+    if group_commit_writer.running:
+        print(f"✓ Group commit enabled ({group_commit_writer.interval * 1000:g} ms window)")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.report_reconciler.cancel()
+    if app.state.model_watcher is not None:
+        app.state.model_watcher.cancel()
+    await group_commit_writer.stop()
+    await async_engine.dispose()
 
 # --- ROUTE INCLUSION ---
 # We use /api as the base for all routers to keep frontend calls consistent.
@@ -41,6 +142,7 @@ app.include_router(transactions_router, prefix="/api", tags=["Transactions"])
 # Fraud Reports and Analytics prefixes
 app.include_router(fraud_reports_router, prefix="/api/fraud-reports", tags=["Fraud Reports"])
 app.include_router(analytics_router, prefix="/api/analytics", tags=["Analytics"])
+app.include_router(models_router, prefix="/api/models", tags=["Models"])
 
 @app.get("/")
 def root():
@@ -50,6 +152,20 @@ def root():
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/api/health/db")
+def database_health():
+    """Engine profile and connection pool usage"""
+    return {
+        "profile": DATABASE_PROFILE,
+        "async_pool": pool_stats(async_engine),
+        "sync_pool": pool_stats(engine)
+    }
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Metrics in the Prometheus text exposition format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     # Running on port 8000
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
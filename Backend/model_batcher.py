@@ -0,0 +1,86 @@
+"""
+Dynamic micro-batching of single-transaction model calls.
+
+Concurrent /api/predict requests each need one ML score. Instead of one
+predict_one call per request, callers await ModelBatcher.predict(), which
+queues the features and flushes the queue as one vectorized predict_many
+call when MODEL_BATCH_MAX_SIZE requests are waiting or MODEL_BATCH_WAIT_MS
+after the first one arrived, whichever comes first. Requests pinned to
+different model versions (during a hot reload) are scored by their own model.
+
+MODEL_BATCH_WAIT_MS trades latency for throughput: every request may wait up
+to that long, in exchange for fewer, larger model calls under load. The
+upi_model_batch_size and upi_model_batch_queue_delay_seconds histograms show
+both sides of the trade-off. A negative wait disables batching.
+"""
+import asyncio
+import os
+import time
+from typing import List, Optional
+
+from metrics import model_batch_flushes, model_batch_queue_delay, model_batch_size, model_inference_duration
+
+MODEL_BATCH_MAX_SIZE = int(os.getenv("MODEL_BATCH_MAX_SIZE", "64"))
+MODEL_BATCH_WAIT_MS = float(os.getenv("MODEL_BATCH_WAIT_MS", "2"))
+
+
+class ModelBatcher:
+    def __init__(self, max_batch_size: int = MODEL_BATCH_MAX_SIZE, max_wait_ms: float = MODEL_BATCH_WAIT_MS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        # (model, amount, is_night, future, enqueued_at)
+        self._pending: List[tuple] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_wait >= 0
+    
+    async def predict(self, model, amount: float, is_night: int) -> int:
+        """ML score (0-100) for one transaction, computed together with concurrent callers"""
+        if not self.enabled:
+            started = time.perf_counter()
+            ml_score = model.predict_one(amount, is_night)
+            model_inference_duration.observe(time.perf_counter() - started, "single")
+            return ml_score
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((model, float(amount), int(is_night), future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush("full")
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush, "timeout")
+        return await future
+    
+    def _flush(self, reason: str) -> None:
+        """Score everything queued so far and resolve the callers' futures"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        
+        started = time.perf_counter()
+        model_batch_flushes.inc(reason)
+        model_batch_size.observe(len(pending))
+        for *_, enqueued_at in pending:
+            model_batch_queue_delay.observe(started - enqueued_at)
+        
+        # 1. Group by model so every caller is scored by the version it pinned
+        by_model = {}
+        for item in pending:
+            by_model.setdefault(id(item[0]), []).append(item)
+        
+        # 2. One vectorized call per model, then hand each caller its score
+        for items in by_model.values():
+            scores = items[0][0].predict_many([item[1] for item in items], [item[2] for item in items])
+            for (_, _, _, future, _), score in zip(items, scores):
+                if not future.done():  # the caller may have gone away
+                    future.set_result(int(score))
+        model_inference_duration.observe(time.perf_counter() - started, "microbatch")
+
+
+# Global instance
+model_batcher = ModelBatcher()
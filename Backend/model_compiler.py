@@ -0,0 +1,205 @@
+"""
+Compile the fraud model into a small JSON artifact that can be scored without
+scikit-learn.
+
+A binary LogisticRegression is just a dot product and a sigmoid, so calling
+predict_proba on a 1x2 NumPy array per request spends almost all of its time
+in input validation and allocation. compile_model() exports the coefficients
+and intercept; CompiledLogisticModel scores them with plain float math.
+Unsupported model types compile to None and keep using predict_proba.
+
+Usage:
+    python model_compiler.py [fraud_model.pkl]
+"""
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+import warnings
+from typing import Optional, Sequence
+
+import numpy as np
+
+COMPILED_FORMAT = "logistic_regression/v1"
+FEATURES = ["amount", "is_night"]
+
+
+def _sigmoid(z: float) -> float:
+    """Numerically stable logistic function"""
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+
+class CompiledLogisticModel:
+    """Positive-class probability of a binary logistic regression"""
+    
+    def __init__(self, coef: Sequence[float], intercept: float):
+        self.coef = [float(c) for c in coef]
+        self.intercept = float(intercept)
+    
+    def predict_proba_one(self, *features: float) -> float:
+        """Score a single row; features in FEATURES order"""
+        z = 0.0
+        for c, x in zip(self.coef, features):
+            z += c * x
+        return _sigmoid(z + self.intercept)
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """
+        Score a feature matrix. The linear term is accumulated column by column
+        in the same order as predict_proba_one, so batch and single-row scores
+        are bit-for-bit identical.
+        """
+        z = np.zeros(X.shape[0])
+        for j, c in enumerate(self.coef):
+            z += c * X[:, j]
+        z += self.intercept
+        return np.fromiter((_sigmoid(v) for v in z.tolist()), dtype=float, count=len(z))
+
+
+def compiled_model_path(model_path: str) -> str:
+    """fraud_model.pkl -> fraud_model.compiled.json"""
+    return os.path.splitext(model_path)[0] + ".compiled.json"
+
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def compile_model(model) -> Optional[dict]:
+    """Export a binary LogisticRegression over FEATURES; None for anything else"""
+    if type(model).__name__ != "LogisticRegression":
+        return None
+    coef = getattr(model, "coef_", None)
+    intercept = getattr(model, "intercept_", None)
+    if coef is None or coef.shape != (1, len(FEATURES)) or len(model.classes_) != 2:
+        return None
+    feature_names = getattr(model, "feature_names_in_", None)
+    if feature_names is not None and list(feature_names) != FEATURES:
+        return None
+    
+    return {
+        "format": COMPILED_FORMAT,
+        "features": FEATURES,
+        "coef": [float(c) for c in coef[0]],
+        "intercept": float(intercept[0]),
+    }
+
+
+def from_artifact(artifact: dict) -> Optional[CompiledLogisticModel]:
+    """Build a scorer from a compiled artifact, or None if the format is unknown"""
+    if artifact.get("format") != COMPILED_FORMAT or artifact.get("features") != FEATURES:
+        return None
+    return CompiledLogisticModel(artifact["coef"], artifact["intercept"])
+
+
+def load_compiled_model(model_path: str) -> Optional[CompiledLogisticModel]:
+    """
+    Load the compiled artifact next to model_path. It is only used if it was
+    compiled from the current model file (matching SHA-256), or if the model
+    file itself is absent.
+    """
+    path = compiled_model_path(model_path)
+    if not os.path.exists(path):
+        return None
+    
+    try:
+        with open(path) as f:
+            artifact = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠ Warning: Could not read compiled model {path}: {e}")
+        return None
+    
+    if os.path.exists(model_path) and artifact.get("source_sha256") != file_sha256(model_path):
+        print(f"⚠ Compiled model {path} is stale; recompile with model_compiler.py")
+        return None
+    
+    return from_artifact(artifact)
+
+
+def verify_compiled(model, compiled: CompiledLogisticModel, n_samples: int = 10000) -> float:
+    """
+    Check the compiled scorer against sklearn on random and boundary inputs.
+    Returns the max absolute probability difference; raises if any integer
+    risk score differs.
+    """
+    rng = np.random.default_rng(0)
+    amounts = np.concatenate([
+        rng.uniform(0, 20000, n_samples),
+        np.arange(0, 10001, 50, dtype=float),
+    ])
+    X = np.column_stack([
+        np.tile(amounts, 2),
+        np.repeat([0.0, 1.0], len(amounts)),
+    ])
+    
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        expected = model.predict_proba(X)[:, 1]
+    actual = compiled.predict_proba(X)
+    single = np.array([compiled.predict_proba_one(a, n) for a, n in X.tolist()])
+    
+    if not np.array_equal(actual, single):
+        raise AssertionError("Compiled batch and single-row scores differ")
+    mismatched = np.flatnonzero((expected * 100).astype(int) != (actual * 100).astype(int))
+    if len(mismatched):
+        raise AssertionError(f"Compiled risk scores differ from sklearn for {len(mismatched)} inputs")
+    
+    return float(np.max(np.abs(expected - actual)))
+
+
+def compare_latency(model, compiled: CompiledLogisticModel, n_calls: int = 2000) -> dict:
+    """Mean microseconds per single-row prediction, sklearn vs compiled"""
+    with warnings.catch_warnings():
+        # Models fitted on DataFrames warn on every unnamed NumPy input
+        warnings.simplefilter("ignore", UserWarning)
+        start = time.perf_counter()
+        for i in range(n_calls):
+            model.predict_proba(np.array([[float(i), 1]]))[0][1]
+    sklearn_us = (time.perf_counter() - start) / n_calls * 1e6
+    
+    start = time.perf_counter()
+    for i in range(n_calls):
+        compiled.predict_proba_one(float(i), 1)
+    compiled_us = (time.perf_counter() - start) / n_calls * 1e6
+    
+    return {"sklearn_us": sklearn_us, "compiled_us": compiled_us}
+
+
+def compile_model_file(model_path: str) -> Optional[str]:
+    """Compile model_path, verify it against sklearn and write the artifact"""
+    import joblib
+    
+    model = joblib.load(model_path)
+    artifact = compile_model(model)
+    if artifact is None:
+        print(f"⚠ {type(model).__name__} cannot be compiled; sklearn will be used")
+        return None
+    
+    compiled = from_artifact(artifact)
+    max_diff = verify_compiled(model, compiled)
+    print(f"✓ Compiled scores match sklearn (max probability difference {max_diff:.2e})")
+    
+    latency = compare_latency(model, compiled)
+    print(
+        f"  Single-row latency: sklearn {latency['sklearn_us']:.1f} µs, "
+        f"compiled {latency['compiled_us']:.2f} µs "
+        f"({latency['sklearn_us'] / latency['compiled_us']:.0f}x faster)"
+    )
+    
+    artifact["source_sha256"] = file_sha256(model_path)
+    path = compiled_model_path(model_path)
+    with open(path, "w") as f:
+        json.dump(artifact, f, indent=2)
+    print(f"✓ Compiled model saved to {path}")
+    
+    return path
+
+
+if __name__ == "__main__":
+    compile_model_file(sys.argv[1] if len(sys.argv) > 1 else "fraud_model.pkl")
@@ -0,0 +1,136 @@
+"""
+Versioned model registry.
+
+Layout (MODEL_REGISTRY_DIR, default ./model_registry):
+    ACTIVE                   # name of the version to serve
+    <version>/model.pkl
+    <version>/model.compiled.json   (when the model can be compiled)
+    <version>/metadata.json
+
+Usage:
+    python model_registry.py register fraud_model.pkl [--version v2] [--description "..."] [--activate]
+    python model_registry.py activate v2
+    python model_registry.py list
+"""
+import argparse
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import List, Optional
+
+from model_compiler import compile_model_file, file_sha256
+
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "model_registry")
+ACTIVE_FILE = "ACTIVE"
+MODEL_FILE = "model.pkl"
+METADATA_FILE = "metadata.json"
+
+
+def version_dir(version: str, registry_dir: str = MODEL_REGISTRY_DIR) -> str:
+    if not version or os.sep in version or version.startswith("."):
+        raise ValueError(f"Invalid model version '{version}'")
+    return os.path.join(registry_dir, version)
+
+
+def model_file(version: str, registry_dir: str = MODEL_REGISTRY_DIR) -> str:
+    return os.path.join(version_dir(version, registry_dir), MODEL_FILE)
+
+
+def get_metadata(version: str, registry_dir: str = MODEL_REGISTRY_DIR) -> dict:
+    with open(os.path.join(version_dir(version, registry_dir), METADATA_FILE)) as f:
+        return json.load(f)
+
+
+def list_versions(registry_dir: str = MODEL_REGISTRY_DIR) -> List[dict]:
+    """Metadata of every registered version, oldest first"""
+    if not os.path.isdir(registry_dir):
+        return []
+    versions = []
+    for name in os.listdir(registry_dir):
+        if os.path.exists(os.path.join(registry_dir, name, METADATA_FILE)):
+            versions.append(get_metadata(name, registry_dir))
+    return sorted(versions, key=lambda m: m["created_at"])
+
+
+def get_active_version(registry_dir: str = MODEL_REGISTRY_DIR) -> Optional[str]:
+    """Version named in the ACTIVE file, if the registry has one"""
+    path = os.path.join(registry_dir, ACTIVE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read().strip() or None
+
+
+def set_active_version(version: str, registry_dir: str = MODEL_REGISTRY_DIR) -> None:
+    """Point ACTIVE at a registered version (atomic rename, safe for watchers)"""
+    if not os.path.exists(model_file(version, registry_dir)):
+        raise ValueError(f"Model version '{version}' is not registered")
+    tmp_path = os.path.join(registry_dir, ACTIVE_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(registry_dir, ACTIVE_FILE))
+
+
+def register_model(
+    source_path: str,
+    version: Optional[str] = None,
+    description: str = "",
+    registry_dir: str = MODEL_REGISTRY_DIR
+) -> dict:
+    """Copy a trained model into the registry, compile it and write its metadata"""
+    version = version or datetime.utcnow().strftime("v%Y%m%d%H%M%S")
+    target_dir = version_dir(version, registry_dir)
+    if os.path.exists(target_dir):
+        raise ValueError(f"Model version '{version}' already exists")
+    
+    os.makedirs(target_dir)
+    target_model = os.path.join(target_dir, MODEL_FILE)
+    shutil.copyfile(source_path, target_model)
+    compiled_path = compile_model_file(target_model)
+    
+    metadata = {
+        "version": version,
+        "created_at": datetime.utcnow().isoformat(),
+        "source": os.path.abspath(source_path),
+        "sha256": file_sha256(target_model),
+        "compiled": compiled_path is not None,
+        "description": description,
+    }
+    with open(os.path.join(target_dir, METADATA_FILE), "w") as f:
+        json.dump(metadata, f, indent=2)
+    
+    return metadata
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the versioned fraud model registry")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    register = commands.add_parser("register", help="Add a trained model as a new version")
+    register.add_argument("model_path")
+    register.add_argument("--version")
+    register.add_argument("--description", default="")
+    register.add_argument("--activate", action="store_true")
+    
+    activate = commands.add_parser("activate", help="Serve a registered version")
+    activate.add_argument("version")
+    
+    commands.add_parser("list", help="List registered versions")
+    
+    args = parser.parse_args()
+    
+    if args.command == "register":
+        metadata = register_model(args.model_path, args.version, args.description)
+        print(f"✓ Registered model version {metadata['version']}")
+        if args.activate:
+            set_active_version(metadata["version"])
+            print(f"✓ Activated {metadata['version']}")
+    elif args.command == "activate":
+        set_active_version(args.version)
+        print(f"✓ Activated {args.version}")
+    else:
+        active = get_active_version()
+        for metadata in list_versions():
+            marker = "*" if metadata["version"] == active else " "
+            print(f"{marker} {metadata['version']:<20} {metadata['created_at']}  {metadata['description']}")
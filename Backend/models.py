@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Boolean, Column, Integer, String, Float, DateTime, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -46,6 +46,13 @@ class Transaction(Base):
     
     # Relationships
     user = relationship("User", back_populates="transactions", foreign_keys=[user_id])
+    
+    __table_args__ = (
+        # Per-user history in timestamp order; backs keyset pagination
+        Index("ix_transactions_user_timestamp_id", "user_id", "timestamp", "id"),
+        # Per-receiver history and first-seen time for the fan-in statistics
+        Index("ix_transactions_receiver_timestamp", "receiver_upi", "timestamp"),
+    )
 
 
 class FraudReport(Base):
@@ -59,3 +66,68 @@ class FraudReport(Base):
     
     # Relationships
     reporter = relationship("User", back_populates="fraud_reports")
+
+
+class UserSpendingStats(Base):
+    __tablename__ = "user_spending_stats"
+    
+    # Running aggregates over a user's transactions, maintained on insert
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    transaction_count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Float, nullable=False, default=0.0)
+    total_amount_squared = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class KnownReceiver(Base):
+    __tablename__ = "known_receivers"
+    
+    # One row per (user, payee) pair the user has paid before
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    receiver_upi = Column(String, primary_key=True)
+    first_seen_at = Column(DateTime, nullable=False)
+    last_seen_at = Column(DateTime, nullable=False)
+    transaction_count = Column(Integer, nullable=False, default=1)
+
+
+class UserCategorySpending(Base):
+    __tablename__ = "user_category_spending"
+    
+    # Rollup of a user's transactions per category, maintained on insert
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    category = Column(String, primary_key=True)
+    total_amount = Column(Float, nullable=False, default=0.0)
+    transaction_count = Column(Integer, nullable=False, default=0)
+
+
+class UserMonthlySpending(Base):
+    __tablename__ = "user_monthly_spending"
+    
+    # Rollup of a user's transactions per calendar month, maintained on insert
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True)
+    total_amount = Column(Float, nullable=False, default=0.0)
+    transaction_count = Column(Integer, nullable=False, default=0)
+
+
+class ImportCheckpoint(Base):
+    __tablename__ = "import_checkpoints"
+    
+    # Rows of a source file already imported; committed with each chunk
+    source = Column(String, primary_key=True)
+    rows_done = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    
+    # One row per (user, Idempotency-Key) sent to /create; committed with the transaction
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    key = Column(String, primary_key=True)
+    request_hash = Column(String, nullable=False)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=False)
+    response = Column(String, nullable=False)  # JSON TransactionResponse returned to retries
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
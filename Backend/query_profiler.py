@@ -0,0 +1,143 @@
+"""
+Per-request SQL query profiling.
+
+SQLAlchemy cursor events on both engines count and time every statement.
+With QUERY_PROFILING=true, QueryProfilerMiddleware attributes statements to
+the request that issued them (through a context variable), adds
+X-Query-Count and X-Query-Time-ms response headers, and logs requests that
+exceed QUERY_BUDGET_COUNT statements or QUERY_BUDGET_MS milliseconds
+together with the statements they ran.
+
+The headers cover statements issued before the response started; streaming
+bodies (the export endpoints) keep querying after that, and those
+statements are included in the budget check only.
+
+For tests, assert_max_queries counts every statement on the app's engines
+while its block runs, whichever thread issues them (profiling need not be on):
+
+    with assert_max_queries(6):
+        client.post("/api/create", headers=auth, json=payload)
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+QUERY_PROFILING = os.getenv("QUERY_PROFILING", "False").lower() == "true"
+QUERY_BUDGET_COUNT = int(os.getenv("QUERY_BUDGET_COUNT", "10"))
+QUERY_BUDGET_MS = float(os.getenv("QUERY_BUDGET_MS", "100"))
+
+
+class QueryProfile:
+    """Statements issued within one request or one assert_max_queries block"""
+    
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: List[Tuple[str, float]] = []
+    
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        self.statements.append((statement, seconds))
+    
+    def describe(self) -> str:
+        return "\n".join(
+            f"    {seconds * 1000:8.2f} ms  {' '.join(statement.split())[:300]}"
+            for statement, seconds in self.statements
+        )
+
+
+_current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("query_profile", default=None)
+# Profiles of active assert_max_queries blocks (see every statement, any thread)
+_captures: List[QueryProfile] = []
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.record(statement, elapsed)
+    for capture in _captures:
+        capture.record(statement, elapsed)
+
+
+def instrument(*engines) -> None:
+    """Attach the statement timers to sync or async engines (idempotent)"""
+    for engine in engines:
+        target = getattr(engine, "sync_engine", engine)
+        if not event.contains(target, "before_cursor_execute", _before_cursor_execute):
+            event.listen(target, "before_cursor_execute", _before_cursor_execute)
+            event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+
+class QueryProfilerMiddleware:
+    """ASGI middleware adding X-Query-Count / X-Query-Time-ms and logging over-budget requests"""
+    
+    def __init__(self, app, budget_count: int = QUERY_BUDGET_COUNT, budget_ms: float = QUERY_BUDGET_MS):
+        self.app = app
+        self.budget_count = budget_count
+        self.budget_ms = budget_ms
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        profile = QueryProfile()
+        token = _current_profile.set(profile)
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Query-Count", str(profile.count))
+                headers.append("X-Query-Time-ms", f"{profile.seconds * 1000:.2f}")
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            total_ms = profile.seconds * 1000
+            if profile.count > self.budget_count or total_ms > self.budget_ms:
+                print(
+                    f"⚠ Query budget exceeded: {scope['method']} {scope['path']} ran "
+                    f"{profile.count} statements in {total_ms:.2f} ms "
+                    f"(budget {self.budget_count} / {self.budget_ms:g} ms)\n{profile.describe()}"
+                )
+
+
+@contextmanager
+def count_queries():
+    """Collect every statement run on the app's engines during the block"""
+    from database import engine, async_engine
+    instrument(engine, async_engine)
+    
+    profile = QueryProfile()
+    _captures.append(profile)
+    try:
+        yield profile
+    finally:
+        _captures.remove(profile)
+
+
+@contextmanager
+def assert_max_queries(max_queries: int):
+    """Fail if the block runs more than max_queries statements, listing them"""
+    with count_queries() as profile:
+        yield profile
+    if profile.count > max_queries:
+        raise AssertionError(
+            f"Expected at most {max_queries} queries, ran {profile.count}:\n{profile.describe()}"
+        )
@@ -0,0 +1,365 @@
+"""
+Receiver-side (fan-in) statistics for money-mule detection.
+
+Mule UPI IDs collect from many unrelated senders in a short time, usually
+soon after they first appear. For every receiver the store keeps
+time-bucketed windows over the last hour (6 buckets of 10 minutes) and the
+last 24 hours (12 buckets of 2 hours) with:
+
+- distinct senders, as a 64-register HyperLogLog sketch per bucket (exact in
+  practice for a handful of senders, about 13% error for large counts)
+- payment count and inflow volume, as running totals
+
+and the time the receiver was first paid. Memory per receiver is bounded
+(at most 18 buckets of 64 bytes of registers) and receivers are evicted LRU
+beyond RECEIVER_STATS_MAX_RECEIVERS. A Bloom filter over every receiver ever
+paid tells brand-new receivers from established ones without a query.
+
+State is rebuilt at startup from the transactions table; an evicted
+receiver is reloaded through the (receiver_upi, timestamp) index on its next
+payment. With RECEIVER_STATS_REFRESH_SECONDS > 0 a receiver's state is also
+reloaded when it is older than that, so payments through other workers count.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from known_receivers import BloomFilter
+from models import Transaction
+from spending_stats import in_batches
+
+RECEIVER_STATS_MAX_RECEIVERS = int(os.getenv("RECEIVER_STATS_MAX_RECEIVERS", "200000"))
+RECEIVER_STATS_REFRESH_SECONDS = int(os.getenv("RECEIVER_STATS_REFRESH_SECONDS", "0"))
+# Receivers first paid within this many days count as recently seen
+RECEIVER_NEW_DAYS = int(os.getenv("RECEIVER_NEW_DAYS", "7"))
+# Expected number of distinct receivers, for sizing the Bloom filter
+RECEIVER_SEEN_CAPACITY = int(os.getenv("RECEIVER_SEEN_CAPACITY", "1000000"))
+
+# (name, window seconds, buckets)
+WINDOWS = (("1h", 3600, 6), ("24h", 86400, 12))
+HISTORY = timedelta(seconds=max(seconds for _, seconds, _ in WINDOWS))
+NEW_RECEIVER_AGE = timedelta(days=RECEIVER_NEW_DAYS)
+
+HLL_PRECISION = 6
+HLL_REGISTERS = 1 << HLL_PRECISION
+_HLL_ALPHA = 0.709  # bias correction for 64 registers
+_MASK64 = (1 << 64) - 1
+
+# first_seen for receivers paid before the tracked history, exact time unknown
+LONG_AGO = datetime.min
+
+
+class ReceiverSnapshot(NamedTuple):
+    """A receiver's inflow in each window before the payment being scored"""
+    senders_1h: int = 0
+    senders_24h: int = 0
+    payments_1h: int = 0
+    payments_24h: int = 0
+    inflow_1h: float = 0.0
+    inflow_24h: float = 0.0
+    recently_seen: bool = True
+
+
+NEW_RECEIVER_SNAPSHOT = ReceiverSnapshot()
+ESTABLISHED_RECEIVER_SNAPSHOT = ReceiverSnapshot(recently_seen=False)
+
+
+def _sender_register(sender_id: int) -> Tuple[int, int]:
+    """HyperLogLog (register, rank) for a sender, from a splitmix64 hash of the user id"""
+    z = (sender_id + 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    z ^= z >> 31
+    rest = z >> HLL_PRECISION
+    return z & (HLL_REGISTERS - 1), (64 - HLL_PRECISION) - rest.bit_length() + 1
+
+
+def _estimate(registers: bytearray) -> int:
+    """HyperLogLog cardinality estimate, with linear counting for small sets"""
+    zeros = registers.count(0)
+    if zeros == HLL_REGISTERS:
+        return 0
+    raw = _HLL_ALPHA * HLL_REGISTERS * HLL_REGISTERS / sum(2.0 ** -rank for rank in registers)
+    if raw <= 2.5 * HLL_REGISTERS and zeros:
+        return round(HLL_REGISTERS * math.log(HLL_REGISTERS / zeros))
+    return round(raw)
+
+
+class _FanInWindow:
+    """Time-bucketed payments, inflow and distinct-sender sketch over one window"""
+    
+    __slots__ = ("width", "size", "buckets", "oldest", "payments", "inflow", "registers", "_senders")
+    
+    def __init__(self, seconds: int, buckets: int):
+        self.width = seconds // buckets
+        self.size = buckets
+        # bucket index -> [payments, inflow, HLL registers]
+        self.buckets: Dict[int, list] = {}
+        self.oldest: Optional[int] = None
+        self.payments = 0
+        self.inflow = 0.0
+        # Union of the live buckets' sketches; cached estimate until it changes
+        self.registers = bytearray(HLL_REGISTERS)
+        self._senders: Optional[int] = 0
+    
+    def advance(self, index: int) -> None:
+        """Expire buckets that fall outside the window ending at bucket `index`"""
+        cutoff = index - self.size
+        if self.oldest is None or self.oldest > cutoff:
+            return
+        for expired in [i for i in self.buckets if i <= cutoff]:
+            payments, inflow, _ = self.buckets.pop(expired)
+            self.payments -= payments
+            self.inflow -= inflow
+        if self.buckets:
+            self.oldest = min(self.buckets)
+            # Sketches cannot be subtracted: re-merge the remaining buckets
+            registers = bytearray(HLL_REGISTERS)
+            for _, _, sketch in self.buckets.values():
+                registers = bytearray(map(max, registers, sketch))
+            self.registers = registers
+        else:
+            self.oldest = None
+            self.inflow = 0.0
+            self.registers = bytearray(HLL_REGISTERS)
+        self._senders = None
+    
+    def add(self, index: int, register: int, rank: int, amount: float, newest: int) -> None:
+        if index <= newest - self.size:
+            return  # already outside the window
+        bucket = self.buckets.get(index)
+        if bucket is None:
+            bucket = self.buckets[index] = [0, 0.0, bytearray(HLL_REGISTERS)]
+            if self.oldest is None or index < self.oldest:
+                self.oldest = index
+        bucket[0] += 1
+        bucket[1] += amount
+        self.payments += 1
+        self.inflow += amount
+        if rank > bucket[2][register]:
+            bucket[2][register] = rank
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+            self._senders = None
+    
+    def senders(self) -> int:
+        if self._senders is None:
+            self._senders = _estimate(self.registers)
+        return self._senders
+
+
+class ReceiverStats:
+    """All windows and the first-seen time for one receiver"""
+    
+    __slots__ = ("windows", "newest", "first_seen", "loaded_at")
+    
+    def __init__(self, first_seen: Optional[datetime] = None):
+        self.windows = [_FanInWindow(seconds, buckets) for _, seconds, buckets in WINDOWS]
+        self.newest = 0.0
+        # None until the first payment; LONG_AGO when paid before the tracked history
+        self.first_seen = first_seen
+        self.loaded_at = time.monotonic()
+    
+    def record(self, sender_id: int, amount: float, at: datetime) -> None:
+        seconds = at.timestamp()
+        self.newest = max(self.newest, seconds)
+        if self.first_seen is None or at < self.first_seen:
+            self.first_seen = at
+        register, rank = _sender_register(sender_id)
+        for window in self.windows:
+            newest_index = int(self.newest // window.width)
+            window.advance(newest_index)
+            window.add(int(seconds // window.width), register, rank, amount, newest_index)
+    
+    def snapshot(self, at: datetime) -> ReceiverSnapshot:
+        seconds = max(at.timestamp(), self.newest)
+        for window in self.windows:
+            window.advance(int(seconds // window.width))
+        one_hour, one_day = self.windows
+        return ReceiverSnapshot(
+            one_hour.senders(), one_day.senders(),
+            one_hour.payments, one_day.payments,
+            one_hour.inflow, one_day.inflow,
+            self.first_seen is None or at - self.first_seen < NEW_RECEIVER_AGE
+        )
+
+
+class ReceiverStatsStore:
+    def __init__(
+        self,
+        max_receivers: int = RECEIVER_STATS_MAX_RECEIVERS,
+        refresh_seconds: int = RECEIVER_STATS_REFRESH_SECONDS
+    ):
+        self.max_receivers = max_receivers
+        self.refresh_seconds = refresh_seconds
+        self._receivers: "OrderedDict[str, ReceiverStats]" = OrderedDict()
+        self._seen = BloomFilter(RECEIVER_SEEN_CAPACITY)
+        self._lock = threading.Lock()
+        # True while every receiver paid in the last 24 hours or first paid within
+        # RECEIVER_NEW_DAYS is in memory (after rebuild, before any eviction)
+        self._complete = False
+    
+    def __len__(self) -> int:
+        return len(self._receivers)
+    
+    def _put(self, receiver_upi: str, stats: ReceiverStats) -> None:
+        with self._lock:
+            self._receivers[receiver_upi] = stats
+            self._receivers.move_to_end(receiver_upi)
+            while len(self._receivers) > self.max_receivers:
+                self._receivers.popitem(last=False)
+                self._complete = False
+    
+    def _cached(self, receiver_upi: str) -> Optional[ReceiverStats]:
+        with self._lock:
+            stats = self._receivers.get(receiver_upi)
+            if stats is not None:
+                self._receivers.move_to_end(receiver_upi)
+            return stats
+    
+    def _is_stale(self, stats: ReceiverStats) -> bool:
+        return self.refresh_seconds > 0 and time.monotonic() - stats.loaded_at > self.refresh_seconds
+    
+    async def _load(self, db: AsyncSession, receiver_upi: str, at: datetime) -> ReceiverStats:
+        """Rebuild one receiver's state through the (receiver_upi, timestamp) index"""
+        first_seen = (await db.execute(
+            select(func.min(Transaction.timestamp)).where(Transaction.receiver_upi == receiver_upi)
+        )).scalar()
+        result = await db.execute(
+            select(Transaction.user_id, Transaction.amount, Transaction.timestamp)
+            .where(Transaction.receiver_upi == receiver_upi, Transaction.timestamp >= at - HISTORY)
+            .order_by(Transaction.timestamp, Transaction.id)
+        )
+        stats = ReceiverStats(first_seen)
+        for user_id, amount, timestamp in result.all():
+            stats.record(user_id, amount, timestamp)
+        self._put(receiver_upi, stats)
+        return stats
+    
+    async def get_snapshot(
+        self, db: AsyncSession, receiver_upi: str, at: Optional[datetime] = None
+    ) -> ReceiverSnapshot:
+        """The receiver's inflow in each window up to `at` (default now)"""
+        at = at or datetime.now()
+        stats = self._cached(receiver_upi)
+        if stats is None or self._is_stale(stats):
+            if stats is None and self._complete:
+                # Not paid recently: either never paid or established
+                with self._lock:
+                    seen = receiver_upi in self._seen
+                return ESTABLISHED_RECEIVER_SNAPSHOT if seen else NEW_RECEIVER_SNAPSHOT
+            stats = await self._load(db, receiver_upi, at)
+        with self._lock:
+            return stats.snapshot(at)
+    
+    async def get_snapshots(
+        self, db: AsyncSession, receiver_upis: Sequence[str], at: Optional[datetime] = None
+    ) -> Dict[str, ReceiverSnapshot]:
+        """Snapshots for many receivers at the same instant"""
+        at = at or datetime.now()
+        return {upi: await self.get_snapshot(db, upi, at) for upi in set(receiver_upis)}
+    
+    def record(self, receiver_upi: str, sender_id: int, amount: float, at: datetime) -> None:
+        """Add a committed payment to the receiver's windows"""
+        stats = self._cached(receiver_upi)
+        with self._lock:
+            complete = self._complete
+            if stats is None and complete:
+                # Not paid recently (the store holds every recent receiver)
+                stats = ReceiverStats(LONG_AGO if receiver_upi in self._seen else None)
+            self._seen.add(receiver_upi)
+        if stats is None:
+            # Evicted or never loaded: the next read reloads the receiver's
+            # windows from the table, including this payment
+            return
+        self._put(receiver_upi, stats)
+        with self._lock:
+            stats.record(sender_id, amount, at)
+    
+    def rebuild(self, db: Session, now: Optional[datetime] = None) -> int:
+        """Rebuild the Bloom filter and recent receivers' state from transactions"""
+        now = now or datetime.now()
+        stats: Dict[str, ReceiverStats] = {}
+        
+        # 1. Every receiver ever paid (covering scan of the receiver index)
+        first_seen_rows = db.execute(
+            select(Transaction.receiver_upi, func.min(Transaction.timestamp))
+            .group_by(Transaction.receiver_upi)
+        ).all()
+        seen = BloomFilter(max(RECEIVER_SEEN_CAPACITY, len(first_seen_rows) * 2))
+        for receiver_upi, first_seen in first_seen_rows:
+            seen.add(receiver_upi)
+            if first_seen is not None and now - first_seen < NEW_RECEIVER_AGE:
+                stats[receiver_upi] = ReceiverStats(first_seen)
+        
+        # 2. Windows from the last 24 hours
+        rows = db.execute(
+            select(Transaction.receiver_upi, Transaction.user_id, Transaction.amount, Transaction.timestamp)
+            .where(Transaction.timestamp >= now - HISTORY)
+            .order_by(Transaction.timestamp, Transaction.id)
+        ).all()
+        for receiver_upi, user_id, amount, timestamp in rows:
+            receiver = stats.get(receiver_upi)
+            if receiver is None:
+                # Paid recently but first seen long before
+                receiver = stats[receiver_upi] = ReceiverStats(LONG_AGO)
+            receiver.record(user_id, amount, timestamp)
+        
+        with self._lock:
+            self._seen = seen
+            self._receivers = OrderedDict(stats)
+            self._complete = len(stats) <= self.max_receivers
+            while len(self._receivers) > self.max_receivers:
+                self._receivers.popitem(last=False)
+        
+        return len(first_seen_rows)
+
+
+def load_receiver_history(
+    db: Session,
+    receiver_upis: Iterable[str],
+    since: datetime,
+    before_id: Optional[int] = None,
+    until: Optional[datetime] = None
+) -> Dict[str, ReceiverStats]:
+    """
+    Sync helper for bulk jobs that replay history in order: each receiver's
+    state from payments at or after `since` (and with id < before_id, and at
+    or before `until`), with its first-seen time from all earlier payments.
+    """
+    receiver_upis = set(receiver_upis)
+    stats = {}
+    for batch in in_batches(receiver_upis):
+        first_seen_query = select(Transaction.receiver_upi, func.min(Transaction.timestamp)).where(
+            Transaction.receiver_upi.in_(batch)
+        ).group_by(Transaction.receiver_upi)
+        rows_query = select(
+            Transaction.receiver_upi, Transaction.user_id, Transaction.amount, Transaction.timestamp
+        ).where(
+            Transaction.receiver_upi.in_(batch),
+            Transaction.timestamp >= since
+        ).order_by(Transaction.timestamp, Transaction.id)
+        if before_id is not None:
+            first_seen_query = first_seen_query.where(Transaction.id < before_id)
+            rows_query = rows_query.where(Transaction.id < before_id)
+        if until is not None:
+            first_seen_query = first_seen_query.where(Transaction.timestamp <= until)
+            rows_query = rows_query.where(Transaction.timestamp <= until)
+        
+        first_seen = dict(db.execute(first_seen_query).all())
+        stats.update((upi, ReceiverStats(first_seen.get(upi))) for upi in batch)
+        for receiver_upi, user_id, amount, timestamp in db.execute(rows_query).all():
+            stats[receiver_upi].record(user_id, amount, timestamp)
+    return stats
+
+
+# Global instance
+receiver_stats_store = ReceiverStatsStore()
@@ -0,0 +1,86 @@
+"""
+In-memory index of fraud report counts per reported UPI ID.
+
+Built once at startup, bumped in-process whenever a report is committed, and
+periodically reconciled against the fraud_reports table so that reports
+filed through other workers show up within one reconcile interval. Reports
+committed while a rebuild is reading the table are replayed onto the new
+counts unless the snapshot already includes them.
+"""
+import asyncio
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import FraudReport
+
+REPORT_INDEX_RECONCILE_SECONDS = int(os.getenv("REPORT_INDEX_RECONCILE_SECONDS", "60"))
+
+
+class FraudReportIndex:
+    def __init__(self):
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.is_loaded = False
+        # (reported_upi, report_id) of increments made while a rebuild is running
+        self._during_rebuild: Optional[List[Tuple[str, int]]] = None
+    
+    def rebuild(self, db: Session) -> int:
+        """Recompute all counts from the fraud_reports table and swap them in"""
+        with self._lock:
+            self._during_rebuild = []
+        try:
+            rows = db.query(
+                FraudReport.reported_upi,
+                func.count(FraudReport.id),
+                func.max(FraudReport.id)
+            ).group_by(FraudReport.reported_upi).all()
+            
+            counts = {upi: count for upi, count, _ in rows}
+            latest = {upi: max_id for upi, _, max_id in rows}
+            with self._lock:
+                # Replay reports committed during the query that the snapshot missed
+                for upi, report_id in self._during_rebuild:
+                    if report_id > latest.get(upi, 0):
+                        counts[upi] = counts.get(upi, 0) + 1
+                self._counts = counts
+                self.is_loaded = True
+        finally:
+            with self._lock:
+                self._during_rebuild = None
+        
+        return len(counts)
+    
+    def get(self, reported_upi: str) -> int:
+        """O(1) report count lookup"""
+        return self._counts.get(reported_upi, 0)
+    
+    def increment(self, reported_upi: str, report_id: int) -> None:
+        """Record a newly committed report"""
+        with self._lock:
+            self._counts[reported_upi] = self._counts.get(reported_upi, 0) + 1
+            if self._during_rebuild is not None:
+                self._during_rebuild.append((reported_upi, report_id))
+    
+    async def reconcile_forever(self, session_factory, interval: int = REPORT_INDEX_RECONCILE_SECONDS):
+        """Background task: rebuild the index from the table every `interval` seconds"""
+        def _rebuild():
+            db = session_factory()
+            try:
+                return self.rebuild(db)
+            finally:
+                db.close()
+        
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(_rebuild)
+            except Exception as e:
+                print(f"⚠ Fraud report index reconcile failed: {e}")
+
+
+# Global instance
+report_index = FraudReportIndex()
@@ -0,0 +1,266 @@
+"""
+Offline rescoring of stored transactions after a model or rule change.
+
+risk_score, is_flagged and fraud_reasons are frozen at /create time. This job
+splits the transactions table into id ranges and rescores the ranges in a
+process pool. Each worker reuses FraudDetectionService.score_features with one
+model call per batch, and writes changed rows back with executemany UPDATEs.
+
+Features are rebuilt as they were when each row was created: the stored
+amount, is_night and is_new_receiver, the user's average and velocity
+windows over their earlier transactions (by id), and the receiver's fan-in
+over earlier payments to it. Report counts are the current ones.
+
+Usage:
+    python rescore_transactions.py [--workers 4] [--version v2] [--dry-run]
+                                   [--range-size 20000] [--batch-size 2000]
+                                   [--max-rows-per-second 5000]
+
+--dry-run writes nothing and prints how the score distribution would change.
+--max-rows-per-second caps the combined rate of all workers so the live API
+keeps getting database time.
+"""
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, select, update
+
+from database import SessionLocal, init_db
+from fraud_detection import fraud_detector
+from models import Transaction
+from receiver_stats import HISTORY as RECEIVER_HISTORY, ReceiverStats, load_receiver_history
+from report_index import report_index
+from spending_stats import in_batches
+from velocity import HISTORY, UserVelocity, load_history
+
+DEFAULT_RANGE_SIZE = 20000
+DEFAULT_BATCH_SIZE = 2000
+FLAG_THRESHOLD = 70
+
+# Per-worker state, set up by _init_worker
+_worker = {}
+
+
+def _init_worker(version: Optional[str], batch_size: int, dry_run: bool, batch_interval: float) -> None:
+    """Load the model and report counts once per worker process"""
+    model = fraud_detector.load_version(version) if version else fraud_detector.active_model
+    db = SessionLocal()
+    try:
+        report_index.rebuild(db)
+    finally:
+        db.close()
+    _worker.update(model=model, batch_size=batch_size, dry_run=dry_run, batch_interval=batch_interval)
+
+
+def _bucket(score: int) -> str:
+    low = min(score // 10 * 10, 90)
+    return f"{low}-{low + 9 if low < 90 else 100}"
+
+
+def _prior_totals(db, user_ids, before_id: int) -> Dict[int, Tuple[int, float]]:
+    """(count, sum) of each user's transactions with id < before_id"""
+    totals = {}
+    for batch in in_batches(set(user_ids)):
+        rows = db.execute(
+            select(Transaction.user_id, func.count(Transaction.id), func.sum(Transaction.amount))
+            .where(Transaction.user_id.in_(batch), Transaction.id < before_id)
+            .group_by(Transaction.user_id)
+        ).all()
+        totals.update((user_id, (count, float(total))) for user_id, count, total in rows)
+    return totals
+
+
+def rescore_range(id_range: Tuple[int, int]) -> dict:
+    """Rescore transactions with start <= id < end. Returns counts for the summary."""
+    start, end = id_range
+    model = _worker["model"]
+    summary = {"rows": 0, "changed": 0, "newly_flagged": 0, "unflagged": 0, "old": Counter(), "new": Counter()}
+    totals: Dict[int, Tuple[int, float]] = {}
+    velocities: Dict[int, UserVelocity] = {}
+    receivers: Dict[str, ReceiverStats] = {}
+    
+    db = SessionLocal()
+    try:
+        last_id = start - 1
+        while True:
+            batch_started = time.perf_counter()
+            rows = db.execute(
+                select(
+                    Transaction.id, Transaction.user_id, Transaction.receiver_upi, Transaction.amount,
+                    Transaction.is_night, Transaction.is_new_receiver, Transaction.risk_score,
+                    Transaction.is_flagged, Transaction.fraud_reasons, Transaction.timestamp
+                )
+                .where(Transaction.id > last_id, Transaction.id < end)
+                .order_by(Transaction.id)
+                .limit(_worker["batch_size"])
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            
+            # Running totals for users first seen in this range start from their history
+            unseen = {row.user_id for row in rows} - set(totals)
+            if unseen:
+                priors = _prior_totals(db, unseen, start)
+                totals.update({user_id: priors.get(user_id, (0, 0.0)) for user_id in unseen})
+                since = min(row.timestamp for row in rows) - HISTORY
+                velocities.update(load_history(db, unseen, since, before_id=start))
+            
+            # ...and receivers' fan-in from payments before the range
+            unseen_receivers = {row.receiver_upi for row in rows} - set(receivers)
+            if unseen_receivers:
+                since = min(row.timestamp for row in rows) - RECEIVER_HISTORY
+                receivers.update(load_receiver_history(db, unseen_receivers, since, before_id=start))
+            
+            ml_scores = model.predict_many([row.amount for row in rows], [row.is_night for row in rows])
+            
+            updates = []
+            for row, ml_score in zip(rows, ml_scores):
+                count, total = totals[row.user_id]
+                velocity = velocities[row.user_id]
+                receiver = receivers[row.receiver_upi]
+                risk_score, reasons = fraud_detector.score_features(
+                    amount=row.amount,
+                    is_night=row.is_night,
+                    report_count=report_index.get(row.receiver_upi),
+                    is_new_receiver=row.is_new_receiver or 0,
+                    user_avg_amount=total / count if count > 0 else 0.0,
+                    ml_score=ml_score,
+                    velocity=velocity.snapshot(row.timestamp),
+                    receiver_stats=receiver.snapshot(row.timestamp)
+                )
+                totals[row.user_id] = (count + 1, total + row.amount)
+                velocity.record(row.receiver_upi, row.amount, row.timestamp)
+                receiver.record(row.user_id, row.amount, row.timestamp)
+                
+                is_flagged = risk_score >= FLAG_THRESHOLD
+                fraud_reasons = json.dumps(reasons) if reasons else None
+                summary["old"][_bucket(row.risk_score)] += 1
+                summary["new"][_bucket(risk_score)] += 1
+                if is_flagged and not row.is_flagged:
+                    summary["newly_flagged"] += 1
+                elif row.is_flagged and not is_flagged:
+                    summary["unflagged"] += 1
+                
+                if (risk_score, is_flagged, fraud_reasons) != (row.risk_score, bool(row.is_flagged), row.fraud_reasons):
+                    updates.append({
+                        "b_id": row.id, "b_risk_score": risk_score,
+                        "b_is_flagged": is_flagged, "b_fraud_reasons": fraud_reasons
+                    })
+            
+            summary["rows"] += len(rows)
+            summary["changed"] += len(updates)
+            
+            if updates and not _worker["dry_run"]:
+                table = Transaction.__table__
+                db.execute(
+                    update(table)
+                    .where(table.c.id == bindparam("b_id"))
+                    .values(
+                        risk_score=bindparam("b_risk_score"),
+                        is_flagged=bindparam("b_is_flagged"),
+                        fraud_reasons=bindparam("b_fraud_reasons")
+                    ),
+                    updates
+                )
+                db.commit()
+            
+            # Throttle: keep this worker under its share of --max-rows-per-second
+            elapsed = time.perf_counter() - batch_started
+            pause = _worker["batch_interval"] * len(rows) / _worker["batch_size"] - elapsed
+            if pause > 0:
+                time.sleep(pause)
+    finally:
+        db.close()
+    
+    return summary
+
+
+def split_ranges(db, range_size: int) -> List[Tuple[int, int]]:
+    """Split [min id, max id] into half-open ranges of range_size ids"""
+    low, high = db.execute(select(func.min(Transaction.id), func.max(Transaction.id))).one()
+    if low is None:
+        return []
+    return [(start, min(start + range_size, high + 1)) for start in range(low, high + 1, range_size)]
+
+
+def print_distribution(summary: dict, dry_run: bool) -> None:
+    print(f"\n{'Score':>8} {'Before':>10} {'After':>10} {'Change':>10}")
+    for low in range(0, 100, 10):
+        bucket = _bucket(low)
+        before, after = summary["old"][bucket], summary["new"][bucket]
+        print(f"{bucket:>8} {before:>10} {after:>10} {after - before:>+10}")
+    verb = "would change" if dry_run else "changed"
+    print(
+        f"\n{summary['changed']} of {summary['rows']} rows {verb}: "
+        f"{summary['newly_flagged']} newly flagged, {summary['unflagged']} no longer flagged"
+    )
+
+
+def rescore(
+    workers: int = 4,
+    version: Optional[str] = None,
+    dry_run: bool = False,
+    range_size: int = DEFAULT_RANGE_SIZE,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_rows_per_second: float = 0
+) -> dict:
+    """Rescore the whole table in a process pool and return the combined summary"""
+    db = SessionLocal()
+    try:
+        ranges = split_ranges(db, range_size)
+    finally:
+        db.close()
+    
+    # Each worker sleeps so that all of them together stay under the rate limit
+    batch_interval = batch_size * workers / max_rows_per_second if max_rows_per_second > 0 else 0.0
+    total = {"rows": 0, "changed": 0, "newly_flagged": 0, "unflagged": 0, "old": Counter(), "new": Counter()}
+    started = time.perf_counter()
+    
+    # spawn: every worker opens its own database connections
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(workers, initializer=_init_worker, initargs=(version, batch_size, dry_run, batch_interval)) as pool:
+        for done, summary in enumerate(pool.imap_unordered(rescore_range, ranges), start=1):
+            for key, value in summary.items():
+                total[key] += value
+            elapsed = time.perf_counter() - started
+            print(
+                f"✓ {done}/{len(ranges)} ranges, {total['rows']} rows, {total['changed']} changed "
+                f"({total['rows'] / elapsed:,.0f} rows/s)"
+            )
+    
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rescore stored transactions with the current model and rules")
+    parser.add_argument("--workers", type=int, default=4, help="Worker processes")
+    parser.add_argument("--version", help="Registered model version to score with (default: the active model)")
+    parser.add_argument("--dry-run", action="store_true", help="Report the score distribution change without writing")
+    parser.add_argument("--range-size", type=int, default=DEFAULT_RANGE_SIZE, help="Transaction ids per work unit")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per model call and UPDATE batch")
+    parser.add_argument("--max-rows-per-second", type=float, default=0, help="Combined rate limit for all workers (0 = unlimited)")
+    args = parser.parse_args()
+    
+    init_db()
+    if args.version:
+        try:
+            fraud_detector.load_version(args.version)
+        except ValueError as e:
+            print(f"✗ {e}")
+            sys.exit(1)
+    
+    summary = rescore(
+        workers=args.workers,
+        version=args.version,
+        dry_run=args.dry_run,
+        range_size=args.range_size,
+        batch_size=args.batch_size,
+        max_rows_per_second=args.max_rows_per_second
+    )
+    print_distribution(summary, args.dry_run)
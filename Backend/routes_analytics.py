@@ -1,44 +1,82 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
 from models import User
 from schemas import SpendingAnalytics
-from auth import get_current_user
-from analytics import analytics_service
+from auth import get_current_principal
+from analytics import analytics_service, analytics_cache
 
 # Removed the internal prefix to prevent double-routing issues
 router = APIRouter(tags=["Analytics"])
 
+
+async def serve_cached(request: Request, response: Response, db: AsyncSession, user_id: int, key: str, compute):
+    """
+    Answer from the per-user analytics cache with ETag / If-None-Match support.
+    An unchanged dashboard gets a 304 from the in-memory version alone.
+    """
+    version = await analytics_cache.get_version(db, user_id)
+    etag = analytics_cache.etag(user_id, key, version)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    response.headers.update(headers)
+    result = analytics_cache.get(user_id, key, version)
+    if result is None:
+        result = await compute()
+        analytics_cache.put(user_id, key, version, result)
+    
+    return result
+
+
 @router.get("/spending", response_model=SpendingAnalytics)
 async def get_spending_analytics(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get comprehensive spending analytics including total spent and breakdowns.
     """
-    return analytics_service.get_spending_analytics(db, current_user.id)
+    return await serve_cached(
+        request, response, db, current_user.id, "spending",
+        lambda: analytics_service.get_spending_analytics(db, current_user.id)
+    )
 
 
 @router.get("/charts/category", response_model=dict)
 async def get_category_chart(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get data formatted for the pie chart (category-wise spending).
     """
-    return analytics_service.get_category_chart_data(db, current_user.id)
+    return await serve_cached(
+        request, response, db, current_user.id, "category",
+        lambda: analytics_service.get_category_chart_data(db, current_user.id)
+    )
 
 
 @router.get("/charts/monthly", response_model=dict)
 async def get_monthly_chart(
+    request: Request,
+    response: Response,
     months: int = 6,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get data formatted for the bar chart (monthly spending).
     """
-    return analytics_service.get_monthly_chart_data(db, current_user.id, months)
\ No newline at end of file
+    return await serve_cached(
+        request, response, db, current_user.id, f"monthly-{months}",
+        lambda: analytics_service.get_monthly_chart_data(db, current_user.id, months)
+    )
\ No newline at end of file
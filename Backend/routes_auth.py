@@ -1,27 +1,30 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
-from database import get_db
+from database import get_db, write_lock
 from models import User
 from schemas import UserCreate, UserLogin, UserResponse, Token
 from auth import (
-    get_password_hash,
+    password_hasher,
     authenticate_user,
     create_access_token,
     get_current_user,
-    ACCESS_TOKEN_EXPIRE_MINUTES
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    TOKEN_EMBED_PRINCIPAL
 )
 
 # REMOVED the prefix here because it is already handled in main.py
 router = APIRouter(tags=["Authentication"])
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """Register a new user"""
     
     # Check if username already exists
-    existing_user = db.query(User).filter(User.username == user_data.username).first()
+    result = await db.execute(select(User.id).where(User.username == user_data.username))
+    existing_user = result.first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -29,7 +32,8 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Check if email already exists
-    existing_email = db.query(User).filter(User.email == user_data.email).first()
+    result = await db.execute(select(User.id).where(User.email == user_data.email))
+    existing_email = result.first()
     if existing_email:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -37,7 +41,8 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Check if UPI ID already exists
-    existing_upi = db.query(User).filter(User.upi_id == user_data.upi_id).first()
+    result = await db.execute(select(User.id).where(User.upi_id == user_data.upi_id))
+    existing_upi = result.first()
     if existing_upi:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -45,7 +50,7 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await password_hasher.hash(user_data.password)
     new_user = User(
         username=user_data.username,
         email=user_data.email,
@@ -55,16 +60,17 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    async with write_lock:
+        await db.commit()
+    await db.refresh(new_user)
     
     return new_user
 
 @router.post("/login", response_model=Token)
-def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
+async def login(user_credentials: UserLogin, db: AsyncSession = Depends(get_db)):
     """Login and get access token"""
     
-    user = authenticate_user(db, user_credentials.username, user_credentials.password)
+    user = await authenticate_user(db, user_credentials.username, user_credentials.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -73,8 +79,12 @@ def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
         )
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    claims = {"sub": user.username}
+    if TOKEN_EMBED_PRINCIPAL:
+        # Signed principal claims let the hot path skip the user lookup
+        claims.update({"uid": user.id, "upi": user.upi_id})
     access_token = create_access_token(
-        data={"sub": user.username},
+        data=claims,
         expires_delta=access_token_expires
     )
     
@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from database import get_db
+from database import get_db, write_lock
 from models import User, FraudReport
 from schemas import FraudReportCreate, FraudReportResponse
-from auth import get_current_user
+from auth import get_current_principal
+from report_index import report_index
 
 router = APIRouter(prefix="/fraud-reports", tags=["Fraud Reports"])
 
@@ -13,8 +15,8 @@ router = APIRouter(prefix="/fraud-reports", tags=["Fraud Reports"])
 @router.post("/", response_model=FraudReportResponse, status_code=status.HTTP_201_CREATED)
 async def report_fraud(
     report_data: FraudReportCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Report a suspicious UPI ID
@@ -29,10 +31,13 @@ async def report_fraud(
         )
     
     # Check if user already reported this UPI ID
-    existing_report = db.query(FraudReport).filter(
-        FraudReport.reporter_id == current_user.id,
-        FraudReport.reported_upi == report_data.reported_upi
-    ).first()
+    result = await db.execute(
+        select(FraudReport).where(
+            FraudReport.reporter_id == current_user.id,
+            FraudReport.reported_upi == report_data.reported_upi
+        )
+    )
+    existing_report = result.scalars().first()
     
     if existing_report:
         raise HTTPException(
@@ -48,39 +53,42 @@ async def report_fraud(
     )
     
     db.add(new_report)
-    db.commit()
-    db.refresh(new_report)
+    async with write_lock:
+        await db.commit()
+    await db.refresh(new_report)
+    
+    # Keep the scorer's in-memory count current without another query
+    report_index.increment(new_report.reported_upi, new_report.id)
     
     return new_report
 
 
 @router.get("/", response_model=List[FraudReportResponse])
 async def get_my_reports(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get all fraud reports submitted by the current user
     """
-    reports = db.query(FraudReport).filter(
-        FraudReport.reporter_id == current_user.id
-    ).order_by(FraudReport.created_at.desc()).all()
+    result = await db.execute(
+        select(FraudReport).where(
+            FraudReport.reporter_id == current_user.id
+        ).order_by(FraudReport.created_at.desc())
+    )
     
-    return reports
+    return result.scalars().all()
 
 
 @router.get("/upi/{upi_id}", response_model=dict)
 async def get_upi_report_count(
     upi_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_principal)
 ):
     """
     Get the number of reports for a specific UPI ID
     """
-    count = db.query(FraudReport).filter(
-        FraudReport.reported_upi == upi_id
-    ).count()
+    count = report_index.get(upi_id)
     
     risk_level = "Low"
     if count >= 5:
@@ -98,22 +106,22 @@ async def get_upi_report_count(
 @router.get("/top-reported/", response_model=List[dict])
 async def get_top_reported_upis(
     limit: int = 10,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get most reported UPI IDs (for awareness)
     """
-    from sqlalchemy import func
-    
-    results = db.query(
-        FraudReport.reported_upi,
-        func.count(FraudReport.id).label('report_count')
-    ).group_by(
-        FraudReport.reported_upi
-    ).order_by(
-        func.count(FraudReport.id).desc()
-    ).limit(limit).all()
+    results = (await db.execute(
+        select(
+            FraudReport.reported_upi,
+            func.count(FraudReport.id).label('report_count')
+        ).group_by(
+            FraudReport.reported_upi
+        ).order_by(
+            func.count(FraudReport.id).desc()
+        ).limit(limit)
+    )).all()
     
     return [
         {
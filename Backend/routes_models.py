@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from auth import require_admin
+from fraud_detection import fraud_detector
+from schemas import ModelReloadRequest
+import model_registry
+
+router = APIRouter(tags=["Models"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/", response_model=dict)
+async def list_models():
+    """
+    List registered model versions and the version currently serving
+    """
+    return {
+        "active_version": fraud_detector.model_version,
+        "registry_active_version": model_registry.get_active_version(),
+        "versions": model_registry.list_versions()
+    }
+
+
+@router.post("/reload", response_model=dict)
+async def reload_model(request: ModelReloadRequest):
+    """
+    Load a registered model version in the background, warm it up and swap it
+    in atomically. In-flight scoring keeps using the previous version.
+    """
+    try:
+        loaded = await fraud_detector.reload(request.version)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    return {"active_version": loaded.version}
@@ -1,27 +1,92 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
 from datetime import datetime
+import base64
+import csv
+import io
 import json
 
-from database import get_db
+from database import get_db, AsyncSessionLocal, write_lock
 from models import User, Transaction
 from schemas import (
     TransactionCreate,
     TransactionResponse,
-    FraudCheckResponse
+    FraudCheckResponse,
+    BatchFraudCheckRequest
 )
-from auth import get_current_user
+from auth import get_current_principal
 from fraud_detection import fraud_detector
+from model_batcher import model_batcher
+from spending_stats import record_transaction
+from known_receivers import known_receiver_index
+from analytics import analytics_cache
+from velocity import velocity_store
+from receiver_stats import receiver_stats_store
+from metrics import fraud_decisions
+from idempotency import IdempotencyConflict, idempotency_store, is_key_conflict, request_fingerprint
+from group_commit import group_commit_writer
 
 # Router tags for documentation grouping
 router = APIRouter(tags=["Transactions"])
 
+# Rows fetched per server-side chunk by the export endpoints
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FIELDS = [field for field in TransactionResponse.model_fields if field != "model_version"]
+
+def risk_level_for(risk_score: int, is_night: int) -> str:
+    """Map a risk score to the frontend's risk level"""
+    # --- ASSIGN RISK LEVEL (Strictly follows the 4 cases in FRONTEND.docx) ---
+    # Case 4: Pattern (Dark Red) - Large Amount + Night Transaction
+    if risk_score >= 85 and is_night == 1:
+        return "PATTERN"
+    # Case 3: High Risk (Red) - Very high risk score
+    elif risk_score >= 70:
+        return "HIGH"
+    # Case 2: Medium Risk (Orange) - Suspicious pattern detected
+    elif risk_score >= 35:
+        return "MEDIUM"
+    # Case 1: Safe (Green) - Low risk transaction
+    else:
+        return "SAFE"
+
+
+def build_fraud_check_response(
+    risk_score: int, reasons: List[str], is_night: int, model_version: str
+) -> FraudCheckResponse:
+    """Map a risk score to the frontend's risk level, flag and warning message"""
+    risk_level = risk_level_for(risk_score, is_night)
+    
+    # Determine flagging status and generate warning
+    is_flagged = risk_score >= 70
+    fraud_decisions.inc("predict", risk_level, "true" if is_flagged else "false")
+    warning_message = None
+    
+    if is_flagged:
+        warning_message = f"⚠️ Risk Score: {risk_score}/100. "
+        if reasons:
+            warning_message += f"Reasons: {', '.join(reasons)}"
+    else:
+        warning_message = f"Transaction Approved. Status: {risk_level}"
+    
+    return FraudCheckResponse(
+        risk_score=risk_score,
+        is_flagged=is_flagged,
+        risk_level=risk_level, 
+        reasons=reasons,
+        warning_message=warning_message,
+        model_version=model_version
+    )
+
+
 @router.post("/predict", response_model=FraudCheckResponse)
 async def check_fraud(
     transaction_data: TransactionCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Check fraud risk for a transaction BEFORE processing it.
@@ -36,66 +101,101 @@ async def check_fraud(
         is_night_actual = fraud_detector.determine_is_night(current_hour)
     
     # 2. Check historical context for the user
-    is_new_receiver = fraud_detector.check_is_new_receiver(
+    is_new_receiver = await fraud_detector.check_is_new_receiver(
         db, current_user.id, transaction_data.receiver_upi
     )
-    user_avg_amount = fraud_detector.get_user_avg_amount(db, current_user.id)
+    user_avg_amount = await fraud_detector.get_user_avg_amount(db, current_user.id)
+    velocity = await fraud_detector.get_velocity(db, current_user.id)
+    receiver_stats = await fraud_detector.get_receiver_stats(db, transaction_data.receiver_upi)
     
     # 3. Calculate dynamic risk score using the ML model
     # Passing the transaction_data.amount ensures the score shifts with user input.
+    # The model call is micro-batched with concurrent /predict requests.
+    model = fraud_detector.active_model
+    ml_score = await model_batcher.predict(model, transaction_data.amount, is_night_actual)
     risk_score, reasons = fraud_detector.calculate_risk_score(
         amount=transaction_data.amount,
         is_night=is_night_actual,
         receiver_upi=transaction_data.receiver_upi,
         is_new_receiver=is_new_receiver,
         user_avg_amount=user_avg_amount,
-        db=db
+        model=model,
+        velocity=velocity,
+        receiver_stats=receiver_stats,
+        ml_score=ml_score
     )
     
-    # 4. --- ASSIGN RISK LEVEL (Strictly follows the 4 cases in FRONTEND.docx) ---
-    # Case 4: Pattern (Dark Red) - Large Amount + Night Transaction
-    if risk_score >= 85 and is_night_actual == 1:
-        risk_level = "PATTERN"
-    # Case 3: High Risk (Red) - Very high risk score
-    elif risk_score >= 70:
-        risk_level = "HIGH"
-    # Case 2: Medium Risk (Orange) - Suspicious pattern detected
-    elif risk_score >= 35:
-        risk_level = "MEDIUM"
-    # Case 1: Safe (Green) - Low risk transaction
-    else:
-        risk_level = "SAFE"
-    
-    # 5. Determine flagging status and generate warning
-    is_flagged = risk_score >= 70
-    warning_message = None
-    
-    if is_flagged:
-        warning_message = f"⚠️ Risk Score: {risk_score}/100. "
-        if reasons:
-            warning_message += f"Reasons: {', '.join(reasons)}"
-    else:
-        warning_message = f"Transaction Approved. Status: {risk_level}"
+    # 4. Build the risk level and warning for the frontend
+    return build_fraud_check_response(risk_score, reasons, is_night_actual, model.version)
+
+
+@router.post("/predict/batch", response_model=List[FraudCheckResponse])
+async def check_fraud_batch(
+    batch: BatchFraudCheckRequest,
+    current_user: User = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Check fraud risk for many transactions in one call.
+    Features are fetched with set-based queries and the ML model runs once
+    for the whole batch; each result matches what /predict would return.
+    """
+    current_hour = datetime.now().hour
+    is_nights = [
+        (1 if txn.is_night else 0) if txn.is_night is not None
+        else fraud_detector.determine_is_night(current_hour)
+        for txn in batch.transactions
+    ]
     
-    # 6. Return response to Frontend
-    return FraudCheckResponse(
-        risk_score=risk_score,
-        is_flagged=is_flagged,
-        risk_level=risk_level, 
-        reasons=reasons,
-        warning_message=warning_message
+    model = fraud_detector.active_model
+    results = await fraud_detector.calculate_risk_scores_batch(
+        db,
+        user_ids=[current_user.id] * len(batch.transactions),
+        receiver_upis=[txn.receiver_upi for txn in batch.transactions],
+        amounts=[txn.amount for txn in batch.transactions],
+        is_nights=is_nights,
+        model=model
     )
+    
+    return [
+        build_fraud_check_response(risk_score, reasons, is_night, model.version)
+        for (risk_score, reasons), is_night in zip(results, is_nights)
+    ]
 
 
 @router.post("/create", response_model=TransactionResponse, status_code=status.HTTP_201_CREATED)
 async def create_transaction(
     transaction_data: TransactionCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255),
+    current_user: User = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Create a new transaction with fraud detection and save to database.
+    With an Idempotency-Key header, retries of the same request return the
+    original response instead of creating another transaction.
     """
+    if idempotency_key is None:
+        return await save_transaction(transaction_data, current_user, db)
+    
+    request_hash = request_fingerprint(transaction_data.model_dump(mode="json"))
+    result, replayed = await idempotency_store.execute(
+        db, current_user.id, idempotency_key, request_hash,
+        lambda: save_transaction(transaction_data, current_user, db, (idempotency_key, request_hash))
+    )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+
+async def save_transaction(
+    transaction_data: TransactionCreate,
+    current_user: User,
+    db: AsyncSession,
+    idempotency: Optional[Tuple[str, str]] = None
+) -> TransactionResponse:
+    """Score and insert one transaction. `idempotency` is (key, request_hash) to store with it."""
     
     # Prevent self-transactions
     if transaction_data.receiver_upi == current_user.upi_id:
@@ -109,80 +209,161 @@ async def create_transaction(
     current_hour = now.hour
     is_night = fraud_detector.determine_is_night(current_hour)
     
-    is_new_receiver = fraud_detector.check_is_new_receiver(
+    is_new_receiver = await fraud_detector.check_is_new_receiver(
         db, current_user.id, transaction_data.receiver_upi
     )
-    user_avg_amount = fraud_detector.get_user_avg_amount(db, current_user.id)
+    user_avg_amount = await fraud_detector.get_user_avg_amount(db, current_user.id)
+    velocity = await fraud_detector.get_velocity(db, current_user.id, now)
+    receiver_stats = await fraud_detector.get_receiver_stats(db, transaction_data.receiver_upi, now)
     
     # Calculate risk score for database entry
+    model = fraud_detector.active_model
     risk_score, reasons = fraud_detector.calculate_risk_score(
         amount=transaction_data.amount,
         is_night=is_night,
         receiver_upi=transaction_data.receiver_upi,
         is_new_receiver=is_new_receiver,
         user_avg_amount=user_avg_amount,
-        db=db
+        model=model,
+        velocity=velocity,
+        receiver_stats=receiver_stats
     )
     
     # Save transaction record
-    new_transaction = Transaction(
-        user_id=current_user.id,
-        receiver_upi=transaction_data.receiver_upi,
-        receiver_name=transaction_data.receiver_name,
-        amount=transaction_data.amount,
-        category=transaction_data.category or "Others",
-        description=transaction_data.description,
-        timestamp=now,
-        hour=current_hour,
-        is_night=is_night,
-        is_new_receiver=is_new_receiver,
-        risk_score=risk_score,
-        is_flagged=(risk_score >= 70),
-        fraud_reasons=json.dumps(reasons) if reasons else None,
-        status="completed"
-    )
+    def build_transaction() -> Transaction:
+        return Transaction(
+            user_id=current_user.id,
+            receiver_upi=transaction_data.receiver_upi,
+            receiver_name=transaction_data.receiver_name,
+            amount=transaction_data.amount,
+            category=transaction_data.category or "Others",
+            description=transaction_data.description,
+            timestamp=now,
+            hour=current_hour,
+            is_night=is_night,
+            is_new_receiver=is_new_receiver,
+            risk_score=risk_score,
+            is_flagged=(risk_score >= 70),
+            fraud_reasons=json.dumps(reasons) if reasons else None,
+            status="completed"
+        )
+    
+    async def write(session: AsyncSession) -> Transaction:
+        """Add the row and its side tables to `session` without committing"""
+        transaction = build_transaction()
+        session.add(transaction)
+        # Update the user's aggregates, rollups and payee list in the same commit
+        await record_transaction(
+            session, current_user.id, transaction_data.amount, transaction.category, now
+        )
+        await known_receiver_index.record(session, current_user.id, transaction_data.receiver_upi, now)
+        if idempotency is not None:
+            # The key row stores the response, so the id is needed before the commit
+            await session.flush()
+            await idempotency_store.stage(
+                session, current_user.id, *idempotency,
+                TransactionResponse.model_validate(transaction).model_copy(update={"model_version": model.version})
+            )
+        return transaction
     
     try:
-        db.add(new_transaction)
-        db.commit()
-        db.refresh(new_transaction)
-        return new_transaction
+        if group_commit_writer.running:
+            # Committed together with concurrent requests' writes. Return this
+            # request's connection first: the writer needs one from the same pool.
+            await db.close()
+            new_transaction = await group_commit_writer.submit(write)
+        else:
+            async with write_lock:
+                new_transaction = await write(db)
+                await db.commit()
+            await db.refresh(new_transaction)
+        known_receiver_index.remember(current_user.id, transaction_data.receiver_upi)
+        velocity_store.record(current_user.id, transaction_data.receiver_upi, transaction_data.amount, now)
+        receiver_stats_store.record(transaction_data.receiver_upi, current_user.id, transaction_data.amount, now)
+        analytics_cache.record_transaction(current_user.id)
+        fraud_decisions.inc(
+            "create", risk_level_for(risk_score, is_night), "true" if new_transaction.is_flagged else "false"
+        )
+        return TransactionResponse.model_validate(new_transaction).model_copy(
+            update={"model_version": model.version}
+        )
     except Exception as e:
-        db.rollback()  # Rollback on error to keep DB session clean
+        await db.rollback()  # Rollback on error to keep DB session clean
+        if idempotency is not None and isinstance(e, IntegrityError) and is_key_conflict(e):
+            raise IdempotencyConflict() from e
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Database error during creation: {str(e)}"
         )
 
 
+def encode_cursor(transaction: Transaction) -> str:
+    """Opaque keyset cursor for the position just after `transaction`"""
+    raw = json.dumps([transaction.timestamp.isoformat(), transaction.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, transaction_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(transaction_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
 @router.get("/", response_model=List[TransactionResponse])
 async def get_transactions(
+    response: Response,
     limit: int = 50,
     skip: int = 0,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get recent transaction history for the logged-in user.
+    Pass the X-Next-Cursor header of a page as `cursor` to fetch the next one;
+    cursor pages cost the same at any depth. `skip` is kept for older clients.
     """
-    return db.query(Transaction).filter(
+    query = select(Transaction).where(
         Transaction.user_id == current_user.id
-    ).order_by(Transaction.timestamp.desc()).offset(skip).limit(limit).all()
+    ).order_by(Transaction.timestamp.desc(), Transaction.id.desc())
+    
+    if cursor is not None:
+        # Keyset: seek past the last row of the previous page on the (user_id, timestamp, id) index
+        query = query.where(tuple_(Transaction.timestamp, Transaction.id) < decode_cursor(cursor))
+    else:
+        query = query.offset(skip)
+    
+    result = await db.execute(query.limit(limit))
+    transactions = result.scalars().all()
+    
+    if len(transactions) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(transactions[-1])
+    
+    return transactions
 
 
-@router.get("/{transaction_id}", response_model=TransactionResponse)
+@router.get("/{transaction_id:int}", response_model=TransactionResponse)
 async def get_transaction(
     transaction_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get details for a specific transaction by ID.
     """
-    transaction = db.query(Transaction).filter(
-        Transaction.id == transaction_id,
-        Transaction.user_id == current_user.id
-    ).first()
+    result = await db.execute(
+        select(Transaction).where(
+            Transaction.id == transaction_id,
+            Transaction.user_id == current_user.id
+        )
+    )
+    transaction = result.scalars().first()
     
     if not transaction:
         raise HTTPException(
@@ -195,13 +376,81 @@ async def get_transaction(
 
 @router.get("/flagged/all", response_model=List[TransactionResponse])
 async def get_flagged_transactions(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get all risky/flagged transactions for the user.
     """
-    return db.query(Transaction).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.is_flagged == True
-    ).order_by(Transaction.timestamp.desc()).all()
\ No newline at end of file
+    result = await db.execute(
+        select(Transaction).where(
+            Transaction.user_id == current_user.id,
+            Transaction.is_flagged == True
+        ).order_by(Transaction.timestamp.desc())
+    )
+    return result.scalars().all()
+
+
+async def stream_export(user_id: int, flagged_only: bool, export_format: str):
+    """
+    Yield an export chunk by chunk. Rows are read with yield_per through a
+    session owned by the generator, since the request's session is closed
+    before a StreamingResponse body is sent.
+    """
+    query = select(Transaction).where(Transaction.user_id == user_id)
+    if flagged_only:
+        query = query.where(Transaction.is_flagged == True)
+    query = query.order_by(
+        Transaction.timestamp.desc(), Transaction.id.desc()
+    ).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    
+    if export_format == "csv":
+        yield ",".join(EXPORT_FIELDS) + "\r\n"
+    
+    async with AsyncSessionLocal() as db:
+        result = await db.stream_scalars(query)
+        async for chunk in result.partitions():
+            rows = [
+                TransactionResponse.model_validate(txn).model_dump(mode="json", include=set(EXPORT_FIELDS))
+                for txn in chunk
+            ]
+            if export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+                writer.writerows(rows)
+                yield buffer.getvalue()
+            else:
+                yield "".join(json.dumps(row) + "\n" for row in rows)
+
+
+def export_response(user_id: int, flagged_only: bool, export_format: str, name: str) -> StreamingResponse:
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    extension = "csv" if export_format == "csv" else "ndjson"
+    return StreamingResponse(
+        stream_export(user_id, flagged_only, export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'}
+    )
+
+
+@router.get("/export/history")
+async def export_history(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_user: User = Depends(get_current_principal)
+):
+    """
+    Stream the user's full transaction history as NDJSON or CSV.
+    Memory stays flat regardless of history length.
+    """
+    return export_response(current_user.id, False, format, "transactions")
+
+
+@router.get("/export/flagged")
+async def export_flagged(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_user: User = Depends(get_current_principal)
+):
+    """
+    Stream the user's flagged transactions as NDJSON or CSV.
+    """
+    return export_response(current_user.id, True, format, "flagged_transactions")
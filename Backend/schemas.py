@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -59,9 +59,11 @@ class TransactionResponse(BaseModel):
     is_flagged: bool
     fraud_reasons: Optional[str]
     status: str
+    # Set on /create responses: the model version that scored this transaction
+    model_version: Optional[str] = None
     
-    class Config:
-        from_attributes = True
+    # model_version is a field, not pydantic's "model_" namespace
+    model_config = ConfigDict(from_attributes=True, protected_namespaces=())
 
 class FraudCheckResponse(BaseModel):
     risk_score: int
@@ -71,6 +73,18 @@ class FraudCheckResponse(BaseModel):
     risk_level: str 
     reasons: List[str]
     warning_message: Optional[str]
+    model_version: Optional[str] = None
+    
+    model_config = ConfigDict(protected_namespaces=())
+
+class BatchFraudCheckRequest(BaseModel):
+    # Bulk scoring for settlement files and replayed queues
+    transactions: List[TransactionCreate] = Field(..., min_length=1, max_length=1000)
+
+
+class ModelReloadRequest(BaseModel):
+    # Defaults to the registry's ACTIVE version
+    version: Optional[str] = None
 
 
 # --- Fraud Report Schemas ---
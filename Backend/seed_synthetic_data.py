@@ -0,0 +1,448 @@
+"""
+Synthetic data generator for capacity testing and benchmark datasets.
+
+Generates users, fraud reports and transaction history with NumPy and loads
+them with batched executemany inserts:
+
+- user activity is log-normally skewed (a few users make most payments)
+- most payments go to each user's handful of regular payees, the rest to a
+  Zipf-distributed pool of merchants, so payee popularity is heavily skewed
+- a small share of payments go to scam UPI IDs, whose report counts are also
+  Zipf-distributed (a few are reported hundreds of times)
+- amounts are log-normal per category and per user; a configurable share of
+  payments happen at night (22:00 - 06:00)
+
+Transactions are generated in time order, one slice of days (about
+--chunk-size rows) at a time: each slice is scored and inserted before the
+next is generated, so memory stays bounded at any row count. Hour, is_night,
+is_new_receiver, the velocity and receiver fan-in windows and the risk score
+are derived exactly as /api/create would derive them, with the windows
+computed over whole slices with NumPy. The spending aggregates, rollups and
+known_receivers tables are rebuilt at the end. The same --seed and
+--chunk-size always produce the same rows (only the bcrypt salt differs).
+
+Usage:
+    python seed_synthetic_data.py [--users 5000] [--transactions 1000000] [--reports 50000]
+                                  [--chunk-size 250000] [--seed 42] [--reset]
+
+Every generated user has the password "synthetic123".
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, insert, select, text
+
+from auth import get_password_hash
+from database import SessionLocal, engine, init_db
+from fraud_detection import fraud_detector
+from known_receivers import rebuild_known_receivers
+from models import Base, FraudReport, Transaction, User
+from receiver_stats import WINDOWS as RECEIVER_WINDOWS
+from receiver_stats import HLL_REGISTERS, NEW_RECEIVER_AGE, ReceiverSnapshot, _estimate, _sender_register
+from spending_stats import rebuild_user_stats
+from velocity import WINDOWS as VELOCITY_WINDOWS
+from velocity import VELOCITY_DISTINCT_CAP, VelocitySnapshot
+
+CATEGORIES = np.array(["Food", "Education", "Shopping", "Others"])
+CATEGORY_WEIGHTS = [0.4, 0.15, 0.3, 0.15]
+CATEGORY_MEDIAN_AMOUNTS = np.array([250.0, 2000.0, 1200.0, 600.0])
+DAY_HOURS = np.arange(7, 22)
+DAY_HOUR_WEIGHTS = np.array([1, 2, 3, 4, 4, 5, 5, 4, 4, 4, 5, 6, 6, 5, 3], dtype=float)
+NIGHT_HOURS = np.array([22, 23, 0, 1, 2, 3, 4, 5, 6])
+REPORT_REASONS = [
+    "Asked for OTP over phone call",
+    "Fake refund request via collect link",
+    "Item never delivered after payment",
+    "Impersonating customer support",
+    "Lottery prize scam requesting fee",
+]
+SYNTHETIC_PASSWORD = "synthetic123"
+
+
+def _merchant_upi(index: int) -> str:
+    return f"merchant{index}@okaxis"
+
+
+def _scam_upi(index: int) -> str:
+    return f"scam{index}@ybl"
+
+
+def insert_batches(table, columns: dict, batch_size: int, label: str) -> None:
+    """executemany-insert parallel column arrays in batches of batch_size rows"""
+    names = list(columns)
+    values = [column.tolist() if isinstance(column, np.ndarray) else column for column in columns.values()]
+    total = len(values[0])
+    started = time.perf_counter()
+    
+    with engine.begin() as conn:
+        for start in range(0, total, batch_size):
+            end = min(start + batch_size, total)
+            conn.execute(
+                insert(table),
+                [dict(zip(names, row)) for row in zip(*(column[start:end] for column in values))]
+            )
+            print(f"  {label}: {end:,}/{total:,} ({end / (time.perf_counter() - started):,.0f} rows/s)", end="\r")
+    print()
+
+
+def generate_users(users: int, created: datetime) -> None:
+    # One bcrypt hash shared by all users: hashing millions of passwords is not the point
+    hashed_password = get_password_hash(SYNTHETIC_PASSWORD)
+    ids = np.arange(1, users + 1)
+    insert_batches(User.__table__, {
+        "id": ids,
+        "username": [f"synth{i}" for i in ids],
+        "email": [f"synth{i}@example.com" for i in ids],
+        "hashed_password": [hashed_password] * users,
+        "upi_id": [f"synth{i}@paytm" for i in ids],
+        "phone": [f"+91{9000000000 + i}" for i in ids],
+        "created_at": [created] * users,
+    }, 10000, "users")
+    
+    if engine.dialect.name == "postgresql":
+        # Explicit ids bypass the serial sequence: move it past them so
+        # /api/auth/register doesn't hit a duplicate key afterwards
+        with engine.begin() as conn:
+            conn.execute(text("SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT max(id) FROM users))"))
+
+
+def generate_reports(rng, users: int, reports: int, scam_payees: int, merchants: int, days: int, end: datetime) -> dict:
+    """Insert fraud reports and return the report count per UPI ID"""
+    # Report volume per scam UPI follows Zipf: a few are reported hundreds of times
+    ranks = np.minimum(rng.zipf(1.5, reports), scam_payees) - 1
+    # ...and a small share of reports target ordinary merchants by mistake
+    mistaken = rng.random(reports) < 0.05
+    merchant_targets = rng.integers(0, merchants, reports)
+    reported = [
+        _merchant_upi(m) if wrong else _scam_upi(s)
+        for s, m, wrong in zip(ranks.tolist(), merchant_targets.tolist(), mistaken.tolist())
+    ]
+    created = np.datetime64(end) - rng.integers(0, days * 86400, reports).astype("timedelta64[s]")
+    
+    insert_batches(FraudReport.__table__, {
+        "reporter_id": rng.integers(1, users + 1, reports),
+        "reported_upi": reported,
+        "reason": [REPORT_REASONS[i] for i in rng.integers(0, len(REPORT_REASONS), reports).tolist()],
+        "created_at": created.astype("datetime64[us]").tolist(),
+    }, 50000, "fraud_reports")
+    
+    upis, counts = np.unique(np.array(reported), return_counts=True)
+    return dict(zip(upis.tolist(), counts.tolist()))
+
+
+class _Grouped:
+    """
+    Rows in time order regrouped by user or receiver (time order kept within
+    each group), with each row's sliding windows as runs of earlier rows.
+    """
+    
+    def __init__(self, group: np.ndarray, epoch: np.ndarray):
+        self.order = np.argsort(group, kind="stable")
+        self.group = group[self.order].astype(np.int64)
+        self.epoch = epoch[self.order]
+        self.position = np.arange(len(group))
+    
+    def window_start(self, seconds: int, buckets: int) -> np.ndarray:
+        """
+        First row of each row's window: rows start..position-1 are the group's
+        earlier rows in buckets the window has not expired yet.
+        """
+        key = (self.group << 32) | (self.epoch // (seconds // buckets))
+        return np.searchsorted(key, key - buckets, side="right")
+    
+    def counts(self, start: np.ndarray) -> np.ndarray:
+        return self.position - start
+    
+    def sums(self, values: np.ndarray, start: np.ndarray) -> np.ndarray:
+        totals = np.concatenate(([0], np.cumsum(values[self.order])))
+        return totals[self.position] - totals[start]
+    
+    def distinct(self, values: np.ndarray, start: np.ndarray) -> np.ndarray:
+        """Distinct values in each row's window"""
+        values = values[self.order]
+        # Previous row of the same group with the same value (-1 if none)
+        by_value = np.lexsort((self.position, values, self.group))
+        same = (self.group[by_value[1:]] == self.group[by_value[:-1]]) & (values[by_value[1:]] == values[by_value[:-1]])
+        previous = np.full(len(values), -1)
+        previous[by_value[1:]] = np.where(same, by_value[:-1], -1)
+        # A row in the window is a first occurrence unless its previous one is too
+        distinct = np.zeros(len(values), dtype=np.int64)
+        rows = self.position[self.position > start]
+        offset = 1
+        while len(rows):
+            members = rows - offset
+            distinct[rows] += previous[members] < start[rows]
+            offset += 1
+            rows = rows[rows - offset >= start[rows]]
+        return distinct
+    
+    def sketch_estimates(self, senders: np.ndarray, start: np.ndarray, rows: np.ndarray,
+                         register: np.ndarray, rank: np.ndarray) -> np.ndarray:
+        """HyperLogLog distinct-sender estimates for the windows of the given (grouped) rows"""
+        senders = senders[self.order]
+        estimates = np.zeros(len(rows), dtype=np.int64)
+        for i, (first, row) in enumerate(zip(start[rows].tolist(), rows.tolist())):
+            if first == row:
+                continue
+            sketch = np.zeros(HLL_REGISTERS, dtype=np.uint8)
+            window = senders[first:row]
+            np.maximum.at(sketch, register[window], rank[window])
+            estimates[i] = _estimate(bytearray(sketch))
+        return estimates
+    
+    def restore(self, values: np.ndarray) -> np.ndarray:
+        """Grouped order back to time order"""
+        restored = np.empty_like(values)
+        restored[self.order] = values
+        return restored
+
+
+def _epoch_seconds(start: datetime, seconds: np.ndarray) -> np.ndarray:
+    """datetime.timestamp() of start + seconds, which the windows bucket by (naive times are local)"""
+    hours, inverse = np.unique(seconds // 3600, return_inverse=True)
+    offsets = np.array([(start + timedelta(hours=hour)).timestamp() for hour in hours.tolist()], dtype=np.int64)
+    return offsets[inverse] + seconds % 3600
+
+
+def generate_transactions(
+    rng,
+    users: int,
+    transactions: int,
+    merchants: int,
+    scam_payees: int,
+    night_ratio: float,
+    scam_ratio: float,
+    days: int,
+    end: datetime,
+    report_counts: dict,
+    batch_size: int,
+    chunk_size: int
+) -> None:
+    """
+    Generate, score and insert transactions one slice of days at a time, so
+    memory is bounded by chunk_size rows plus the last 24 hours of payments.
+    """
+    start = end - timedelta(days=days)
+    payees = merchants + scam_payees
+    # Scam payees are numbered after the merchants
+    receiver_upis = np.array(
+        [_merchant_upi(i) for i in range(merchants)] + [_scam_upi(i) for i in range(scam_payees)]
+    )
+    receiver_names = np.array(
+        [f"Merchant {i}" for i in range(merchants)] + [f"Payee {i}" for i in range(scam_payees)]
+    )
+    report_count = np.array([report_counts.get(upi, 0) for upi in receiver_upis.tolist()])
+    register, rank = np.array([_sender_register(user_id) for user_id in range(1, users + 1)]).T
+    velocity_windows = [(seconds, buckets) for _, seconds, buckets in VELOCITY_WINDOWS]
+    receiver_windows = [(seconds, buckets) for _, seconds, buckets in RECEIVER_WINDOWS]
+    history = max(seconds for seconds, _ in velocity_windows + receiver_windows)
+    model = fraud_detector.active_model
+    
+    # Per user: log-normally skewed activity and spending scale
+    activity = rng.lognormal(0.0, 1.0, users)
+    activity /= activity.sum()
+    user_scale = rng.lognormal(0.0, 0.5, users)
+    
+    # Carried from slice to slice: (user, payee) pairs paid so far, running
+    # count and sum per user, first payment per payee (seconds after start,
+    # -1 if never paid) and the last 24 hours of payments for the windows
+    seen_pairs = np.empty(0, dtype=np.int64)
+    user_count = np.zeros(users, dtype=np.int64)
+    user_sum = np.zeros(users)
+    first_paid = np.full(payees, -1, dtype=np.int64)
+    recent = {"epoch": np.empty(0, dtype=np.int64), "user": np.empty(0, dtype=np.int64),
+              "payee": np.empty(0, dtype=np.int64), "cents": np.empty(0, dtype=np.int64)}
+    
+    slices = np.array_split(np.arange(days), min(days, max(1, -(-transactions // chunk_size))))
+    sizes = rng.multinomial(transactions, [len(s) / days for s in slices])
+    for number, (slice_days, n) in enumerate(zip(slices, sizes.tolist()), 1):
+        if not n:
+            continue
+        
+        # 1. Who pays
+        user_idx = rng.choice(users, n, p=activity)
+        
+        # 2. Whom: regular payees per user, a Zipf-skewed merchant pool, and scams
+        regular = (user_idx * 7919 + np.minimum(rng.zipf(2.0, n), 12)) % merchants
+        popular = (np.minimum(rng.zipf(1.3, n), merchants) - 1)
+        merchant = np.where(rng.random(n) < 0.7, regular, popular)
+        is_scam = rng.random(n) < scam_ratio
+        scam = np.minimum(rng.zipf(1.5, n), scam_payees) - 1
+        payee = np.where(is_scam, merchants + scam, merchant)
+        
+        # 3. How much: log-normal per category, scaled per user; scams skew high
+        category = rng.choice(len(CATEGORIES), n, p=CATEGORY_WEIGHTS)
+        amount = CATEGORY_MEDIAN_AMOUNTS[category] * user_scale[user_idx] * rng.lognormal(0.0, 0.9, n)
+        amount = np.round(np.where(is_scam, amount * 5, amount).clip(1, 200000), 2)
+        
+        # 4. When: a share at night, otherwise a daytime curve; then sort by time
+        night = rng.random(n) < night_ratio
+        hour = np.where(
+            night,
+            rng.choice(NIGHT_HOURS, n),
+            rng.choice(DAY_HOURS, n, p=DAY_HOUR_WEIGHTS / DAY_HOUR_WEIGHTS.sum())
+        )
+        day = rng.integers(slice_days[0], slice_days[-1] + 1, n)
+        seconds = (day * 86400 + hour * 3600 + rng.integers(0, 3600, n)).astype(np.int64)
+        order = np.argsort(seconds, kind="stable")
+        user_idx, payee, category, amount, hour, seconds = (
+            user_idx[order], payee[order], category[order], amount[order], hour[order], seconds[order]
+        )
+        timestamps = (np.datetime64(start, "s") + seconds.astype("timedelta64[s]")).astype("datetime64[us]")
+        
+        # 5. Features as /create derives them
+        is_night = ((hour >= 22) | (hour <= 6)).astype(int)
+        pair = user_idx.astype(np.int64) * payees + payee
+        pairs, first_index = np.unique(pair, return_index=True)
+        found = np.searchsorted(seen_pairs, pairs)
+        known = found < len(seen_pairs)
+        known[known] = seen_pairs[found[known]] == pairs[known]
+        is_new_receiver = np.zeros(n, dtype=int)
+        is_new_receiver[first_index[~known]] = 1
+        seen_pairs = np.union1d(seen_pairs, pairs)
+        
+        by_user = pd.Series(amount).groupby(user_idx)
+        prior_count = user_count[user_idx] + by_user.cumcount().to_numpy()
+        prior_sum = user_sum[user_idx] + by_user.cumsum().to_numpy() - amount
+        user_avg = np.divide(prior_sum, prior_count, out=np.zeros(n), where=prior_count > 0)
+        user_count += np.bincount(user_idx, minlength=users)
+        user_sum += np.bincount(user_idx, weights=amount, minlength=users)
+        
+        # 6. Velocity and fan-in windows over this slice plus the last 24 hours
+        #    before it, bucketed like the stores bucket them. Amounts are summed
+        #    in cents so the totals are exact.
+        epoch = _epoch_seconds(start, seconds)
+        window_rows = {
+            "epoch": np.concatenate((recent["epoch"], epoch)),
+            "user": np.concatenate((recent["user"], user_idx)),
+            "payee": np.concatenate((recent["payee"], payee)),
+            "cents": np.concatenate((recent["cents"], np.rint(amount * 100).astype(np.int64))),
+        }
+        carried = len(recent["epoch"])
+        
+        by_user = _Grouped(window_rows["user"], window_rows["epoch"])
+        velocity = []
+        starts = [by_user.window_start(*window) for window in velocity_windows]
+        velocity += [by_user.counts(s) for s in starts]
+        velocity += [by_user.sums(window_rows["cents"], s) / 100 for s in starts]
+        velocity += [np.minimum(by_user.distinct(window_rows["payee"], s), VELOCITY_DISTINCT_CAP) for s in starts]
+        velocity = [by_user.restore(column)[carried:].tolist() for column in velocity]
+        
+        by_receiver = _Grouped(window_rows["payee"], window_rows["epoch"])
+        starts = [by_receiver.window_start(*window) for window in receiver_windows]
+        payments = [by_receiver.restore(by_receiver.counts(s))[carried:] for s in starts]
+        inflow = [by_receiver.restore(by_receiver.sums(window_rows["cents"], s) / 100)[carried:] for s in starts]
+        
+        paid_before = first_paid[payee] >= 0
+        payees_here, first_in_slice = np.unique(payee, return_index=True)
+        new_payees = first_paid[payees_here] < 0
+        first_paid[payees_here[new_payees]] = seconds[first_in_slice[new_payees]]
+        first_row = np.zeros(n, dtype=bool)
+        first_row[first_in_slice] = True
+        recently_seen = (~paid_before & first_row) | (seconds - first_paid[payee] < NEW_RECEIVER_AGE.total_seconds())
+        
+        # Distinct senders only matter (and are only sketched) for recently seen receivers
+        senders = [np.zeros(n, dtype=np.int64) for _ in starts]
+        rows = np.flatnonzero(recently_seen & (payments[-1] > 0))
+        grouped_rows = np.empty(len(window_rows["epoch"]), dtype=np.int64)
+        grouped_rows[by_receiver.order] = by_receiver.position
+        grouped_rows = grouped_rows[carried + rows]
+        for column, s in zip(senders, starts):
+            column[rows] = by_receiver.sketch_estimates(window_rows["user"], s, grouped_rows, register, rank)
+        receiver = [column.tolist() for column in senders + payments + inflow] + [recently_seen.tolist()]
+        
+        keep = window_rows["epoch"] > epoch[-1] - history
+        recent = {name: column[keep] for name, column in window_rows.items()}
+        
+        # 7. Risk scores: one model call per slice, then the shared rule set per row
+        ml_scores = model.predict_many(amount, is_night)
+        risk_scores = []
+        fraud_reasons = []
+        for i, (amount_i, upi) in enumerate(zip(amount.tolist(), payee.tolist())):
+            risk_score, reasons = fraud_detector.score_features(
+                amount=amount_i,
+                is_night=is_night[i],
+                report_count=report_count[upi],
+                is_new_receiver=is_new_receiver[i],
+                user_avg_amount=user_avg[i],
+                ml_score=ml_scores[i],
+                velocity=VelocitySnapshot(*(column[i] for column in velocity)),
+                receiver_stats=ReceiverSnapshot(*(column[i] for column in receiver))
+            )
+            risk_scores.append(risk_score)
+            fraud_reasons.append(json.dumps(reasons) if reasons else None)
+        risk_scores = np.array(risk_scores)
+        
+        insert_batches(Transaction.__table__, {
+            "user_id": user_idx + 1,
+            "receiver_upi": receiver_upis[payee],
+            "receiver_name": receiver_names[payee],
+            "amount": amount,
+            "category": CATEGORIES[category],
+            "description": [None] * n,
+            "timestamp": timestamps,
+            "hour": hour,
+            "is_night": is_night,
+            "is_new_receiver": is_new_receiver,
+            "risk_score": risk_scores,
+            "is_flagged": risk_scores >= 70,
+            "fraud_reasons": fraud_reasons,
+            "status": ["completed"] * n,
+        }, batch_size, f"transactions {number}/{len(slices)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a reproducible synthetic dataset")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--transactions", type=int, default=1000000)
+    parser.add_argument("--reports", type=int, default=50000)
+    parser.add_argument("--merchants", type=int, default=20000, help="Size of the ordinary payee pool")
+    parser.add_argument("--scam-payees", type=int, default=500, help="Number of scam UPI IDs")
+    parser.add_argument("--scam-ratio", type=float, default=0.005, help="Share of payments to scam UPI IDs")
+    parser.add_argument("--night-ratio", type=float, default=0.08, help="Share of payments at night")
+    parser.add_argument("--days", type=int, default=365, help="History length in days")
+    parser.add_argument("--batch-size", type=int, default=50000, help="Rows per executemany insert")
+    parser.add_argument("--chunk-size", type=int, default=250000, help="Transactions generated and scored at a time")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="Drop and recreate all tables first")
+    args = parser.parse_args()
+    
+    if args.reset:
+        Base.metadata.drop_all(bind=engine)
+    init_db()
+    
+    with engine.connect() as conn:
+        if conn.execute(select(func.count(User.id))).scalar():
+            print("✗ Database already has users; use --reset to replace its contents")
+            sys.exit(1)
+    
+    rng = np.random.default_rng(args.seed)
+    # Fixed end date so the same seed gives identical timestamps on every run
+    end = datetime(2025, 1, 1)
+    started = time.perf_counter()
+    
+    generate_users(args.users, end - timedelta(days=args.days + 30))
+    report_counts = generate_reports(
+        rng, args.users, args.reports, args.scam_payees, args.merchants, args.days, end
+    )
+    generate_transactions(
+        rng, args.users, args.transactions, args.merchants, args.scam_payees,
+        args.night_ratio, args.scam_ratio, args.days, end, report_counts, args.batch_size, args.chunk_size
+    )
+    
+    db = SessionLocal()
+    try:
+        users = rebuild_user_stats(db)
+        pairs = rebuild_known_receivers(db)
+    finally:
+        db.close()
+    print(f"✓ Rebuilt spending rollups ({users} users) and known receivers ({pairs} pairs)")
+    
+    seconds = time.perf_counter() - started
+    total = args.users + args.reports + args.transactions
+    print(f"✓ Generated {total:,} rows in {seconds:.1f}s ({total / seconds:,.0f} rows/s)")
@@ -0,0 +1,408 @@
+"""
+Running per-user spending aggregates and rollups.
+
+- user_spending_stats: count, sum and sum of squares per user
+- user_category_spending: total and count per (user, category)
+- user_monthly_spending: total and count per (user, year, month)
+
+All three are updated in the same database transaction that inserts a
+Transaction, so averages, totals and the analytics breakdowns are indexed
+key lookups instead of AVG/SUM/GROUP BY scans over the user's history.
+
+Rebuild from the transactions table, or check the rollups against it:
+    python spending_stats.py rebuild
+    python spending_stats.py check
+"""
+import math
+import sys
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, desc, extract, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import Transaction, UserSpendingStats, UserCategorySpending, UserMonthlySpending
+
+
+UPSERT_INSERTS = {"sqlite": sqlite_insert, "postgresql": pg_insert}
+
+# Values per IN (...) list in bulk queries: SQLite limits the bound parameters
+# per statement (999 before 3.32), and a statement may hold two such lists
+IN_LIST_BATCH = 400
+
+
+def in_batches(values: Iterable, size: int = IN_LIST_BATCH) -> Iterator[list]:
+    """Split values into lists small enough for one IN (...) clause"""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def upsert_insert(db: AsyncSession, table):
+    """
+    INSERT for `table` that supports ON CONFLICT DO UPDATE on this session's
+    backend, or None when the backend has no such clause.
+    """
+    factory = UPSERT_INSERTS.get(db.bind.dialect.name)
+    return factory(table) if factory is not None else None
+
+
+async def _increment(db: AsyncSession, model, key: dict, amount: float, **extra) -> None:
+    """Add one transaction of `amount` to the rollup row at `key`, creating it if needed"""
+    table = model.__table__
+    
+    statement = upsert_insert(db, table)
+    if statement is not None:
+        # One atomic statement: concurrent first transactions for a key can't both insert
+        statement = statement.values(**key, transaction_count=1, total_amount=amount, **extra)
+        values = {
+            column: table.c[column] + statement.excluded[column]
+            for column in ("transaction_count", "total_amount", *extra)
+        }
+        if "updated_at" in table.c:
+            values["updated_at"] = datetime.utcnow()  # onupdate is not applied to ON CONFLICT
+        await db.execute(statement.on_conflict_do_update(index_elements=list(key), set_=values))
+        return
+    
+    values = {
+        "transaction_count": model.transaction_count + 1,
+        "total_amount": model.total_amount + amount,
+    }
+    for column, delta in extra.items():
+        values[column] = getattr(model, column) + delta
+    
+    result = await db.execute(
+        update(model)
+        .where(*(getattr(model, column) == value for column, value in key.items()))
+        .values(**values)
+    )
+    
+    if result.rowcount == 0:
+        db.add(model(**key, transaction_count=1, total_amount=amount, **extra))
+
+
+async def record_transaction(
+    db: AsyncSession,
+    user_id: int,
+    amount: float,
+    category: Optional[str],
+    timestamp: datetime
+) -> None:
+    """
+    Add one transaction to the user's aggregates and rollups. Does not commit:
+    call it before the commit that inserts the Transaction so all land together.
+    """
+    await _increment(
+        db, UserSpendingStats, {"user_id": user_id}, amount,
+        total_amount_squared=amount * amount
+    )
+    if category is not None:
+        await _increment(
+            db, UserCategorySpending, {"user_id": user_id, "category": category}, amount
+        )
+    await _increment(
+        db, UserMonthlySpending,
+        {"user_id": user_id, "year": timestamp.year, "month": timestamp.month}, amount
+    )
+
+
+def _bulk_increment(db: Session, model, key_columns: Sequence[str], deltas: Dict[tuple, dict]) -> None:
+    """
+    Set-based _increment for bulk loads: add each key's deltas to its rollup
+    row with one executemany UPDATE, and insert the keys that have no row yet.
+    """
+    if not deltas:
+        return
+    
+    table = model.__table__
+    existing = set()
+    for batch in in_batches({key[0] for key in deltas}):
+        existing.update(
+            tuple(row) for row in db.execute(
+                select(*(table.c[column] for column in key_columns))
+                .where(table.c[key_columns[0]].in_(batch))
+            ).all()
+        )
+    delta_columns = list(next(iter(deltas.values())))
+    
+    updates = [
+        {
+            **{f"k_{column}": value for column, value in zip(key_columns, key)},
+            **{f"d_{column}": delta for column, delta in values.items()}
+        }
+        for key, values in deltas.items() if key in existing
+    ]
+    inserts = [
+        {**dict(zip(key_columns, key)), **values}
+        for key, values in deltas.items() if key not in existing
+    ]
+    
+    if updates:
+        db.execute(
+            update(table)
+            .where(*(table.c[column] == bindparam(f"k_{column}") for column in key_columns))
+            .values({column: table.c[column] + bindparam(f"d_{column}") for column in delta_columns}),
+            updates
+        )
+    if inserts:
+        db.execute(insert(table), inserts)
+
+
+def record_transactions_bulk(
+    db: Session,
+    user_ids: Sequence[int],
+    amounts: Sequence[float],
+    categories: Sequence[Optional[str]],
+    timestamps: Sequence[datetime]
+) -> None:
+    """
+    Sync counterpart of record_transaction for many rows at once (bulk import).
+    Does not commit: call it in the transaction that inserts the rows.
+    """
+    totals: Dict[tuple, dict] = {}
+    by_category: Dict[tuple, dict] = {}
+    by_month: Dict[tuple, dict] = {}
+    
+    def add(rollup, key, amount, **extra):
+        values = rollup.setdefault(key, {"transaction_count": 0, "total_amount": 0.0, **{column: 0.0 for column in extra}})
+        values["transaction_count"] += 1
+        values["total_amount"] += amount
+        for column, delta in extra.items():
+            values[column] += delta
+    
+    for user_id, amount, category, timestamp in zip(user_ids, amounts, categories, timestamps):
+        add(totals, (user_id,), amount, total_amount_squared=amount * amount)
+        if category is not None:
+            add(by_category, (user_id, category), amount)
+        add(by_month, (user_id, timestamp.year, timestamp.month), amount)
+    
+    _bulk_increment(db, UserSpendingStats, ["user_id"], totals)
+    _bulk_increment(db, UserCategorySpending, ["user_id", "category"], by_category)
+    _bulk_increment(db, UserMonthlySpending, ["user_id", "year", "month"], by_month)
+
+
+def load_users_totals(db: Session, user_ids: Iterable[int]) -> Dict[int, Tuple[int, float]]:
+    """Sync (count, sum) lookup for many users, for bulk jobs outside the request path"""
+    totals = {}
+    for batch in in_batches(set(user_ids)):
+        rows = db.execute(
+            select(
+                UserSpendingStats.user_id,
+                UserSpendingStats.transaction_count,
+                UserSpendingStats.total_amount
+            ).where(UserSpendingStats.user_id.in_(batch))
+        ).all()
+        totals.update((user_id, (count, total)) for user_id, count, total in rows)
+    
+    return totals
+
+
+async def get_user_stats(db: AsyncSession, user_id: int) -> Tuple[int, float, float]:
+    """Get (count, sum, sum of squares) for a user"""
+    stats = await db.get(UserSpendingStats, user_id)
+    if stats is None:
+        return 0, 0.0, 0.0
+    return stats.transaction_count, stats.total_amount, stats.total_amount_squared
+
+
+async def get_users_stats(db: AsyncSession, user_ids: Sequence[int]) -> Dict[int, Tuple[int, float, float]]:
+    """Get (count, sum, sum of squares) for many users in one query"""
+    result = await db.execute(
+        select(
+            UserSpendingStats.user_id,
+            UserSpendingStats.transaction_count,
+            UserSpendingStats.total_amount,
+            UserSpendingStats.total_amount_squared
+        ).where(UserSpendingStats.user_id.in_(set(user_ids)))
+    )
+    rows = result.all()
+    
+    return {user_id: (count, total, total_sq) for user_id, count, total, total_sq in rows}
+
+
+async def get_category_rollup(db: AsyncSession, user_id: int) -> List[Tuple[str, float, int]]:
+    """(category, total, count) rows for a user, ordered by category"""
+    result = await db.execute(
+        select(
+            UserCategorySpending.category,
+            UserCategorySpending.total_amount,
+            UserCategorySpending.transaction_count
+        ).where(
+            UserCategorySpending.user_id == user_id
+        ).order_by(UserCategorySpending.category)
+    )
+    return result.all()
+
+
+async def get_monthly_rollup(db: AsyncSession, user_id: int, months: int) -> List[Tuple[int, int, float, int]]:
+    """(year, month, total, count) rows for the user's latest `months` months, newest first"""
+    result = await db.execute(
+        select(
+            UserMonthlySpending.year,
+            UserMonthlySpending.month,
+            UserMonthlySpending.total_amount,
+            UserMonthlySpending.transaction_count
+        ).where(
+            UserMonthlySpending.user_id == user_id
+        ).order_by(
+            desc(UserMonthlySpending.year), desc(UserMonthlySpending.month)
+        ).limit(months)
+    )
+    return result.all()
+
+
+def mean_amount(count: int, total: float) -> float:
+    """Average transaction amount from running aggregates"""
+    return total / count if count > 0 else 0.0
+
+
+def std_amount(count: int, total: float, total_squared: float) -> float:
+    """Population standard deviation of transaction amounts from running aggregates"""
+    if count == 0:
+        return 0.0
+    mean = total / count
+    return math.sqrt(max(total_squared / count - mean * mean, 0.0))
+
+
+def _category_source():
+    return select(
+        Transaction.user_id,
+        Transaction.category,
+        func.sum(Transaction.amount),
+        func.count(Transaction.id)
+    ).where(
+        Transaction.category.isnot(None)
+    ).group_by(Transaction.user_id, Transaction.category)
+
+
+def _monthly_source():
+    year = extract('year', Transaction.timestamp)
+    month = extract('month', Transaction.timestamp)
+    return select(
+        Transaction.user_id,
+        year,
+        month,
+        func.sum(Transaction.amount),
+        func.count(Transaction.id)
+    ).group_by(Transaction.user_id, year, month)
+
+
+def rebuild_user_stats(db: Session) -> int:
+    """Recompute every user's aggregates and rollups from the transactions table"""
+    db.query(UserSpendingStats).delete()
+    db.query(UserCategorySpending).delete()
+    db.query(UserMonthlySpending).delete()
+    db.execute(
+        insert(UserSpendingStats).from_select(
+            ["user_id", "transaction_count", "total_amount", "total_amount_squared"],
+            select(
+                Transaction.user_id,
+                func.count(Transaction.id),
+                func.sum(Transaction.amount),
+                func.sum(Transaction.amount * Transaction.amount)
+            ).group_by(Transaction.user_id)
+        )
+    )
+    db.execute(
+        insert(UserCategorySpending).from_select(
+            ["user_id", "category", "total_amount", "transaction_count"],
+            _category_source()
+        )
+    )
+    db.execute(
+        insert(UserMonthlySpending).from_select(
+            ["user_id", "year", "month", "total_amount", "transaction_count"],
+            _monthly_source()
+        )
+    )
+    db.commit()
+    
+    return db.query(UserSpendingStats).count()
+
+
+def check_user_stats(db: Session, tolerance: float = 1e-6) -> List[str]:
+    """
+    Compare the aggregates and rollups with a fresh GROUP BY over transactions.
+    Returns a description of every mismatching key (empty when consistent).
+    """
+    def compare(name, expected, actual):
+        problems = []
+        for key in sorted(set(expected) | set(actual), key=str):
+            want = expected.get(key, (0, 0.0))
+            have = actual.get(key, (0, 0.0))
+            if want[0] != have[0] or abs(want[1] - have[1]) > tolerance * max(1.0, abs(want[1])):
+                problems.append(f"{name} {key}: expected count={want[0]} total={want[1]}, found count={have[0]} total={have[1]}")
+        return problems
+    
+    expected_totals = {
+        (user_id,): (count, float(total))
+        for user_id, count, total in db.query(
+            Transaction.user_id, func.count(Transaction.id), func.sum(Transaction.amount)
+        ).group_by(Transaction.user_id).all()
+    }
+    actual_totals = {
+        (row.user_id,): (row.transaction_count, row.total_amount)
+        for row in db.query(UserSpendingStats).all()
+    }
+    
+    expected_categories = {
+        (user_id, category): (count, float(total))
+        for user_id, category, total, count in db.execute(_category_source()).all()
+    }
+    actual_categories = {
+        (row.user_id, row.category): (row.transaction_count, row.total_amount)
+        for row in db.query(UserCategorySpending).all()
+    }
+    
+    expected_months = {
+        (user_id, int(year), int(month)): (count, float(total))
+        for user_id, year, month, total, count in db.execute(_monthly_source()).all()
+    }
+    actual_months = {
+        (row.user_id, row.year, row.month): (row.transaction_count, row.total_amount)
+        for row in db.query(UserMonthlySpending).all()
+    }
+    
+    return (
+        compare("user_spending_stats", expected_totals, actual_totals)
+        + compare("user_category_spending", expected_categories, actual_categories)
+        + compare("user_monthly_spending", expected_months, actual_months)
+    )
+
+
+def needs_backfill(db: Session) -> bool:
+    """True when transactions exist but an aggregate or rollup table has not been built yet"""
+    if db.query(Transaction.id).first() is None:
+        return False
+    return any(
+        db.query(model.user_id).first() is None
+        for model in (UserSpendingStats, UserCategorySpending, UserMonthlySpending)
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ("rebuild", "check"):
+        print("Usage: python spending_stats.py rebuild|check")
+        sys.exit(1)
+    
+    from database import SessionLocal, init_db
+    
+    init_db()
+    db = SessionLocal()
+    try:
+        if sys.argv[1] == "rebuild":
+            users = rebuild_user_stats(db)
+            print(f"✓ Rebuilt spending aggregates and rollups for {users} users")
+        else:
+            problems = check_user_stats(db)
+            for problem in problems:
+                print(f"✗ {problem}")
+            if problems:
+                print(f"⚠ {len(problems)} inconsistent rollup rows; run 'python spending_stats.py rebuild'")
+                sys.exit(1)
+            print("✓ Spending aggregates and rollups match the transactions table")
+    finally:
+        db.close()
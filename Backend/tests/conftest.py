@@ -0,0 +1,45 @@
+"""
+Shared pytest setup. Run from Backend/:
+
+    python -m pytest tests
+"""
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app modules live one level up and are imported as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Never touch the developer's database: engines are created at import time
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='fraud_tests_'), 'test.db')}"
+
+_usernames = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def client():
+    """TestClient over the real app, with its startup and shutdown hooks"""
+    from fastapi.testclient import TestClient
+    from main import app
+    
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def register_user(client):
+    """Factory: register and log in a fresh user, returning (upi_id, auth headers)"""
+    def register():
+        username = f"tester{next(_usernames)}"
+        response = client.post("/api/auth/register", json={
+            "username": username, "email": f"{username}@example.com", "password": "testpass123",
+            "upi_id": f"{username}@paytm", "phone": "+919876543210"
+        })
+        assert response.status_code == 201, response.text
+        response = client.post("/api/auth/login", json={"username": username, "password": "testpass123"})
+        assert response.status_code == 200, response.text
+        return f"{username}@paytm", {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return register
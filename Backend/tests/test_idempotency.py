@@ -0,0 +1,58 @@
+"""Concurrent requests sharing an Idempotency-Key"""
+import asyncio
+
+from idempotency import IdempotencyStore
+from schemas import TransactionResponse
+
+
+class _NoStoredKeys:
+    """Stands in for the session: no idempotency_keys row exists yet"""
+    
+    async def get(self, model, key):
+        return None
+
+
+def _run_pair(cancel_first: bool):
+    store = IdempotencyStore()
+    db = _NoStoredKeys()
+    response = TransactionResponse.model_construct(id=1)
+    calls = []
+    first_started = asyncio.Event()
+    
+    async def first_create():
+        calls.append("first")
+        first_started.set()
+        await asyncio.sleep(0.05)
+        return response
+    
+    async def retry_create():
+        calls.append("retry")
+        return response
+    
+    async def main():
+        first = asyncio.create_task(store.execute(db, 1, "key-1", "hash", first_create))
+        await first_started.wait()
+        retry = asyncio.create_task(store.execute(db, 1, "key-1", "hash", retry_create))
+        await asyncio.sleep(0.01)  # the retry is now waiting on the first request
+        if cancel_first:
+            first.cancel()
+        return await asyncio.gather(first, retry, return_exceptions=True)
+    
+    return asyncio.run(main()), calls, response
+
+
+def test_retry_waits_for_first_request_and_replays_it():
+    (first, retry), calls, response = _run_pair(cancel_first=False)
+    
+    assert first == (response, False)
+    assert retry == (response, True)
+    assert calls == ["first"]
+
+
+def test_cancelled_first_request_does_not_cancel_the_retry():
+    (first, retry), calls, response = _run_pair(cancel_first=True)
+    
+    assert isinstance(first, asyncio.CancelledError)
+    # The retry found nothing stored, so it ran the request itself
+    assert retry == (response, False)
+    assert calls == ["first", "retry"]
@@ -0,0 +1,44 @@
+"""Known-receiver cache vs payees recorded by other workers"""
+import asyncio
+import os
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from database import SessionLocal
+from known_receivers import KnownReceiverIndex
+from models import KnownReceiver
+
+
+def test_payee_recorded_elsewhere_is_known_despite_cached_miss(client, register_user):
+    _, headers = register_user()
+    user_id = client.get("/api/auth/me", headers=headers).json()["id"]
+    index = KnownReceiverIndex()  # this worker's cache
+    engine = create_async_engine(os.environ["DATABASE_URL"].replace("sqlite://", "sqlite+aiosqlite://"))
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    
+    async def lookups():
+        async with session_factory() as db:
+            before = await index.is_known(db, user_id, "shop@okaxis")
+            before_batch = await index.known_pairs(db, [user_id], ["shop@okaxis"])
+        
+        # Another worker records the payee after this worker cached the user
+        with SessionLocal() as sync_db:
+            now = datetime.utcnow()
+            sync_db.add(KnownReceiver(
+                user_id=user_id, receiver_upi="shop@okaxis",
+                first_seen_at=now, last_seen_at=now, transaction_count=1
+            ))
+            sync_db.commit()
+        
+        async with session_factory() as db:
+            after = await index.is_known(db, user_id, "shop@okaxis")
+            after_batch = await index.known_pairs(db, [user_id, user_id], ["shop@okaxis", "other@okaxis"])
+        await engine.dispose()
+        return before, before_batch, after, after_batch
+    
+    before, before_batch, after, after_batch = asyncio.run(lookups())
+    
+    assert before is False and before_batch == set()
+    assert after is True
+    assert after_batch == {(user_id, "shop@okaxis")}
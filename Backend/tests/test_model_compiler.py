@@ -0,0 +1,82 @@
+"""Compiled logistic scorer vs scikit-learn, and batch vs single-row scoring"""
+import warnings
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.tree import DecisionTreeClassifier
+
+from fraud_detection import LoadedModel
+from model_compiler import (
+    compile_model, compile_model_file, compiled_model_path, from_artifact, load_compiled_model
+)
+
+# Fixed feature grid: amounts from 0 to 20,000 in steps of 25, day and night
+GRID_AMOUNTS = np.tile(np.arange(0, 20001, 25, dtype=float), 2)
+GRID_NIGHTS = np.repeat([0, 1], len(GRID_AMOUNTS) // 2)
+
+
+@pytest.fixture(scope="module")
+def sklearn_model():
+    """A LogisticRegression trained like create_ml_model.py, on fixed data"""
+    rng = np.random.default_rng(42)
+    amounts = rng.lognormal(7, 1.2, 4000)
+    nights = (rng.random(4000) < 0.2).astype(float)
+    fraud = (amounts > 8000) | ((nights == 1) & (amounts > 3000))
+    model = LogisticRegression(random_state=42, max_iter=1000)
+    model.fit(np.column_stack([amounts, nights]), fraud.astype(int))
+    return model
+
+
+@pytest.fixture(scope="module")
+def compiled_model(sklearn_model):
+    return from_artifact(compile_model(sklearn_model))
+
+
+def test_compiled_scores_equal_sklearn_on_grid(sklearn_model, compiled_model):
+    sklearn_scores = LoadedModel("sklearn", model=sklearn_model).predict_many(GRID_AMOUNTS, GRID_NIGHTS)
+    compiled_scores = LoadedModel("compiled", compiled=compiled_model).predict_many(GRID_AMOUNTS, GRID_NIGHTS)
+    
+    assert np.array_equal(compiled_scores, sklearn_scores)
+    # The grid spans the score range, not just one saturated end of it
+    assert len(set(sklearn_scores.tolist())) > 50
+    # The probabilities themselves agree to rounding error
+    expected = sklearn_model.predict_proba(np.column_stack([GRID_AMOUNTS, GRID_NIGHTS]))[:, 1]
+    actual = compiled_model.predict_proba(np.column_stack([GRID_AMOUNTS, GRID_NIGHTS.astype(float)]))
+    assert np.max(np.abs(expected - actual)) < 1e-12
+
+
+@pytest.mark.parametrize("kind", ["compiled", "sklearn"])
+def test_predict_many_matches_predict_one(kind, sklearn_model, compiled_model):
+    if kind == "compiled":
+        model = LoadedModel(kind, compiled=compiled_model)
+    else:
+        model = LoadedModel(kind, model=sklearn_model)
+    
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        single = [model.predict_one(a, n) for a, n in zip(GRID_AMOUNTS.tolist(), GRID_NIGHTS.tolist())]
+    batch = model.predict_many(GRID_AMOUNTS, GRID_NIGHTS)
+    
+    assert batch.tolist() == single
+
+
+def test_unsupported_model_is_not_compiled():
+    model = DecisionTreeClassifier(random_state=0).fit([[100.0, 0], [9000.0, 1]], [0, 1])
+    assert compile_model(model) is None
+
+
+def test_compiled_artifact_round_trip_and_staleness(tmp_path, sklearn_model):
+    model_path = str(tmp_path / "fraud_model.pkl")
+    joblib.dump(sklearn_model, model_path)
+    
+    assert compile_model_file(model_path) == compiled_model_path(model_path)
+    loaded = load_compiled_model(model_path)
+    assert loaded is not None
+    assert loaded.coef == sklearn_model.coef_[0].tolist()
+    
+    # Retraining replaces the model file: the old artifact must not be used
+    retrained = LogisticRegression(random_state=0, max_iter=1000).fit([[100.0, 0], [9000.0, 1]], [0, 1])
+    joblib.dump(retrained, model_path)
+    assert load_compiled_model(model_path) is None
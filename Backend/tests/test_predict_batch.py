@@ -0,0 +1,53 @@
+"""/predict/batch must return exactly what /predict returns for each item"""
+
+REPORTS = "/api/fraud-reports/fraud-reports/"
+
+
+def _report(client, headers, upi):
+    response = client.post(REPORTS, headers=headers, json={"reported_upi": upi, "reason": "Asked for OTP over a phone call"})
+    assert response.status_code == 201, response.text
+
+
+def test_batch_matches_single_predictions(client, register_user):
+    # Five reports push one UPI ID into "Reported UPI ID", two leave another at "has 2 report(s)"
+    for i in range(5):
+        _, reporter = register_user()
+        _report(client, reporter, "mule@ybl")
+        if i < 2:
+            _report(client, reporter, "suspect@ybl")
+    
+    # Four payments just now: the next one is the fifth within a minute
+    _, headers = register_user()
+    for amount in (300, 320, 280, 310):
+        response = client.post("/api/create", headers=headers, json={
+            "receiver_upi": "grocer@paytm", "receiver_name": "Grocer", "amount": amount, "category": "Food"
+        })
+        assert response.status_code == 201, response.text
+    
+    items = [
+        {"receiver_upi": "grocer@paytm", "receiver_name": "Grocer", "amount": 350, "is_night": False},
+        {"receiver_upi": "mule@ybl", "receiver_name": "Refund desk", "amount": 2500, "is_night": False},
+        {"receiver_upi": "suspect@ybl", "receiver_name": "Prize office", "amount": 800, "is_night": True},
+        {"receiver_upi": "newshop@okaxis", "receiver_name": "New shop", "amount": 12000, "is_night": False},
+        {"receiver_upi": "grocer@paytm", "receiver_name": "Grocer", "amount": 4000, "is_night": True},
+        {"receiver_upi": "mule@ybl", "receiver_name": "Refund desk", "amount": 90, "is_night": True},
+    ]
+    response = client.post("/api/predict/batch", headers=headers, json={"transactions": items})
+    assert response.status_code == 200, response.text
+    batch = response.json()
+    
+    single = []
+    for item in items:
+        response = client.post("/api/predict", headers=headers, json=item)
+        assert response.status_code == 200, response.text
+        single.append(response.json())
+    
+    assert batch == single
+    
+    # The comparison covered the report, velocity and receiver rules
+    reasons = [result["reasons"] for result in batch]
+    assert all("5 payments within a minute" in r for r in reasons)
+    assert "Reported UPI ID" in reasons[1] and "Reported UPI ID" in reasons[5]
+    assert "UPI ID has 2 report(s)" in reasons[2]
+    assert "New receiver" in reasons[3] and "New receiver" not in reasons[0]
+    assert "Unusual amount compared to your average spending" in reasons[4]
@@ -0,0 +1,62 @@
+"""
+Query-count budgets for the hot endpoints. The counts must not grow with a
+user's history, so each user gets a few dozen transactions first.
+"""
+import pytest
+
+from query_profiler import assert_max_queries
+
+HISTORY = 30
+
+
+@pytest.fixture
+def user_with_history(client, register_user):
+    _, headers = register_user()
+    for i in range(HISTORY):
+        response = client.post("/api/create", headers=headers, json={
+            "receiver_upi": f"payee{i % 5}@paytm", "receiver_name": "Payee", "amount": 200 + i,
+            "category": "Food" if i % 2 else "Shopping"
+        })
+        assert response.status_code == 201, response.text
+    return headers
+
+
+@pytest.mark.parametrize("receiver_upi, max_queries", [
+    # Stats read, three rollup upserts, known-receiver upsert, insert, refresh
+    ("payee1@paytm", 7),
+    # ...plus the known_receivers lookup that confirms a cache miss
+    ("firsttime@paytm", 8),
+])
+def test_create_queries(client, user_with_history, receiver_upi, max_queries):
+    with assert_max_queries(max_queries):
+        response = client.post("/api/create", headers=user_with_history, json={
+            "receiver_upi": receiver_upi, "receiver_name": "Payee", "amount": 450, "category": "Food"
+        })
+    assert response.status_code == 201, response.text
+
+
+def test_history_queries(client, user_with_history):
+    with assert_max_queries(1):
+        response = client.get("/api/?limit=10", headers=user_with_history)
+    assert response.status_code == 200 and len(response.json()) == 10
+    
+    with assert_max_queries(1):
+        response = client.get(f"/api/?limit=10&cursor={response.headers['X-Next-Cursor']}", headers=user_with_history)
+    assert response.status_code == 200 and len(response.json()) == 10
+
+
+@pytest.mark.parametrize("path, max_queries", [
+    # Cache version, then aggregates and rollups
+    ("/api/analytics/spending", 4),
+    ("/api/analytics/charts/category", 2),
+    ("/api/analytics/charts/monthly", 2),
+])
+def test_analytics_queries(client, user_with_history, path, max_queries):
+    with assert_max_queries(max_queries):
+        response = client.get(path, headers=user_with_history)
+    assert response.status_code == 200, response.text
+    
+    # Served from the analytics cache until the next transaction
+    with assert_max_queries(0):
+        response = client.get(path, headers=user_with_history)
+    assert response.status_code == 200, response.text
@@ -0,0 +1,291 @@
+"""
+Per-user sliding-window velocity features for the risk engine.
+
+For every user the store keeps time-bucketed counters over three windows:
+
+    1m  = 6 buckets of 10 seconds
+    1h  = 12 buckets of 5 minutes
+    24h = 24 buckets of 1 hour
+
+Each window tracks the transaction count, the amount sum and the distinct
+receivers, with running totals that are adjusted as buckets expire, so a
+snapshot costs a few dict lookups. Windows slide at bucket granularity.
+Memory per user is bounded: at most 42 buckets, each remembering at most
+VELOCITY_DISTINCT_CAP receivers (distinct counts saturate at that cap).
+Users are evicted LRU beyond VELOCITY_MAX_USERS.
+
+State is rebuilt from the last 24 hours of transactions at startup, and a
+user who was evicted is reloaded from the table on their next request.
+With VELOCITY_REFRESH_SECONDS > 0 a user's state is also reloaded when it
+is older than that, so payments made through other workers are counted.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import Transaction
+from spending_stats import in_batches
+
+VELOCITY_MAX_USERS = int(os.getenv("VELOCITY_MAX_USERS", "100000"))
+VELOCITY_DISTINCT_CAP = int(os.getenv("VELOCITY_DISTINCT_CAP", "50"))
+VELOCITY_REFRESH_SECONDS = int(os.getenv("VELOCITY_REFRESH_SECONDS", "0"))
+
+# (name, window seconds, buckets)
+WINDOWS = (("1m", 60, 6), ("1h", 3600, 12), ("24h", 86400, 24))
+HISTORY = timedelta(seconds=max(seconds for _, seconds, _ in WINDOWS))
+
+
+class VelocitySnapshot(NamedTuple):
+    """A user's activity in each window before the transaction being scored"""
+    count_1m: int = 0
+    count_1h: int = 0
+    count_24h: int = 0
+    amount_1m: float = 0.0
+    amount_1h: float = 0.0
+    amount_24h: float = 0.0
+    receivers_1m: int = 0
+    receivers_1h: int = 0
+    receivers_24h: int = 0
+
+
+EMPTY_SNAPSHOT = VelocitySnapshot()
+
+
+class _Window:
+    """Time-bucketed count, amount and distinct receivers over one window"""
+    
+    __slots__ = ("width", "size", "buckets", "oldest", "count", "amount", "receivers")
+    
+    def __init__(self, seconds: int, buckets: int):
+        self.width = seconds // buckets
+        self.size = buckets
+        # bucket index -> [count, amount, set of receivers]
+        self.buckets: Dict[int, list] = {}
+        self.oldest: Optional[int] = None
+        self.count = 0
+        self.amount = 0.0
+        # receiver -> number of live buckets that contain it
+        self.receivers: Dict[str, int] = {}
+    
+    def advance(self, index: int) -> None:
+        """Expire buckets that fall outside the window ending at bucket `index`"""
+        cutoff = index - self.size
+        if self.oldest is None or self.oldest > cutoff:
+            return
+        for expired in [i for i in self.buckets if i <= cutoff]:
+            count, amount, receivers = self.buckets.pop(expired)
+            self.count -= count
+            self.amount -= amount
+            for receiver in receivers:
+                remaining = self.receivers[receiver] - 1
+                if remaining:
+                    self.receivers[receiver] = remaining
+                else:
+                    del self.receivers[receiver]
+        self.oldest = min(self.buckets) if self.buckets else None
+        if not self.buckets:
+            # Reset float drift once the window is empty
+            self.amount = 0.0
+    
+    def add(self, index: int, receiver: str, amount: float, newest: int) -> None:
+        if index <= newest - self.size:
+            return  # already outside the window
+        bucket = self.buckets.get(index)
+        if bucket is None:
+            bucket = self.buckets[index] = [0, 0.0, set()]
+            if self.oldest is None or index < self.oldest:
+                self.oldest = index
+        bucket[0] += 1
+        bucket[1] += amount
+        self.count += 1
+        self.amount += amount
+        if receiver not in bucket[2] and len(bucket[2]) < VELOCITY_DISTINCT_CAP:
+            bucket[2].add(receiver)
+            self.receivers[receiver] = self.receivers.get(receiver, 0) + 1
+    
+    def distinct(self) -> int:
+        return min(len(self.receivers), VELOCITY_DISTINCT_CAP)
+
+
+class UserVelocity:
+    """All windows for one user"""
+    
+    __slots__ = ("windows", "newest", "loaded_at")
+    
+    def __init__(self):
+        self.windows = [_Window(seconds, buckets) for _, seconds, buckets in WINDOWS]
+        self.newest = 0.0
+        self.loaded_at = time.monotonic()
+    
+    def record(self, receiver_upi: str, amount: float, at: datetime) -> None:
+        seconds = at.timestamp()
+        self.newest = max(self.newest, seconds)
+        for window in self.windows:
+            newest_index = int(self.newest // window.width)
+            window.advance(newest_index)
+            window.add(int(seconds // window.width), receiver_upi, amount, newest_index)
+    
+    def snapshot(self, at: datetime) -> VelocitySnapshot:
+        seconds = max(at.timestamp(), self.newest)
+        for window in self.windows:
+            window.advance(int(seconds // window.width))
+        one_minute, one_hour, one_day = self.windows
+        return VelocitySnapshot(
+            one_minute.count, one_hour.count, one_day.count,
+            one_minute.amount, one_hour.amount, one_day.amount,
+            one_minute.distinct(), one_hour.distinct(), one_day.distinct()
+        )
+
+
+def build_user_velocity(rows: Iterable[Tuple[str, float, datetime]]) -> UserVelocity:
+    """Replay (receiver_upi, amount, timestamp) rows, oldest first"""
+    state = UserVelocity()
+    for receiver_upi, amount, timestamp in rows:
+        state.record(receiver_upi, amount, timestamp)
+    return state
+
+
+class VelocityStore:
+    def __init__(self, max_users: int = VELOCITY_MAX_USERS, refresh_seconds: int = VELOCITY_REFRESH_SECONDS):
+        self.max_users = max_users
+        self.refresh_seconds = refresh_seconds
+        self._users: "OrderedDict[int, UserVelocity]" = OrderedDict()
+        self._lock = threading.Lock()
+        # True while every user with recent activity is in memory (after rebuild, before any eviction)
+        self._complete = False
+    
+    def __len__(self) -> int:
+        return len(self._users)
+    
+    def _put(self, user_id: int, state: UserVelocity) -> None:
+        with self._lock:
+            self._users[user_id] = state
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+                self._complete = False
+    
+    def _cached(self, user_id: int) -> Optional[UserVelocity]:
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is not None:
+                self._users.move_to_end(user_id)
+            return state
+    
+    def _is_stale(self, state: UserVelocity) -> bool:
+        return self.refresh_seconds > 0 and time.monotonic() - state.loaded_at > self.refresh_seconds
+    
+    async def _load(self, db: AsyncSession, user_id: int, at: datetime) -> UserVelocity:
+        """Rebuild one user's state from their last 24 hours of transactions"""
+        result = await db.execute(
+            select(Transaction.receiver_upi, Transaction.amount, Transaction.timestamp)
+            .where(Transaction.user_id == user_id, Transaction.timestamp >= at - HISTORY)
+            .order_by(Transaction.timestamp, Transaction.id)
+        )
+        state = build_user_velocity(result.all())
+        self._put(user_id, state)
+        return state
+    
+    async def _get_state(self, db: AsyncSession, user_id: int, at: datetime) -> Optional[UserVelocity]:
+        state = self._cached(user_id)
+        if state is not None and not self._is_stale(state):
+            return state
+        if state is None and self._complete:
+            return None
+        return await self._load(db, user_id, at)
+    
+    async def get_snapshot(self, db: AsyncSession, user_id: int, at: Optional[datetime] = None) -> VelocitySnapshot:
+        """The user's activity in each window up to `at` (default now)"""
+        at = at or datetime.now()
+        state = await self._get_state(db, user_id, at)
+        if state is None:
+            return EMPTY_SNAPSHOT
+        with self._lock:
+            return state.snapshot(at)
+    
+    async def get_snapshots(
+        self, db: AsyncSession, user_ids: Sequence[int], at: Optional[datetime] = None
+    ) -> Dict[int, VelocitySnapshot]:
+        """Snapshots for many users at the same instant"""
+        at = at or datetime.now()
+        return {user_id: await self.get_snapshot(db, user_id, at) for user_id in set(user_ids)}
+    
+    def record(self, user_id: int, receiver_upi: str, amount: float, at: datetime) -> None:
+        """Add a committed transaction to the user's windows"""
+        state = self._cached(user_id)
+        if state is None:
+            if not self._complete:
+                # Evicted or never loaded: the next read reloads the user's
+                # windows from the DB, including this transaction
+                return
+            # No recent activity (the store holds every active user)
+            state = UserVelocity()
+            self._put(user_id, state)
+        with self._lock:
+            state.record(receiver_upi, amount, at)
+    
+    def rebuild(self, db: Session, now: Optional[datetime] = None) -> int:
+        """Rebuild every user's state from the last 24 hours of transactions"""
+        now = now or datetime.now()
+        rows = db.execute(
+            select(Transaction.user_id, Transaction.receiver_upi, Transaction.amount, Transaction.timestamp)
+            .where(Transaction.timestamp >= now - HISTORY)
+            .order_by(Transaction.timestamp, Transaction.id)
+        ).all()
+        
+        states: Dict[int, UserVelocity] = {}
+        for user_id, receiver_upi, amount, timestamp in rows:
+            state = states.get(user_id)
+            if state is None:
+                state = states[user_id] = UserVelocity()
+            state.record(receiver_upi, amount, timestamp)
+        
+        with self._lock:
+            self._users = OrderedDict(states)
+            self._complete = len(states) <= self.max_users
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        
+        return len(states)
+
+
+def load_history(
+    db: Session,
+    user_ids: Iterable[int],
+    since: datetime,
+    before_id: Optional[int] = None,
+    until: Optional[datetime] = None
+) -> Dict[int, UserVelocity]:
+    """
+    Sync helper for bulk jobs that replay history in order: each user's state
+    from their transactions at or after `since` (and with id < before_id, and
+    at or before `until`).
+    """
+    user_ids = set(user_ids)
+    states = {user_id: UserVelocity() for user_id in user_ids}
+    for batch in in_batches(user_ids):
+        query = select(
+            Transaction.user_id, Transaction.receiver_upi, Transaction.amount, Transaction.timestamp
+        ).where(
+            Transaction.user_id.in_(batch),
+            Transaction.timestamp >= since
+        ).order_by(Transaction.timestamp, Transaction.id)
+        if before_id is not None:
+            query = query.where(Transaction.id < before_id)
+        if until is not None:
+            query = query.where(Transaction.timestamp <= until)
+        
+        for user_id, receiver_upi, amount, timestamp in db.execute(query).all():
+            states[user_id].record(receiver_upi, amount, timestamp)
+    return states
+
+
+# Global instance
+velocity_store = VelocityStore()